@@ -0,0 +1,139 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from collections import OrderedDict
+from functools import wraps
+import threading
+
+
+_local = threading.local()
+
+
+class ContentChangeBatch(object):
+    """
+    Collects content change notifications, so that all content changes can
+    be processed at once. The same change for the same model instance is
+    only collected once.
+    """
+    def __init__(self):
+        self.depth = 0
+        self._changes = OrderedDict()
+        self._cms = None
+
+
+    @property
+    def changes(self):
+        """
+        Return the list of all content changes collected so far, where each
+        change is a tuple of sender, delete flag and instance.
+        """
+        return self._changes.values()
+
+
+    @property
+    def cms(self):
+        """
+        Return the cms instance that is used for all notifications within
+        this batch.
+        """
+        if self._cms is None:
+            from cubane.cms.views import get_cms
+            self._cms = get_cms()
+        return self._cms
+
+
+    def add(self, sender, delete=False, instance=None):
+        """
+        Collect the given content change.
+        """
+        if instance is not None and instance.pk is not None:
+            key = (sender, delete, instance.pk)
+        else:
+            key = (sender, delete, id(instance))
+        self._changes[key] = (sender, delete, instance)
+
+
+    def process(self):
+        """
+        Process all collected content changes at once.
+        """
+        changes = self.changes
+        self._changes = OrderedDict()
+        if changes:
+            self.cms.on_content_changed(changes)
+
+
+def get_content_change_batch():
+    """
+    Return the content change batch for the current thread or None.
+    """
+    return getattr(_local, 'batch', None)
+
+
+def begin_content_change_batch():
+    """
+    Start collecting content change notifications for the current thread.
+    Batches can be nested, in which case all notifications are processed
+    when the outermost batch ends.
+    """
+    batch = get_content_change_batch()
+    if batch is None:
+        batch = ContentChangeBatch()
+        _local.batch = batch
+    batch.depth += 1
+    return batch
+
+
+def end_content_change_batch():
+    """
+    End the current batch. If this is the outermost batch, all content
+    change notifications collected so far are processed at once.
+    """
+    batch = get_content_change_batch()
+    if batch is None:
+        return
+
+    batch.depth -= 1
+    if batch.depth <= 0:
+        _local.batch = None
+        batch.process()
+
+
+class content_change_batch(object):
+    """
+    Context manager (or decorator) that collects all content change
+    notifications, for example when saving many model instances, and
+    processes them once at the end, for example:
+
+    with content_change_batch():
+        for page in pages:
+            page.save()
+    """
+    def __enter__(self):
+        return begin_content_change_batch()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_content_change_batch()
+
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return inner
+
+
+def notify_content_changed(sender, bases, delete=False, instance=None):
+    """
+    Notify the cms that the given instance has been changed or deleted.
+    Within a batch, the same cms instance is used for all notifications.
+    """
+    batch = get_content_change_batch()
+    if batch is not None:
+        cms = batch.cms
+    else:
+        from cubane.cms.views import get_cms
+        cms = get_cms()
+
+    cms.notify_content_changed(sender, bases, delete=delete, instance=instance)
@@ -9,12 +9,47 @@ from cubane.lib.file import file_get_mtime
 from cubane.lib.file import file_move
 from cubane.lib import verbose as cubane_verbose
 from cubane.lib.libjson import decode_json, to_json
-from htmlmin.minify import html_minify
+from cubane.lib.minify import html_minify_stream
 import os
 import codecs
+import shutil
+import tempfile
 import time
 import datetime
 import hashlib
+import gzip
+
+
+def get_cache_dependency_key(model, pk=None):
+    """
+    Return the key that identifies a dependency of cached content on the given
+    model instance with the given primary key. If no primary key is given,
+    the key identifies a dependency on any instance of the given model, for
+    example because content presents a list of such instances.
+    """
+    opts = model._meta.concrete_model._meta
+    key = '%s.%s' % (opts.app_label, opts.model_name)
+    if pk is not None:
+        key = '%s:%s' % (key, pk)
+    return key
+
+
+def get_model_from_cache_dependency_key(key):
+    """
+    Return a tuple of the model and the primary key (or None) that is
+    identified by the given dependency key. If the model does not exist
+    (anymore), (None, None) is returned.
+    """
+    from django.apps import apps
+
+    name, _, pk = key.partition(':')
+    try:
+        app_label, model_name = name.split('.', 1)
+        model = apps.get_model(app_label, model_name)
+    except (ValueError, LookupError):
+        return (None, None)
+
+    return (model, pk if pk else None)
 
 
 class CacheContext(object):
@@ -46,14 +81,46 @@ class Cache(object):
     CMS content cache system. Files are generated to disk when publishing
     content in order to increase request throughput.
     """
-    INDEX_FILENAME     = '.cache'
+    INDEX_FILENAME            = '.cache'
+    DEPENDENCY_INDEX_FILENAME = '.cache-deps'
+    DIGEST_INDEX_FILENAME     = '.cache-digests'
+    SOURCE_INDEX_FILENAME     = '.cache-sources'
+    INVALIDATED_FILENAME      = '.cache-invalidated'
+    JOURNAL_FILENAME          = '.cache-journal'
+    PUBLISH_JOURNAL_FILENAME  = '.cache-journal-publish'
     RESERVED_FILENAMES = [
-        INDEX_FILENAME
+        INDEX_FILENAME,
+        DEPENDENCY_INDEX_FILENAME,
+        DIGEST_INDEX_FILENAME,
+        SOURCE_INDEX_FILENAME,
+        INVALIDATED_FILENAME,
+        JOURNAL_FILENAME,
+        PUBLISH_JOURNAL_FILENAME
     ]
+    ANY_DEPENDENCY = '*'
+    CHUNK_SIZE = 64 * 1024
+    FILE_MODE = 0o666
+    COMPRESSION_EXTENSIONS = {
+        'gzip': '.gz',
+        'br': '.br'
+    }
 
 
     def __init__(self):
-        self.filenames = []
+        self._previous_digests = None
+        self.reset()
+
+
+    def reset(self):
+        """
+        Reset the state of this cache instance, so that it no longer knows
+        about any files that have been added to the cache.
+        """
+        self.filenames = set()
+        self.dependencies = {}
+        self.digests = {}
+        self.sources = {}
+        self.changed_filenames = set()
         self._size = 0
 
 
@@ -75,6 +142,57 @@ class Cache(object):
         return os.path.join(settings.CACHE_ROOT, self.INDEX_FILENAME)
 
 
+    @property
+    def dependency_index_filename(self):
+        """
+        Return the full path to the cache dependency index file.
+        """
+        return os.path.join(settings.CACHE_ROOT, self.DEPENDENCY_INDEX_FILENAME)
+
+
+    @property
+    def digest_index_filename(self):
+        """
+        Return the full path to the cache digest index file.
+        """
+        return os.path.join(settings.CACHE_ROOT, self.DIGEST_INDEX_FILENAME)
+
+
+    @property
+    def source_index_filename(self):
+        """
+        Return the full path to the cache source index file.
+        """
+        return os.path.join(settings.CACHE_ROOT, self.SOURCE_INDEX_FILENAME)
+
+
+    @property
+    def journal_filename(self):
+        """
+        Return the full path to the journal file, which records changed
+        entities since content has been published the last time.
+        """
+        return os.path.join(settings.CACHE_ROOT, self.JOURNAL_FILENAME)
+
+
+    @property
+    def publish_journal_filename(self):
+        """
+        Return the full path to the journal file that is consumed by the
+        publish process that is currently running.
+        """
+        return os.path.join(settings.CACHE_ROOT, self.PUBLISH_JOURNAL_FILENAME)
+
+
+    @property
+    def invalidated_filename(self):
+        """
+        Return the full path to the file that indicates that parts of the
+        cache have been invalidated.
+        """
+        return os.path.join(settings.CACHE_ROOT, self.INVALIDATED_FILENAME)
+
+
     @property
     def size(self):
         """
@@ -131,40 +249,305 @@ class Cache(object):
         CMS system has no content published.
         """
         self._remove_file(self.index_filename)
+        self._remove_file(self.dependency_index_filename)
+        self._remove_file(self.invalidated_filename)
+
+
+    def set_dependency_index(self, filenames, dependencies):
+        """
+        Generate cache dependency index file which maps dependency keys to the
+        list of cached content files that depend on the entity identified by
+        the key. Cached files for which we do not know any dependencies are
+        listed under the key ANY_DEPENDENCY.
+        """
+        index = {}
+        for filename in filenames:
+            keys = dependencies.get(filename)
+            if not keys:
+                keys = [self.ANY_DEPENDENCY]
+
+            for key in keys:
+                index.setdefault(key, []).append(filename)
+
+        try:
+            file_put_contents(self.dependency_index_filename, to_json(index))
+        except:
+            pass
+
+
+    def get_dependency_index(self):
+        """
+        Read cache dependency index file (if exists) and return a dictionary
+        mapping dependency keys to cached content filenames. If no dependency
+        index file exists, return None.
+        """
+        try:
+            return decode_json(file_get_contents(self.dependency_index_filename))
+        except:
+            return None
+
+
+    def set_digest_index(self, digests):
+        """
+        Generate cache digest index file which maps cache filenames to the
+        digest of the content of the file and the last mod. timestamp of the
+        content (in seconds since the epoch).
+        """
+        try:
+            file_put_contents(self.digest_index_filename, to_json(digests))
+        except:
+            pass
+
+
+    def get_digest_index(self):
+        """
+        Read cache digest index file (if exists) and return a dictionary
+        mapping cache filenames to the digest of their content and the last
+        mod. timestamp of the content. If no digest index file exists, return
+        the empty dictionary.
+        """
+        try:
+            return decode_json(file_get_contents(self.digest_index_filename))
+        except:
+            return {}
+
+
+    def get_previous_digest(self, filename):
+        """
+        Return the digest of the content of the given cache filename at the
+        time the content was published the last time or None.
+        """
+        return self._get_previous_digest_entry(filename)[0]
+
+
+    def get_previous_mtime(self, filename):
+        """
+        Return the last mod. timestamp of the content of the given cache
+        filename at the time the content was published the last time or None.
+        The cached file itself may be older if its content did not change.
+        """
+        t = self._get_previous_digest_entry(filename)[1]
+        return datetime.datetime.fromtimestamp(t) if t is not None else None
+
+
+    def _get_previous_digest_entry(self, filename):
+        """
+        Return a tuple of the digest and the last mod. timestamp (in seconds
+        since the epoch) of the given cache filename as recorded by the digest
+        index. Older digest indices only recorded the digest.
+        """
+        if self._previous_digests is None:
+            self._previous_digests = self.get_digest_index()
+
+        entry = self._previous_digests.get(filename)
+        if isinstance(entry, list) and len(entry) == 2:
+            return entry[0], entry[1]
+        else:
+            return entry, None
+
+
+    def get_digest(self, data):
+        """
+        Return the digest of the given content (bytes).
+        """
+        return hashlib.sha1(data).hexdigest()
+
+
+    def get_chunks(self, content):
+        """
+        Yield the given content (unicode or bytes) as a sequence of chunks.
+        """
+        for i in range(0, len(content), self.CHUNK_SIZE):
+            yield content[i:i + self.CHUNK_SIZE]
+
+
+    def get_content_chunks(self, content):
+        """
+        Yield the given content (unicode or utf-8 encoded bytes) as a sequence
+        of unicode chunks.
+        """
+        if isinstance(content, unicode):
+            for chunk in self.get_chunks(content):
+                yield chunk
+        else:
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            for chunk in self.get_chunks(content):
+                yield decoder.decode(chunk)
+            yield decoder.decode(b'', final=True)
+
+
+    def set_source_index(self, sources):
+        """
+        Generate cache source index file which maps cache filenames to the
+        publish job that produced the file, so that individual files can be
+        generated again without publishing all content.
+        """
+        try:
+            file_put_contents(self.source_index_filename, to_json(sources))
+        except:
+            pass
+
+
+    def get_source_index(self):
+        """
+        Read cache source index file (if exists) and return a dictionary
+        mapping cache filenames to the publish job that produced the file. If
+        no source index file exists, return the empty dictionary.
+        """
+        try:
+            return decode_json(file_get_contents(self.source_index_filename))
+        except:
+            return {}
+
+
+    def set_source(self, filename, source):
+        """
+        Declare that the given cache filename has been produced by the given
+        publish job.
+        """
+        self.sources[filename] = list(source)
+
+
+    def add_to_journal(self, keys):
+        """
+        Record that the entities that are identified by the given list of
+        dependency keys have been changed, so that an incremental publish
+        can generate affected content. ANY_DEPENDENCY represents a change
+        that affects all content.
+        """
+        try:
+            with codecs.open(self.journal_filename, 'a', 'utf-8') as f:
+                f.write(''.join(['%s\n' % key for key in keys]))
+        except:
+            pass
+
+
+    def begin_journal(self):
+        """
+        Start consuming the journal of changed entities for publishing and
+        return the set of dependency keys that have been recorded. Any change
+        that is recorded while publishing is kept for the next publish.
+        Changes that have been consumed by a publish process that did not
+        complete are returned again.
+        """
+        if os.path.isfile(self.journal_filename):
+            try:
+                if os.path.isfile(self.publish_journal_filename):
+                    with codecs.open(self.publish_journal_filename, 'a', 'utf-8') as f:
+                        f.write(file_get_contents(self.journal_filename))
+                    self._remove_file(self.journal_filename)
+                else:
+                    file_move(self.journal_filename, self.publish_journal_filename)
+            except:
+                pass
+
+        try:
+            with codecs.open(self.publish_journal_filename, 'r', 'utf-8') as f:
+                return set(filter(None, [s.strip() for s in f.readlines()]))
+        except:
+            return set()
+
+
+    def end_journal(self):
+        """
+        Discard the journal of changed entities that has been consumed by
+        publishing content successfully.
+        """
+        self._remove_file(self.publish_journal_filename)
+
+
+    def set_dependencies(self, filename, keys):
+        """
+        Declare that the given cache filename depends on the entities that are
+        identified by the given list of dependency keys.
+        """
+        self.dependencies[filename] = set(keys)
 
 
     def get_mtime(self, filename):
         """
         Return the last mod. timestamp of the given file. The given file may
         not exist because the cache has been invalidated. In this case the file
-        may have been renamed to .filename.
+        may have been renamed to .filename. If the file was kept because its
+        content did not change, the last mod. timestamp of the content as
+        recorded by the digest index is returned, which might be newer.
         """
         fullpath = os.path.join(settings.CACHE_ROOT, filename)
 
         if os.path.isfile(fullpath):
-            return file_get_mtime(fullpath)
+            mtime = file_get_mtime(fullpath)
         else:
             invalidated_filename = self._get_invalidated_cache_filename(fullpath)
             if os.path.isfile(invalidated_filename):
-                return file_get_mtime(invalidated_filename)
+                mtime = file_get_mtime(invalidated_filename)
+            else:
+                return None
+
+        previous_mtime = self.get_previous_mtime(filename)
+        if previous_mtime is not None and previous_mtime > mtime:
+            mtime = previous_mtime
+        return mtime
 
 
     def publish_required(self):
         """
         Return True, if a publish is required that is when no cache index file
-        is present.
+        is present or parts of the cache have been invalidated.
         """
-        return not os.path.isfile(self.index_filename)
+        return (
+            not os.path.isfile(self.index_filename) or
+            os.path.isfile(self.invalidated_filename)
+        )
 
 
     def invalidate(self, verbose=False):
-        # get list of files published previously
-        cache = self.get_index()
+        # invalidate all files published previously, so that we keep the
+        # generated content but such pages are no longer cached as such.
+        n = self._invalidate_files(self.get_index(), verbose)
+
+        # delete cache index
+        self.clear_index()
+
+        return n
+
+
+    def invalidate_dependencies(self, keys, verbose=False):
+        """
+        Invalidate all cached files that depend on any of the entities that
+        are identified by the given list of dependency keys. Cached files for
+        which we do not know their dependencies are always invalidated. If
+        no dependency information is available, the entire cache is
+        invalidated.
+        """
+        index = self.get_dependency_index()
+        if index is None:
+            return self.invalidate(verbose)
+
+        # collect files that depend on any given key
+        filenames = set(index.get(self.ANY_DEPENDENCY, []))
+        for key in keys:
+            filenames.update(index.get(key, []))
 
-        # invalidate all files, so that we keep the generated content
-        # but such pages are no longer cached as such.
+        n = self._invalidate_files(
+            self.get_filenames_with_compressed(filenames),
+            verbose
+        )
+
+        # mark cache as (partially) invalidated, so that we know that we
+        # need to publish again
+        if n > 0:
+            file_put_contents(self.invalidated_filename, '')
+
+        return n
+
+
+    def _invalidate_files(self, filenames, verbose=False):
+        """
+        Invalidate the given list of cached files by renaming them to their
+        invalidated version and return the number of files invalidated.
+        """
         n = 0
-        for filename in cache:
+        for filename in filenames:
             path = os.path.join(settings.CACHE_ROOT, filename)
             if os.path.isfile(path):
                 new_path = self._get_invalidated_cache_filename(path)
@@ -172,14 +555,22 @@ class Cache(object):
                 file_move(path, new_path)
                 cubane_verbose.out('%-70s' % path, verbose=verbose)
 
-                n += 1
-
-        # delete cache index
-        self.clear_index()
+                # pre-compressed versions do not count as individual files
+                if not self._is_compressed_filename(filename):
+                    n += 1
 
         return n
 
 
+    def _is_compressed_filename(self, filename):
+        """
+        Return True, if the given filename refers to a pre-compressed version
+        of a cache file.
+        """
+        _, ext = os.path.splitext(filename)
+        return ext in self.COMPRESSION_EXTENSIONS.values()
+
+
     def clear(self, verbose=False):
         """
         Clear cache entirely and remove all cached content files.
@@ -189,6 +580,11 @@ class Cache(object):
 
         # delete meta data
         self.clear_index()
+        self._remove_file(self.digest_index_filename)
+        self._remove_file(self.source_index_filename)
+        self._remove_file(self.journal_filename)
+        self._remove_file(self.publish_journal_filename)
+        self._previous_digests = None
 
         return n
 
@@ -200,7 +596,10 @@ class Cache(object):
         actually written to the cache system; however the meta data is generated
         as usual. If the content did not change we might still have to restore
         the corresponding cache file which might have been renamed during
-        cache invalidation.
+        cache invalidation. Even if the last mod. timestamp did change, the
+        content is not written if it is identical to the content that was
+        published previously, in which case the cached file (and its last
+        mod. timestamp) is left untouched.
         """
         # if no timestamp is given, assume current time
         if mtime is None:
@@ -215,18 +614,33 @@ class Cache(object):
             changed = mtime != current_mtime
 
         if changed:
-            # generate new content
-            self._add(fullpath, mtime, content, minify_html)
-
-            # remove invalidated cache file version
-            self._remove_file(invalidated_path)
+            # write new content to a temporary file first. If the content is
+            # identical to the content we published previously, we simply
+            # keep the cached content file
+            temp_path, digest = self._write_temp_file(fullpath, content, minify_html)
+            if digest == self.get_previous_digest(filename) and self._restore(fullpath, current_mtime):
+                # keep file, but remember the new timestamp of its content
+                self._remove_file(temp_path)
+                changed = False
+            else:
+                # replace content
+                self._add(fullpath, mtime, temp_path)
+                self.changed_filenames.add(filename)
+
+                # remove invalidated cache file version
+                self._remove_file(invalidated_path)
+                for path in self.get_compressed_filenames(fullpath):
+                    self._remove_file(self._get_invalidated_cache_filename(path))
         else:
-            # move cached content file back into place
-            if os.path.isfile(invalidated_path) and not os.path.isfile(fullpath):
-                file_move(invalidated_path, fullpath)
+            digest = self.get_previous_digest(filename)
+            if current_mtime:
+                mtime = current_mtime
+            self._restore(fullpath, mtime)
 
         # add filename to index
-        self.filenames.append(filename)
+        self.filenames.add(filename)
+        if digest:
+            self.digests[filename] = [digest, int(time.mktime(mtime.timetuple()))]
 
         # contribute to total size
         size = os.path.getsize(fullpath)
@@ -234,41 +648,293 @@ class Cache(object):
         return size, changed
 
 
-    def _add(self, fullpath, mtime, content, minify_html=True):
+    def get_state(self):
         """
-        Add given content to the cache and store the content as the given
-        full path.
+        Return the state of this cache instance describing all files that
+        have been added to the cache, which can be merged into another cache
+        instance via merge().
+        """
+        return {
+            'filenames': self.filenames,
+            'size': self._size,
+            'dependencies': self.dependencies,
+            'digests': self.digests,
+            'sources': self.sources,
+            'changed_filenames': self.changed_filenames
+        }
+
+
+    def merge(self, state):
+        """
+        Merge the given cache state as returned by get_state() into this
+        cache, for example as a result of another process generating cache
+        content.
+        """
+        self.filenames.update(state.get('filenames', []))
+        self._size += state.get('size', 0)
+        self.dependencies.update(state.get('dependencies', {}))
+        self.digests.update(state.get('digests', {}))
+        self.sources.update(state.get('sources', {}))
+        self.changed_filenames.update(state.get('changed_filenames', []))
+
+
+    def restore_state(self, exclude=[]):
+        """
+        Restore the state of this cache instance from the content that has
+        been published previously, except for the given list of cache
+        filenames and files that no longer exist, for example because they
+        have been invalidated.
+        """
+        exclude = set(exclude)
+        digests = self.get_digest_index()
+        sources = self.get_source_index()
+
+        for filename in self.get_index():
+            if filename in exclude or self._is_compressed_filename(filename):
+                continue
+
+            fullpath = os.path.join(settings.CACHE_ROOT, filename)
+            if not os.path.isfile(fullpath):
+                continue
+
+            self.filenames.add(filename)
+            self._size += os.path.getsize(fullpath)
+            if filename in digests:
+                self.digests[filename] = digests[filename]
+            if filename in sources:
+                self.sources[filename] = sources[filename]
+
+        index = self.get_dependency_index()
+        if index:
+            for key, filenames in index.items():
+                if key == self.ANY_DEPENDENCY:
+                    continue
+
+                for filename in filenames:
+                    if filename in self.filenames:
+                        self.dependencies.setdefault(filename, set()).add(key)
+
+
+    def _get_temp_file(self, fullpath):
+        """
+        Create a new temporary file within the same folder as the given cache
+        file, so that the temporary file can be renamed to the cache file
+        atomically. Return a tuple of the file object and the filename.
         """
         # create intermediate folders if required
         path = os.path.dirname(fullpath)
         if not os.path.exists(path):
             os.makedirs(path)
 
-        # minify content
-        if minify_html:
-            try:
-                content = html_minify(content)
+        fd, temp_path = tempfile.mkstemp(
+            prefix='.%s.' % os.path.basename(fullpath),
+            suffix='.tmp',
+            dir=path
+        )
+
+        # temporary files are only accessible by the owner, but cached files
+        # are served by the web server
+        os.chmod(temp_path, self.FILE_MODE & ~self._get_umask())
+
+        return os.fdopen(fd, 'wb'), temp_path
+
+
+    def _get_umask(self):
+        """
+        Return the file mode creation mask of the current process.
+        """
+        umask = os.umask(0)
+        os.umask(umask)
+        return umask
+
+
+    def _write_temp_file(self, fullpath, content, minify_html=True):
+        """
+        Write the given content (minified) chunk by chunk to a new temporary
+        file for the given cache file and return a tuple of the temporary
+        filename and the digest of the content that has been written.
+        """
+        f, temp_path = self._get_temp_file(fullpath)
+        try:
+            with f:
+                digest = None
+                if minify_html:
+                    try:
+                        digest = self._write_chunks(
+                            f,
+                            html_minify_stream(self.get_content_chunks(content))
+                        )
+                    except:
+                        # write content as it is
+                        f.seek(0)
+                        f.truncate()
+
+                if digest is None:
+                    digest = self._write_chunks(f, self.get_chunks(content))
+        except:
+            self._remove_file(temp_path)
+            raise
+
+        return temp_path, digest
+
+
+    def _write_chunks(self, f, chunks):
+        """
+        Write the given sequence of chunks to the given file (unicode is
+        encoded as utf-8) and return the digest of the content that has been
+        written.
+        """
+        h = hashlib.sha1()
+        for chunk in chunks:
+            data = chunk.encode('utf-8') if isinstance(chunk, unicode) else chunk
+            h.update(data)
+            f.write(data)
+        return h.hexdigest()
+
+
+    def _add(self, fullpath, mtime, temp_path):
+        """
+        Add the content of the given temporary file to the cache by renaming
+        the temporary file to the given full path. Renaming is atomic, so
+        that the web server never serves partially written content.
+        """
+        try:
+            # update file's modification time to the given one
+            file_set_mtime(temp_path, mtime)
+            os.rename(temp_path, fullpath)
+        except:
+            self._remove_file(temp_path)
+            raise
 
-                # Fix for Source Element
-                # W3 Spec: "The source element is a void element. A source element must have a start tag but must not have an end tag."
-                # https://github.com/cobrateam/django-htmlmin/issues/37
-                content = content.replace('</source>', '')
+        # pre-compressed versions
+        self._compress(fullpath, mtime)
+
+
+    def get_compressed_filenames(self, filename):
+        """
+        Return a list of filenames for all pre-compressed versions of the
+        given cache filename according to settings.CACHE_COMPRESSION, for
+        example index.html.gz.
+        """
+        return [
+            filename + self.COMPRESSION_EXTENSIONS[encoding]
+            for encoding
+            in settings.CACHE_COMPRESSION
+        ]
+
+
+    def get_filenames_with_compressed(self, filenames):
+        """
+        Return a list of the given cache filenames including the filenames of
+        all pre-compressed versions.
+        """
+        result = []
+        for filename in filenames:
+            result.append(filename)
+            result.extend(self.get_compressed_filenames(filename))
+        return result
+
+
+    def _compress(self, fullpath, mtime):
+        """
+        Write pre-compressed versions of the given cache file next to it
+        according to settings.CACHE_COMPRESSION, so that the web server can
+        serve compressed content without having to compress content on every
+        request. All versions share the same last modification timestamp.
+        """
+        if not settings.CACHE_COMPRESSION:
+            return
+
+        for encoding in settings.CACHE_COMPRESSION:
+            path = fullpath + self.COMPRESSION_EXTENSIONS[encoding]
+
+            if encoding == 'br':
+                try:
+                    import brotli
+                except ImportError:
+                    raise ValueError(
+                        'Brotli compression for the cache system requires ' +
+                        'the \'brotli\' package to be installed.'
+                    )
+
+            f, temp_path = self._get_temp_file(path)
+            try:
+                with f, open(fullpath, 'rb') as src:
+                    if encoding == 'gzip':
+                        gz = gzip.GzipFile(
+                            filename='',
+                            mode='wb',
+                            compresslevel=9,
+                            fileobj=f,
+                            mtime=time.mktime(mtime.timetuple())
+                        )
+                        try:
+                            shutil.copyfileobj(src, gz, self.CHUNK_SIZE)
+                        finally:
+                            gz.close()
+                    elif encoding == 'br':
+                        compressor = brotli.Compressor()
+                        for data in iter(lambda: src.read(self.CHUNK_SIZE), b''):
+                            f.write(compressor.process(data))
+                        f.write(compressor.finish())
+
+                file_set_mtime(temp_path, mtime)
+                os.rename(temp_path, path)
             except:
-                pass
+                self._remove_file(temp_path)
+                raise
+
+
+    def _restore(self, fullpath, mtime):
+        """
+        Move the invalidated version of the given cache file and its
+        pre-compressed versions back into place, generating missing
+        pre-compressed versions with the given last mod. timestamp. Return
+        True, if the cache file exists.
+        """
+        invalidated_path = self._get_invalidated_cache_filename(fullpath)
+        if os.path.isfile(invalidated_path) and not os.path.isfile(fullpath):
+            file_move(invalidated_path, fullpath)
 
-        # write content
-        with codecs.open(fullpath, 'w', 'utf-8') as f:
-            f.write(content)
+        if self._restore_compressed(fullpath):
+            self._compress(fullpath, mtime)
 
-        # update file's modification time to the given one
-        file_set_mtime(fullpath, mtime)
+        return os.path.isfile(fullpath)
+
+
+    def _restore_compressed(self, fullpath):
+        """
+        Move any invalidated pre-compressed versions of the given cache file
+        back into place. Return True, if any pre-compressed version is
+        missing and needs to be generated.
+        """
+        missing = False
+        for path in self.get_compressed_filenames(fullpath):
+            invalidated_path = self._get_invalidated_cache_filename(path)
+            if os.path.isfile(invalidated_path) and not os.path.isfile(path):
+                file_move(invalidated_path, path)
+
+            if not os.path.isfile(path):
+                missing = True
+
+        return missing and os.path.isfile(fullpath)
 
 
     def write(self):
         """
         Write cache index file for all files that have been added to the cache.
         """
-        self.set_index(self.filenames)
+        self.set_index(self.get_filenames_with_compressed(self.filenames))
+        self.set_dependency_index(self.filenames, self.dependencies)
+        self.set_digest_index(self.digests)
+        self.set_source_index(dict([
+            (filename, source)
+            for filename, source
+            in self.sources.items()
+            if filename in self.filenames
+        ]))
+        self._remove_file(self.invalidated_filename)
+        self._previous_digests = None
 
 
     def cleanup(self):
@@ -276,39 +942,49 @@ class Cache(object):
         Scan the cache folder and delete any files and empty folders that are
         not suppose to be in the cache according to the cache index.
         """
-        return self._cleanup(self.filenames)
+        return self._cleanup(self.get_filenames_with_compressed(self.filenames))
 
 
     def _cleanup(self, exclude=[]):
         """
         Scan the cache folder and delete any files and empty folders unless
-        a file is present within the given list of excluded files.
+        a file is present within the given list of excluded files. The cache
+        folder is scanned bottom-up once, so that folders that became empty
+        are removed as we go.
         """
-        # remove deprecated files not in the index
+        if not isinstance(exclude, (set, frozenset)):
+            exclude = set(exclude)
+
         n = 0
-        for root, _, filenames in os.walk(settings.CACHE_ROOT):
+        removed_folders = set()
+        for root, folders, filenames in os.walk(settings.CACHE_ROOT, topdown=False):
+            relroot = os.path.relpath(root, settings.CACHE_ROOT)
+            if relroot == '.':
+                relroot = ''
+
+            # remove deprecated files not in the index
+            remaining = 0
             for filename in filenames:
                 if filename in self.RESERVED_FILENAMES:
+                    remaining += 1
                     continue
 
-                fullpath = os.path.join(root, filename)
-                relpath = fullpath.replace(settings.CACHE_ROOT, '')
-                if relpath.startswith('/'):
-                    relpath = relpath[1:]
+                relpath = os.path.join(relroot, filename)
                 if relpath not in exclude:
-                    os.remove(fullpath)
+                    os.remove(os.path.join(root, filename))
                     n += 1
-
-        # remove any empty folders
-        empty_folder_found = True
-        while empty_folder_found:
-            empty_folder_found = False
-            for root, folders, _ in os.walk(settings.CACHE_ROOT):
-                for folder in folders:
-                    path = os.path.join(root, folder)
-                    if len(os.listdir(path)) == 0:
-                        os.rmdir(path)
-                        empty_folder_found = True
+                else:
+                    remaining += 1
+
+            # sub-folders that have not been removed already
+            for folder in folders:
+                if os.path.join(root, folder) not in removed_folders:
+                    remaining += 1
+
+            # remove empty folder (but never the cache folder itself)
+            if remaining == 0 and relroot:
+                os.rmdir(root)
+                removed_folders.add(root)
 
         return n
 
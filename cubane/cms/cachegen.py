@@ -3,13 +3,19 @@ from __future__ import unicode_literals
 from django.conf import settings
 from django.http import HttpResponse, Http404
 from django.urls import resolve
-from django.db.models import QuerySet
+from django.db import connections
+from django.db.models import Model, QuerySet
+from cubane.cms import get_page_model
+from cubane.cms.cache import Cache
+from cubane.cms.cache import get_cache_dependency_key
+from cubane.cms.cache import get_model_from_cache_dependency_key
 from cubane.lib.excerpt import excerpt_from_text
 from cubane.lib.file import sizeof_fmt
 from cubane.lib.filelock import FileLock
 from cubane.lib.verbose import out
 from cubane.lib.url import get_filepath_from_url
 from datetime import datetime
+import multiprocessing
 import time
 import os
 
@@ -17,6 +23,46 @@ import os
 MAX_ITERATION_STEPS = 10
 
 
+# interval in seconds in which we check whether a parallel publish got
+# terminated by another process
+PUBLISH_TERMINATE_CHECK_INTERVAL = 0.25
+
+
+# cache generator that is used by a publish worker process
+_WORKER_GENERATOR = None
+
+
+def _init_publish_worker():
+    """
+    Initialise a publish worker process by creating a cache generator that is
+    used by the worker process for the lifetime of the process. Workers do not
+    use the termination lock, since they would exclude each other; instead
+    the parent process watches the termination lock and terminates the pool
+    as soon as another process attempts to invalidate, clear or re-generate
+    the cache.
+    """
+    global _WORKER_GENERATOR
+
+    from cubane.cms.views import get_cms
+    generator = get_cms().get_cache_generator()
+    generator.terminate_lock = None
+    generator.quit = False
+    _WORKER_GENERATOR = generator
+
+
+def _publish_worker(args):
+    """
+    Process a single publish job within a worker process and return the state
+    of the cache describing all cache files that have been generated as a
+    result.
+    """
+    job, verbose = args
+    generator = _WORKER_GENERATOR
+    generator.cache.reset()
+    generator.process_publish_job(job, verbose)
+    return generator.cache.get_state()
+
+
 class CacheGenerator(object):
     """
     Uses the CMS and the cache system in order to generate a cached version
@@ -76,12 +122,24 @@ class CacheGenerator(object):
         # if we are rending for the cache system, materialise all querysets
         # in the template context, so that we can scan for last modification
         # timestamps of entities that are involved in rendering
-        self.materialise_template_context(template_context)
+        collection_models = []
+        self.materialise_template_context(template_context, collection_models=collection_models)
         new_mtime = self.get_updated_on_from_template_context(
             template_context,
             updated_on
         )
 
+        # remember the entities the cached resource depends on, so that we
+        # only need to invalidate the resource if any of them change
+        if filepath:
+            self.cache.set_dependencies(
+                filepath,
+                self.get_dependencies_from_template_context(
+                    template_context,
+                    collection_models
+                )
+            )
+
         # determine current last-mod. time of current cached resource
         mtime = self.cache.get_mtime(filepath)
 
@@ -115,14 +173,19 @@ class CacheGenerator(object):
         return self._process_page_for_cache(filepath=filepath, url=url_name, args=args, verbose=verbose)
 
 
-    def publish(self, verbose=False):
+    def publish(self, verbose=False, workers=None, incremental=False):
         """
         Publishes all cms content. Two processes cannot publish at the same
         time and the process may be interrupted as soon as another process
-        attempts to invalidate, clear the cache and publish again.
+        attempts to invalidate, clear the cache and publish again. Content
+        may be rendered by multiple worker processes in parallel, as
+        determined by the given number of workers or
+        settings.CACHE_PUBLISH_WORKERS. If incremental is True, only content
+        that is affected by entities that changed since the last publish is
+        generated.
         """
         return self._execute_after_publish_terminated(
-            self._publish_content, verbose
+            self._publish_content, verbose, workers, incremental
         )
 
 
@@ -133,11 +196,39 @@ class CacheGenerator(object):
         we are waiting for publish() to terminate instantly before we invalidate
         the cache.
         """
+        self.cache.add_to_journal([Cache.ANY_DEPENDENCY])
         return self._execute_after_publish_terminated(
             self._invalidate_content, verbose
         )
 
 
+    def invalidate_instance(self, instance, verbose=False):
+        """
+        Invalidates all CMS content from the cache which depends on the given
+        model instance, for example because the instance has been changed.
+        """
+        return self.invalidate_instances([instance], verbose)
+
+
+    def invalidate_instances(self, instances, verbose=False):
+        """
+        Invalidates all CMS content from the cache which depends on any of the
+        given model instances at once.
+        """
+        keys = []
+        for instance in instances:
+            for key in [
+                get_cache_dependency_key(instance.__class__, instance.pk),
+                get_cache_dependency_key(instance.__class__)
+            ]:
+                if key not in keys:
+                    keys.append(key)
+        self.cache.add_to_journal(keys)
+        return self._execute_after_publish_terminated(
+            self._invalidate_dependencies_content, keys, verbose
+        )
+
+
     def clear_cache(self, verbose=False):
         """
         Clears the CMS cache entirely. If the cache is currently publishing,
@@ -149,10 +240,11 @@ class CacheGenerator(object):
         )
 
 
-    def materialise_template_context(self, template_context, level=0):
+    def materialise_template_context(self, template_context, level=0, collection_models=None):
         """
         Find all QuerySet instances in the template context and materialise it
-        (in-place).
+        (in-place). If a list of collection models is given, the model of
+        each materialised QuerySet is added to it.
         """
         if level > MAX_ITERATION_STEPS:
             return template_context
@@ -163,13 +255,67 @@ class CacheGenerator(object):
         if isinstance(template_context, dict):
             for k, v in template_context.items():
                 if isinstance(v, QuerySet):
+                    if collection_models is not None:
+                        collection_models.append(v.model)
                     template_context[k] = list(v)
                 elif isinstance(v, dict):
-                    template_context[k] = self.materialise_template_context(v, level + 1)
+                    template_context[k] = self.materialise_template_context(v, level + 1, collection_models)
 
         return template_context
 
 
+    def get_dependencies_from_template_context(self, template_context, collection_models=None):
+        """
+        Return a set of dependency keys for all entities that are found within
+        the given template context. A list of entities (or a materialised
+        QuerySet) introduces a dependency on any instance of the corresponding
+        model, since adding a new instance would change the list. Navigation
+        is derived from all pages, therefore any page change affects content
+        that presents navigation.
+        """
+        keys = set()
+
+        def _add(item, collection=False):
+            if isinstance(item, Model) and item.pk is not None:
+                keys.add(get_cache_dependency_key(item.__class__, item.pk))
+                if collection:
+                    keys.add(get_cache_dependency_key(item.__class__))
+
+
+        def _collect(d, level=0):
+            if level > MAX_ITERATION_STEPS:
+                return
+
+            if isinstance(d, dict):
+                for v in d.values():
+                    if isinstance(v, list):
+                        for item in v:
+                            if isinstance(item, Model):
+                                _add(item, collection=True)
+                            else:
+                                _collect(item, level + 1)
+                    elif isinstance(v, dict):
+                        _collect(v, level + 1)
+                    else:
+                        _add(v)
+            else:
+                _add(d)
+
+
+        _collect(template_context)
+
+        # materialised querysets (which may have been empty)
+        if collection_models:
+            for model in collection_models:
+                keys.add(get_cache_dependency_key(model))
+
+        # navigation
+        if isinstance(template_context, dict) and 'nav' in template_context:
+            keys.add(get_cache_dependency_key(get_page_model()))
+
+        return keys
+
+
     def get_updated_on_from_template_context(self, template_context, updated_on):
         """
         Return the last modification timestamp that applies for the given
@@ -241,20 +387,33 @@ class CacheGenerator(object):
         return updated_on
 
 
-    def _publish_content(self, verbose=False):
+    def get_publish_jobs(self):
         """
-        Publish cms content.
+        Return a list of all units of work that are required in order to
+        publish all cms content. Each job is a tuple where the first component
+        identifies the type of the job. Jobs can be processed independently
+        from each other, possibly by different worker processes.
         """
-        from cubane.cms.views import fake_request
+        # all pages (including paginated pages)
+        jobs = self.get_page_publish_jobs(self.cms.get_pages())
 
-        # add all pages
-        start = time.time()
-        for page in self.cms.get_pages():
-            if self.quit:
-                break
+        # all child pages
+        for model in self.cms.get_child_page_models():
+            jobs.extend(self.get_child_page_publish_jobs(
+                model,
+                self.cms.get_child_pages_for_model(model)
+            ))
+
+        return jobs
 
+
+    def get_page_publish_jobs(self, pages):
+        """
+        Return a list of publish jobs for the given list of pages.
+        """
+        jobs = []
+        for page in pages:
             # determine type of page
-            is_homepage = self.cms.settings.homepage_id == page.id
             is_contact_page = self.cms.settings.contact_page_id == page.id
 
             # skip contact page if CSRF is enabled, since we would not
@@ -262,82 +421,293 @@ class CacheGenerator(object):
             if 'django.middleware.csrf.CsrfViewMiddleware' in settings.MIDDLEWARE_CLASSES and is_contact_page:
                 continue
 
-            # add page
-            self.process_page(page=page, verbose=verbose)
-
-            # add paginated pages
-            entity_model = page.get_entity_model()
-            if entity_model and self.cms.settings.paging_enabled_for(entity_model):
-                # get all available pages, starting with page number 2
-                # and continue as long as we do not get 404...
-                i = 2
-                has_pages = True
-                # adding an upper bound of max_pages
-                child_page_count = entity_model.objects.count()
-                while has_pages and child_page_count > 0:
-                    page_part = 'page-%d' % i
-                    slug = '/%s/%s/' % (page.slug, page_part)
-
-                    # render page
-                    has_pages = self.process_page_by_slug(slug=slug, verbose=verbose)
-                    i += 1
-                    child_page_count -= 1
-
-        # add all child pages
-        for model in self.cms.get_child_page_models():
-            if self.quit:
-                break
+            jobs.append(('page', page))
+        return jobs
+
+
+    def get_child_page_publish_jobs(self, model, child_pages):
+        """
+        Return a list of publish jobs for the given list of child pages of
+        the given child page model.
+        """
+        jobs = []
+
+        # if a page is assigned to this child_page_model
+        pages = self.cms.get_pages().filter(entity_type=model.__name__)
+        pages = self.cms.filter_out_childpages_on_sitemap(pages)
+        if pages.count() > 0:
+            for child_page in self.cms.filter_out_childpages_on_sitemap(child_pages):
+                page = child_page.page
+
+                # ignore child page with parent reference
+                if page == None:
+                    continue
+
+                # ignore, if parent page does not support entity type
+                if page.entity_type != model.__name__:
+                    continue
+
+                jobs.append(('child_page', child_page))
+
+        return jobs
+
+
+    def get_incremental_publish_jobs(self, keys):
+        """
+        Return a tuple of a list of publish jobs and a list of cache
+        filenames that need to be generated in order to publish all content
+        that is affected by the entities that are identified by the given
+        list of dependency keys, for example because such entities changed
+        since the last time content has been published. Return None, if
+        affected content cannot be determined and all content needs to be
+        published instead.
+        """
+        index = self.cache.get_index()
+        dependency_index = self.cache.get_dependency_index()
+        if not index or dependency_index is None or Cache.ANY_DEPENDENCY in keys:
+            return None
+
+        # all cached files that depend on any of the changed entities or
+        # that have been invalidated
+        filenames = set()
+        for key in keys:
+            filenames.update(dependency_index.get(key, []))
+        for filename in index:
+            if not os.path.isfile(os.path.join(settings.CACHE_ROOT, filename)):
+                filenames.add(filename)
+        filenames = set([
+            filename for filename in filenames
+            if filename in index and not self.cache._is_compressed_filename(filename)
+        ])
+
+        # we need to know how each affected file is generated
+        sources = self.cache.get_source_index()
+        if any(filename not in sources for filename in filenames):
+            return None
+
+        # changed pages and child pages are published as a whole, since
+        # they might be new or their slug might have changed. Pages listing
+        # changed child pages are published with all their paginated pages.
+        jobs = []
+        page_model = get_page_model()
+        child_page_models = self.cms.get_child_page_models()
+        for key in sorted(keys):
+            model, pk = get_model_from_cache_dependency_key(key)
+            if model is None:
+                continue
 
-            # if a page is assigned to this child_page_model
-            pages = self.cms.get_pages().filter(entity_type=model.__name__)
-            pages = self.cms.filter_out_childpages_on_sitemap(pages)
-            if pages.count() > 0:
-                for child_page in self.cms.filter_out_childpages_on_sitemap(self.cms.get_child_pages_for_model(model)):
-                    page = child_page.page
+            if pk is None:
+                if model in child_page_models:
+                    jobs.extend(self.get_page_publish_jobs(
+                        self.cms.get_pages().filter(entity_type=model.__name__)
+                    ))
+            elif issubclass(model, page_model):
+                jobs.extend(self.get_page_publish_jobs(
+                    self.cms.get_pages().filter(pk=pk)
+                ))
+            elif model in child_page_models:
+                jobs.extend(self.get_child_page_publish_jobs(
+                    model,
+                    self.cms.get_child_pages_for_model(model).filter(pk=pk)
+                ))
+            elif key not in dependency_index and get_cache_dependency_key(model) in dependency_index:
+                # the entity has never been published before but similar
+                # entities are presented, we cannot tell which content
+                # would present the new entity
+                return None
+
+        # remove duplicated jobs
+        unique_jobs = []
+        for job in jobs:
+            if job not in unique_jobs:
+                unique_jobs.append(job)
+
+        return (unique_jobs, sorted(filenames))
+
+
+    def get_custom_publish_jobs(self):
+        """
+        Return a list of jobs for publishing all non-cms pages that have been
+        registered with the custom sitemap as cached pages.
+        """
+        return [
+            ('custom_page', custom_page.local_url, custom_page.lastmod)
+            for custom_page
+            in self.cms.custom_sitemap.cached_pages()
+        ]
+
+
+    def process_publish_job(self, job, verbose=False):
+        """
+        Process the given publish job as returned by get_publish_jobs() or
+        get_custom_publish_jobs() or a job that generates a single cache
+        file as recorded by the cache source index.
+        """
+        kind = job[0]
+        if kind == 'page':
+            self.process_page_with_pagination(job[1], verbose)
+        elif kind == 'child_page':
+            self.process_page(page=job[1], verbose=verbose)
+        elif kind == 'custom_page':
+            self.process_custom_page(job[1], job[2], verbose)
+        elif kind == 'instance':
+            self.process_instance(job[1], verbose)
+        elif kind == 'slug':
+            self.process_page_by_slug(job[1], verbose)
+        elif kind == 'url':
+            self.process_page_by_url(job[1], job[2], verbose, filepath=job[3])
+        else:
+            raise ValueError('Unknown publish job type: \'%s\'.' % kind)
+
+
+    def process_page_with_pagination(self, page, verbose=False):
+        """
+        Process the given page and all paginated pages of the given page.
+        """
+        # add page
+        self.process_page(page=page, verbose=verbose)
+
+        # add paginated pages
+        entity_model = page.get_entity_model()
+        if entity_model and self.cms.settings.paging_enabled_for(entity_model):
+            # get all available pages, starting with page number 2
+            # and continue as long as we do not get 404...
+            i = 2
+            has_pages = True
+            # adding an upper bound of max_pages
+            child_page_count = entity_model.objects.count()
+            while has_pages and child_page_count > 0:
+                page_part = 'page-%d' % i
+                slug = '/%s/%s/' % (page.slug, page_part)
+
+                # render page
+                has_pages = self.process_page_by_slug(slug=slug, verbose=verbose)
+                i += 1
+                child_page_count -= 1
+
+
+    def process_instance(self, key, verbose=False):
+        """
+        Process the page that is identified by the given dependency key,
+        unless the page is no longer visible.
+        """
+        model, pk = get_model_from_cache_dependency_key(key)
+        if model is None or pk is None:
+            return False
 
-                    # ignore child page with parent reference
-                    if page == None:
-                        continue
+        if issubclass(model, get_page_model()):
+            pages = self.cms.get_pages()
+        elif model in self.cms.get_child_page_models():
+            pages = self.cms.filter_out_childpages_on_sitemap(
+                self.cms.get_child_pages_for_model(model)
+            )
+        else:
+            pages = model.objects.all()
+            if hasattr(model, 'disabled'):
+                pages = pages.filter(disabled=False)
 
-                    # ignore, if parent page does not support entity type
-                    if page.entity_type != model.__name__:
-                        continue
+        page = pages.filter(pk=pk).first()
+        if page is None:
+            return False
 
-                    # add child page to cache
-                    self.process_page(page=child_page, verbose=verbose)
+        return self.process_page(page=page, verbose=verbose)
 
-        # give other modules a place to do something with the cache
-        self.cms.on_generate_cache(self, verbose)
 
-        # add non-cms pages
-        for custom_page in self.cms.custom_sitemap.cached_pages():
-            if self.quit: break
+    def process_custom_page(self, local_url, lastmod, verbose=False):
+        """
+        Process a non-cms page by executing the view handler for the given
+        local url.
+        """
+        from cubane.cms.views import fake_request
 
-            local_url = custom_page.local_url
-            request = fake_request(local_url, self.cms)
-            view, args, kwargs = resolve(local_url)
-            kwargs['request'] = request
+        request = fake_request(local_url, self.cms)
+        view, args, kwargs = resolve(local_url)
+        kwargs['request'] = request
 
-            # render page
-            try:
-                response = view(*args, **kwargs)
-                # generate cache entry
-                if response and response.status_code == 200:
-                    path = os.path.join(local_url.lstrip('/'), 'index.html')
-                    self.add_to_cache(
-                        path,
-                        custom_page.lastmod,
-                        None,
-                        response.content,
-                        verbose=verbose
-                    )
-            except Http404:
-                pass
+        # render page
+        try:
+            response = view(*args, **kwargs)
+            # generate cache entry
+            if response and response.status_code == 200:
+                path = os.path.join(local_url.lstrip('/'), 'index.html')
+                self.add_to_cache(
+                    path,
+                    lastmod,
+                    None,
+                    response.content,
+                    verbose=verbose
+                )
+                self.cache.set_source(path, ('custom_page', local_url, None))
+        except Http404:
+            pass
+
+
+    def get_publish_workers(self, workers=None):
+        """
+        Return the number of worker processes that are used to publish content.
+        """
+        if workers is None:
+            workers = settings.CACHE_PUBLISH_WORKERS
+
+        try:
+            workers = int(workers)
+        except (TypeError, ValueError):
+            workers = 1
+
+        return max(1, workers)
+
+
+    def _publish_content(self, verbose=False, workers=None, incremental=False):
+        """
+        Publish cms content.
+        """
+        start = time.time()
+        workers = self.get_publish_workers(workers)
+
+        # changed entities since we published content the last time
+        keys = self.cache.begin_journal()
+        incremental_jobs = None
+        if incremental:
+            incremental_jobs = self.get_incremental_publish_jobs(keys)
+            if incremental_jobs is None:
+                out('Unable to publish incrementally. Publishing all content...', verbose=verbose)
+
+        if incremental_jobs is not None:
+            # keep all content that is not affected
+            jobs, filenames = incremental_jobs
+            self.cache.restore_state(exclude=filenames)
+
+            # changed pages and child pages
+            self._process_publish_jobs_with_workers(jobs, workers, verbose)
+
+            # all other affected files that have not been generated yet
+            self._process_publish_jobs_with_workers(
+                self.get_publish_jobs_for_filenames(filenames),
+                workers,
+                verbose
+            )
+        else:
+            # add all pages and child pages
+            self._process_publish_jobs_with_workers(self.get_publish_jobs(), workers, verbose)
+
+            # give other modules a place to do something with the cache
+            self.cms.on_generate_cache(self, verbose)
+
+            # add non-cms pages
+            self._process_publish_jobs(self.get_custom_publish_jobs(), verbose)
 
         # generate cache index file, even if we are forced to quit...
         self.cache.write()
         self.cache.cleanup()
 
+        # all changes have been published
+        if not self.quit:
+            self.cache.end_journal()
+
+        # let other modules know about content that actually changed
+        if self.cache.changed_filenames:
+            self.cms.on_cache_content_changed(self.cache.changed_filenames, verbose)
+
         # present a message that we got terminated by another process
         if self.quit:
             out('- TERMINATED -', verbose=verbose)
@@ -346,6 +716,108 @@ class CacheGenerator(object):
         return (self.cache.items, self.cache.size, end - start)
 
 
+    def get_publish_jobs_for_filenames(self, filenames):
+        """
+        Return a list of publish jobs for generating the given list of cache
+        filenames (as recorded by the cache source index), ignoring files
+        that have already been generated.
+        """
+        sources = self.cache.get_source_index()
+        custom_lastmod = None
+
+        jobs = []
+        for filename in filenames:
+            if filename in self.cache.filenames or filename not in sources:
+                continue
+
+            job = tuple(sources.get(filename))
+            if job[0] == 'custom_page':
+                # custom page might no longer be cached
+                if custom_lastmod is None:
+                    custom_lastmod = dict([
+                        (job[1], job[2]) for job in self.get_custom_publish_jobs()
+                    ])
+                if job[1] not in custom_lastmod:
+                    continue
+                job = ('custom_page', job[1], custom_lastmod.get(job[1]))
+
+            jobs.append(job)
+        return jobs
+
+
+    def _process_publish_jobs_with_workers(self, jobs, workers, verbose=False):
+        """
+        Process the given list of publish jobs, possibly in parallel by the
+        given number of worker processes.
+        """
+        if workers > 1 and len(jobs) > 1 and not self._in_atomic_block():
+            self._process_publish_jobs_parallel(jobs, workers, verbose)
+        else:
+            self._process_publish_jobs(jobs, verbose)
+
+
+    def _in_atomic_block(self):
+        """
+        Return True, if any database connection of this process is within a
+        transaction. Worker processes would not see uncommitted data and we
+        cannot close the connection without breaking the transaction.
+        """
+        return any([conn.in_atomic_block for conn in connections.all()])
+
+
+    def _process_publish_jobs(self, jobs, verbose=False):
+        """
+        Process the given list of publish jobs one after another within the
+        current process.
+        """
+        for job in jobs:
+            if self.quit:
+                break
+
+            self.process_publish_job(job, verbose)
+
+
+    def _process_publish_jobs_parallel(self, jobs, workers, verbose=False):
+        """
+        Process the given list of publish jobs by distributing them over a
+        pool of worker processes. Each worker renders content into the cache
+        folder and reports back the cache filenames, sizes, dependencies and
+        digests that it produced, which are then merged into the cache index
+        of this process. The pool is terminated as soon as another process
+        attempts to invalidate, clear or re-generate the cache.
+        """
+        # worker processes must not share the database connection of this
+        # process, each worker will establish its own connection on demand.
+        # Connections within a transaction are never processed in parallel.
+        for conn in connections.all():
+            if not conn.in_atomic_block:
+                conn.close()
+
+        pool = multiprocessing.Pool(workers, _init_publish_worker)
+        try:
+            args = [(job, verbose) for job in jobs]
+            results = pool.imap_unordered(_publish_worker, args)
+            remaining = len(args)
+            while remaining > 0:
+                if self._terminate_requested():
+                    self.quit = True
+                    break
+
+                try:
+                    state = results.next(timeout=PUBLISH_TERMINATE_CHECK_INTERVAL)
+                except multiprocessing.TimeoutError:
+                    continue
+
+                self.cache.merge(state)
+                remaining -= 1
+        finally:
+            if self.quit:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+
     def _process_page_for_cache(self, page=None, slug=None, url=None, args=[], filepath=None, verbose=False):
         """
         Process the given page for the cache system. The page will only be
@@ -359,7 +831,9 @@ class CacheGenerator(object):
         if self.quit:
             return False
 
-        if not self.terminate_lock.acquire(wait=False):
+        # publish worker processes are terminated by the parent process
+        locked = self.terminate_lock is not None
+        if locked and not self.terminate_lock.acquire(wait=False):
             self.quit = True
             return False
 
@@ -397,12 +871,34 @@ class CacheGenerator(object):
                 render_response.content,
                 verbose
             )
+
+            # remember how to generate the file again
+            if page:
+                source = ('instance', get_cache_dependency_key(page.__class__, page.pk))
+            elif slug:
+                source = ('slug', slug)
+            else:
+                source = ('url', url, list(args), filepath)
+            self.cache.set_source(render_response.filepath, source)
         finally:
-            self.terminate_lock.release()
+            if locked:
+                self.terminate_lock.release()
 
         return True
 
 
+    def _terminate_requested(self):
+        """
+        Return True, if another process is waiting for us to terminate, so
+        that it can invalidate, clear or re-generate the cache.
+        """
+        if not self.terminate_lock.acquire(wait=False):
+            return True
+
+        self.terminate_lock.release()
+        return False
+
+
     def _invalidate_content(self, verbose=False):
         """
         Invalidate cms content.
@@ -416,6 +912,19 @@ class CacheGenerator(object):
             self.terminate_lock.release()
 
 
+    def _invalidate_dependencies_content(self, keys, verbose=False):
+        """
+        Invalidate cms content that depends on any of the given keys.
+        """
+        if not self.terminate_lock.acquire(wait=False):
+            return 0
+
+        try:
+            return self.cache.invalidate_dependencies(keys, verbose)
+        finally:
+            self.terminate_lock.release()
+
+
     def _clear_cache_content(self, verbose=False):
         """
         Clear cache content.
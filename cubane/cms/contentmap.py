@@ -0,0 +1,187 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.template import engines
+from cubane.lib.template import get_compatible_template
+from collections import OrderedDict
+import copy
+import re
+
+
+# combined patterns and templates, shared by all cms instances
+_PATTERN_CACHE = {}
+_TEMPLATE_CACHE = {}
+
+
+# named groups and named group references within a pattern
+NAMED_GROUP_PATTERN = re.compile(r'\(\?P([<=])(\w+)')
+
+
+# numbered group references within a pattern
+NUMBERED_REFERENCE_PATTERN = re.compile(r'\\[1-9]')
+
+
+# characters with special meaning at the beginning of a pattern
+REGEX_SPECIAL_CHARS = '\\.^$*+?()[]|'
+
+
+def compile_template(replacement):
+    """
+    Return the compiled template for the given replacement string. Each
+    replacement string is only compiled once.
+    """
+    template = _TEMPLATE_CACHE.get(replacement)
+    if template is None:
+        template = get_compatible_template(engines['django'].from_string(replacement))
+        _TEMPLATE_CACHE[replacement] = template
+    return template
+
+
+def compile_patterns(patterns):
+    """
+    Compile the given list of patterns into one combined alternation, where
+    each pattern is wrapped into a named group _r<index>. Named groups of each
+    pattern are renamed to _r<index>_<name>, so that they are unique.
+    Return a tuple of the compiled pattern and a list of group names for each
+    pattern or None, if the given patterns cannot be combined.
+    """
+    patterns = tuple(patterns)
+    if patterns not in _PATTERN_CACHE:
+        alternatives = []
+        groups = []
+        for i, pattern in enumerate(patterns):
+            if NUMBERED_REFERENCE_PATTERN.search(pattern):
+                _PATTERN_CACHE[patterns] = None
+                return None
+
+            prefix = '_r%d' % i
+            names = []
+            def rename(m):
+                if m.group(1) == '<':
+                    names.append(('%s_%s' % (prefix, m.group(2)), m.group(2)))
+                return '(?P%s%s_%s' % (m.group(1), prefix, m.group(2))
+
+            alternatives.append('(?P<%s>%s)' % (prefix, NAMED_GROUP_PATTERN.sub(rename, pattern)))
+            groups.append(names)
+
+        # if all patterns start with the same literal character, such as '{',
+        # tell the regex engine, so that it does not need to try every
+        # alternative at every position of the content
+        combined = '|'.join(alternatives)
+        first_chars = set([pattern[:1] for pattern in patterns])
+        if len(first_chars) == 1:
+            first_char = first_chars.pop()
+            if first_char and first_char not in REGEX_SPECIAL_CHARS:
+                combined = '(?=%s)(?:%s)' % (re.escape(first_char), combined)
+
+        try:
+            _PATTERN_CACHE[patterns] = (re.compile(combined), groups)
+        except re.error:
+            _PATTERN_CACHE[patterns] = None
+
+    return _PATTERN_CACHE[patterns]
+
+
+class ContentMapRule(object):
+    """
+    A content mapping rule, which replaces any match of a pattern with a
+    replacement string, the rendered result of a template or the result of
+    a callable.
+    """
+    def __init__(self, pattern, replacement):
+        self.pattern = pattern
+        self.replacement = replacement
+        self.is_callable = callable(replacement)
+        if not self.is_callable and ('{{' in replacement or '{%' in replacement):
+            self.template = compile_template(replacement)
+        else:
+            self.template = None
+
+
+    @property
+    def contains_template_code(self):
+        """
+        Return True, if the replacement is a template.
+        """
+        return self.template is not None
+
+
+    def render(self, request, context, groupdict):
+        """
+        Return the replacement for a match with the given named groups.
+        """
+        if self.is_callable:
+            context.update(groupdict)
+            return self.replacement(request, context)
+        elif self.template:
+            context.update(groupdict)
+            return self.template.render(context)
+        else:
+            return self.replacement
+
+
+class ContentMap(object):
+    """
+    Set of content mapping rules. All rules are applied at once by using one
+    combined pattern for all rules.
+    """
+    def __init__(self):
+        self._rules = OrderedDict()
+
+
+    def __len__(self):
+        return len(self._rules)
+
+
+    def add(self, pattern, replacement):
+        """
+        Register the given replacement for the given pattern, replacing any
+        existing rule for the same pattern.
+        """
+        self._rules[pattern] = ContentMapRule(pattern, replacement)
+
+
+    def rules(self):
+        """
+        Return a list of all rules in the order in which they were registered.
+        """
+        return self._rules.values()
+
+
+    def apply(self, request, content, context):
+        """
+        Replace all matches of all rules within the given content.
+        """
+        if not self._rules or not content:
+            return content
+
+        compiled = compile_patterns(self._rules.keys())
+        if compiled is None:
+            return self.apply_sequential(request, content, context)
+
+        pattern, groups = compiled
+        rules = self._rules.values()
+        c = []
+
+        def patcher(m):
+            if not c:
+                c.append(copy.copy(context))
+
+            i = int(m.lastgroup[2:])
+            groupdict = dict([(name, m.group(group)) for group, name in groups[i]])
+            return rules[i].render(request, c[0], groupdict)
+
+        return pattern.sub(patcher, content)
+
+
+    def apply_sequential(self, request, content, context):
+        """
+        Replace all matches of all rules within the given content by applying
+        one rule after another.
+        """
+        for rule in self._rules.values():
+            if re.search(rule.pattern, content):
+                c = copy.copy(context)
+                def patcher(m):
+                    return rule.render(request, c, m.groupdict())
+                content = re.sub(rule.pattern, patcher, content)
+        return content
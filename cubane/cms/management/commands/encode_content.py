@@ -0,0 +1,69 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from cubane.cms.models import EditableContentMixin
+from cubane.cms.models import encode_content_data, decode_content_data
+from cubane.lib.app import get_models
+from cubane.lib.verbose import out
+
+
+class Command(BaseCommand):
+    """
+    Re-encode the content of all editable content models according to
+    CMS_CONTENT_ENCODING, for example after switching from (legacy) pickled
+    content to JSON.
+    """
+    args = ''
+    help = 'Re-encode CMS content according to CMS_CONTENT_ENCODING.'
+
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--simulate',
+            action='store_true',
+            help='Simulate all actions without actually carrying them out.'
+        )
+
+
+    def handle(self, *args, **options):
+        """
+        Run command.
+        """
+        out('Encoding CMS content as \'%s\'...Please Wait...' % settings.CMS_CONTENT_ENCODING)
+
+        simulate = options.get('simulate', False)
+        i = 0
+        n = 0
+        for model in get_models():
+            if issubclass(model, EditableContentMixin) and not model._meta.proxy:
+                _i, _n = self.process_model(model, simulate)
+                i += _i
+                n += _n
+
+        out('%d item(s) re-encoded out of %d content item(s) in total.%s' % (
+            i,
+            n,
+            ' (Simulated!)' if simulate else ''
+        ))
+
+
+    def process_model(self, model, simulate=False):
+        """
+        Re-encode the content of all instances of the given model. Content is
+        written directly without saving model instances, so that timestamps
+        are not changed and no signals are sent.
+        """
+        i = 0
+        n = 0
+        rows = model._base_manager.exclude(_data=None).values_list('pk', '_data')
+        for pk, s in rows.iterator():
+            data = encode_content_data(decode_content_data(s))
+            if data != s:
+                if not simulate:
+                    model._base_manager.filter(pk=pk).update(_data=data)
+                i += 1
+            n += 1
+
+        return i, n
@@ -14,6 +14,17 @@ class Command(BaseCommand):
     help = 'Publish CMS content.'
 
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, dest='workers', default=None,
+            help='Number of worker processes used to publish content in parallel.'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true', dest='incremental', default=False,
+            help='Only publish content that is affected by changes since the last publish.'
+        )
+
+
     def handle(self, *args, **options):
         """
         Run command.
@@ -25,7 +36,11 @@ class Command(BaseCommand):
         print 'CACHE: %s' % settings.CACHE_ROOT
         print
 
-        (items, size_bytes, time_sec) = cms.publish(verbose=True)
+        (items, size_bytes, time_sec) = cms.publish(
+            verbose=True,
+            workers=options.get('workers'),
+            incremental=options.get('incremental')
+        )
 
         print '%d files published. %s. %s sec.' % (
             items,
@@ -28,6 +28,7 @@ from cubane.lib.utf8 import ENCODING_CHOICES, DEFAULT_ENCODING
 from cubane.lib.model import get_listing_option
 from datetime import datetime
 import cPickle as pickle
+import json
 import base64
 import os
 import re
@@ -41,6 +42,36 @@ class ChildPageWithoutParentError(Exception):
     pass
 
 
+def encode_content_data(data):
+    """
+    Encode the given python content object as a string. Content is encoded
+    as JSON if CMS_CONTENT_ENCODING is 'json' and the content is a
+    dictionary that can be represented as JSON; otherwise content is pickled
+    and base64-encoded.
+    """
+    if settings.CMS_CONTENT_ENCODING == 'json' and isinstance(data, dict):
+        try:
+            return json.dumps(data, separators=(',', ':'))
+        except (TypeError, ValueError):
+            pass
+
+    return base64.encodestring(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+
+def decode_content_data(s):
+    """
+    Decode the given encoded content string as a python object. Both JSON
+    and (legacy) pickled content is supported, since the base64 alphabet
+    does not contain the character '{'.
+    """
+    if not s:
+        return {}
+    elif s.startswith('{'):
+        return json.loads(s)
+    else:
+        return pickle.loads(base64.decodestring(s))
+
+
 class EditableHtmlField(models.TextField):
     """
     Represents editable HTML content and renders as a TinyMCE editor form field.
@@ -90,19 +121,33 @@ class EditableContentMixin(models.Model):
 
     def set_data(self, data):
         """
-        Encode given python content object as a string.
+        Encode given python content object as a string. Depending on
+        CMS_CONTENT_ENCODING, content is either encoded as JSON or pickled.
         """
-        self._data = base64.encodestring(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+        self._data = encode_content_data(data)
+        self._data_cache = None
 
 
     def get_data(self):
         """
         Return the binary encoded content data as a python object (cached)
         """
-        if self._data:
-            return pickle.loads(base64.decodestring(self._data))
-        else:
-            return {}
+        data = self._get_decoded_data()
+        if isinstance(data, dict):
+            data = dict(data)
+        return data
+
+
+    def _get_decoded_data(self):
+        """
+        Return the decoded content data. The content data is only decoded
+        once, unless the encoded content data has been changed.
+        """
+        cache = getattr(self, '_data_cache', None)
+        if cache is None or cache[0] is not self._data:
+            cache = (self._data, decode_content_data(self._data))
+            self._data_cache = cache
+        return cache[1]
 
 
     def set_slot_content(self, slotname, content):
@@ -136,7 +181,7 @@ class EditableContentMixin(models.Model):
         if slotname not in settings.CMS_SLOTNAMES:
             return ''
 
-        data = self.get_data()
+        data = self._get_decoded_data()
         if not data or not isinstance(data, dict):
             return ''
         else:
@@ -156,7 +201,7 @@ class EditableContentMixin(models.Model):
         """
         Return a list of slot names that have content.
         """
-        data = self.get_data()
+        data = self._get_decoded_data()
 
         if not data or not isinstance(data, dict):
             return []
@@ -173,7 +218,7 @@ class EditableContentMixin(models.Model):
         from cubane.media.templatetags.media_tags import render_image
         from cubane.cms.templatetags.cms_tags import rewrite_images
 
-        data = self.get_data()
+        data = self._get_decoded_data()
         if not data or not isinstance(data, dict):
             return {}
         else:
@@ -1632,9 +1677,8 @@ def get_child_page_model_choices():
 @receiver(post_delete)
 def update_entity_deleted_on(sender, **kwargs):
     if 'cubane.cms' in settings.INSTALLED_APPS:
-        from cubane.cms.views import get_cms
-        cms = get_cms()
-        cms.notify_content_changed(sender, (PageBase, Entity, SettingsBase, DateTimeBase), delete=True)
+        from cubane.cms.batch import notify_content_changed
+        notify_content_changed(sender, (PageBase, Entity, SettingsBase, DateTimeBase), delete=True, instance=kwargs.get('instance'))
 
 
 #
@@ -1643,6 +1687,5 @@ def update_entity_deleted_on(sender, **kwargs):
 @receiver(post_save)
 def invalidate_cache_on_content_changed(sender, **kwargs):
     if 'cubane.cms' in settings.INSTALLED_APPS:
-        from cubane.cms.views import get_cms
-        cms = get_cms()
-        cms.notify_content_changed(sender, (PageBase, Entity, SettingsBase, DateTimeBase))
\ No newline at end of file
+        from cubane.cms.batch import notify_content_changed
+        notify_content_changed(sender, (PageBase, Entity, SettingsBase, DateTimeBase), instance=kwargs.get('instance'))
\ No newline at end of file
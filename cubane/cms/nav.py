@@ -3,10 +3,73 @@ from __future__ import unicode_literals
 from django.conf import settings
 from django.db.models import Q
 from cubane.lib.module import register_class_extensions
+from cubane.lib.version import get_version_stamp, bump_version_stamp
 from cubane.cms import get_page_model
 from cubane.cms.models import PageBase
 
 
+# cache key of the navigation version stamp (shared cache)
+NAVIGATION_VERSION_KEY = 'cubane_cms_navigation_version'
+
+
+# process-wide navigation data for the current version stamp
+_NAVIGATION_CACHE = {}
+_NAVIGATION_CACHE_VERSION = None
+
+
+def get_navigation_version():
+    """
+    Return the current version stamp of navigation data. If
+    CMS_NAVIGATION_CACHE_ALIAS names a Django cache, the version stamp is
+    shared by all processes; otherwise it is local to the current process.
+    """
+    return get_version_stamp(NAVIGATION_VERSION_KEY, settings.CMS_NAVIGATION_CACHE_ALIAS)
+
+
+def invalidate_navigation_cache():
+    """
+    Bump the navigation version stamp, so that navigation data is loaded
+    again by all processes.
+    """
+    if not settings.CMS_NAVIGATION_CACHE:
+        return
+
+    bump_version_stamp(NAVIGATION_VERSION_KEY, settings.CMS_NAVIGATION_CACHE_ALIAS)
+    clear_navigation_cache()
+
+
+def clear_navigation_cache():
+    """
+    Clear navigation data that is cached by the current process without
+    bumping the navigation version stamp.
+    """
+    global _NAVIGATION_CACHE, _NAVIGATION_CACHE_VERSION
+
+    _NAVIGATION_CACHE = {}
+    _NAVIGATION_CACHE_VERSION = None
+
+
+def get_cached_navigation_data(version, key, func):
+    """
+    Return the process-wide cached navigation data for the given key, which
+    is only valid for the given version stamp. If there is no cached data
+    yet, the data is created by executing the given callable.
+    """
+    global _NAVIGATION_CACHE, _NAVIGATION_CACHE_VERSION
+
+    if version is None:
+        return func()
+
+    if version != _NAVIGATION_CACHE_VERSION:
+        _NAVIGATION_CACHE = {}
+        _NAVIGATION_CACHE_VERSION = version
+
+    cache = _NAVIGATION_CACHE
+    if key not in cache:
+        cache[key] = func()
+    return cache[key]
+
+
 class CMSNavigationBuilder(object):
     @classmethod
     def register_extension(cls, *args):
@@ -27,7 +90,20 @@ class CMSNavigationBuilder(object):
         self.current_page_or_child_page = current_page_or_child_page
         self.cache_context = cache_context
         self.child_page_cache = {}
-        self.pages = self.cache_context.cached('PAGES', self.get_pages)
+        self.version = get_navigation_version() if settings.CMS_NAVIGATION_CACHE else None
+        self.pages, self.pages_by_parent = self.cache_context.cached(
+            'PAGES',
+            lambda: self.cached('PAGES', self.get_pages_with_parent_index)
+        )
+
+
+    def cached(self, key, func):
+        """
+        Return process-wide cached navigation data for the given key, which
+        remains valid until any content changes. If the navigation cache is
+        disabled, the given callable is executed every time.
+        """
+        return get_cached_navigation_data(self.version, (self.__class__, key), func)
 
 
     def get_objects(self, objects):
@@ -68,6 +144,19 @@ class CMSNavigationBuilder(object):
         return pages
 
 
+    def get_pages_with_parent_index(self):
+        """
+        Return a list of navigate-able content pages and a dictionary of
+        those pages by the primary key of their parent page.
+        """
+        pages = self.get_pages()
+        pages_by_parent = {}
+        for p in pages:
+            if isinstance(p, PageBase):
+                pages_by_parent.setdefault(p.parent_id, []).append(p)
+        return pages, pages_by_parent
+
+
     def get_title(self, page):
         """
         Return the navigation title for the given page.
@@ -149,9 +238,11 @@ class CMSNavigationBuilder(object):
             self.child_page_cache[key] = []
 
             # get child pages for this page
-            child_pages = child_page_model.filter_visibility(
-                child_page_model.objects.filter(page=page).exclude(disabled=True).order_by('seq')
-            )
+            child_pages = self.cached(('CHILD_PAGES', page.pk), lambda: list(
+                child_page_model.filter_visibility(
+                    child_page_model.objects.filter(page=page).exclude(disabled=True).order_by('seq')
+                )
+            ))
 
             self.child_page_cache[key] = list([self.get_nav_item(p, nav_name) for p in child_pages])
 
@@ -217,7 +308,7 @@ class CMSNavigationBuilder(object):
         """
         # get children
         if isinstance(parent, PageBase) and settings.PAGE_HIERARCHY:
-            children = filter(lambda p: isinstance(p, PageBase) and p.parent_id == parent.id, self.pages)
+            children = self.pages_by_parent.get(parent.id, [])
 
             if nav_name:
                 children = filter(lambda p: nav_name in p.nav, children)
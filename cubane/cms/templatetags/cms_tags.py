@@ -30,6 +30,10 @@ import copy
 register = template.Library()
 
 
+# cache of rendered slot content
+_SLOT_CACHE = {}
+
+
 # old (deprecated) google analytics (ga.js)
 GOOGLE_ANALYTICS_SNIPPET = """<script>var _gaq=_gaq||[];_gaq.push(['_setAccount','%s']);_gaq.push(['_trackPageview']);(function(){var ga=document.createElement('script');ga.type='text/javascript';ga.async=true;ga.src=('https:'==document.location.protocol?'https://ssl':'http://www')+'.google-analytics.com/ga.js';var s=document.getElementsByTagName('script')[0];s.parentNode.insertBefore(ga, s);})();</script>"""
 
@@ -175,6 +179,116 @@ def rewrite_page_links(content, page_links):
     return re.sub(r'#link\[(.*?)\]', rewrite_page_link, content)
 
 
+def rewrite_slot_content(content, images, page_links, preview=False, is_enquiry_template=False, noscript=False, image_shape=None, headline_transpose=0):
+    """
+    Rewrite images, page links and headlines of the given slot content.
+    """
+    # rewrite image url to use responsive lazy-load mechanism for images,
+    # (we are not doing this in preview mode).
+    if not preview and not is_enquiry_template and 'cubane.media' in settings.INSTALLED_APPS:
+        from cubane.media.templatetags.media_tags import render_image
+        content = rewrite_images(content, images, render_image, noscript, image_shape)
+
+    # page links
+    if not preview:
+        content = rewrite_page_links(content, page_links)
+
+    # transpose headlines
+    content = transpose_html_headlines(content, headline_transpose)
+
+    # cleanup markup
+    if settings.CMS_CLEAN_HTML:
+        content = cleanup_html(content)
+
+    return content
+
+
+def get_images_fingerprint(images):
+    """
+    Return a hashable representation of the given images, which changes
+    whenever one of the images changes.
+    """
+    return tuple(sorted([
+        (pk, getattr(image, 'updated_on', None))
+        for pk, image in images.items()
+    ]))
+
+
+def get_page_links_fingerprint(page_links):
+    """
+    Return a hashable representation of the given page links, which changes
+    whenever the url of any linked page changes.
+    """
+    result = []
+    for _type, items in page_links.items():
+        for _id, obj in items.items():
+            if hasattr(obj, 'url'):
+                url = obj.url
+            elif hasattr(obj, 'get_absolute_url'):
+                url = obj.get_absolute_url()
+            else:
+                url = None
+            result.append((_type, _id, url))
+    return tuple(sorted(result))
+
+
+def get_render_context_fingerprint(context, name, obj, fingerprint):
+    """
+    Return the fingerprint for the given object. The fingerprint is only
+    generated once while rendering the same template, since all slots of the
+    same page usually share the same images and page links.
+    """
+    key = 'cms_slot_fingerprint_%s' % name
+    cached = context.render_context.get(key)
+    if cached is None or cached[0] is not obj:
+        cached = (obj, fingerprint(obj))
+        context.render_context[key] = cached
+    return cached[1]
+
+
+def get_slot_cache_key(context, page, slotname, images, page_links, is_enquiry_template, noscript, image_shape, headline_transpose):
+    """
+    Return the key under which the rendered content of the given slot is
+    cached or None, if the content of the given page cannot be cached.
+    """
+    if settings.CMS_SLOT_CACHE_SIZE <= 0:
+        return None
+
+    if page is None or page.pk is None or getattr(page, 'updated_on', None) is None:
+        return None
+
+    return (
+        page.__class__,
+        page.pk,
+        page.updated_on,
+        slotname,
+        image_shape,
+        headline_transpose,
+        noscript,
+        is_enquiry_template,
+        settings.CMS_CLEAN_HTML,
+        get_render_context_fingerprint(context, 'images', images, get_images_fingerprint),
+        get_render_context_fingerprint(context, 'page_links', page_links, get_page_links_fingerprint)
+    )
+
+
+def set_slot_cache(key, content):
+    """
+    Cache the given rendered slot content under the given key. The cache is
+    cleared entirely whenever it reaches CMS_SLOT_CACHE_SIZE entries.
+    """
+    if len(_SLOT_CACHE) >= settings.CMS_SLOT_CACHE_SIZE:
+        _SLOT_CACHE.clear()
+    _SLOT_CACHE[key] = content
+
+
+def clear_slot_cache():
+    """
+    Clear the cache of rendered slot content.
+    """
+    _SLOT_CACHE.clear()
+
+
 def render_meta_tag(name, value):
     """
     Render a meta tag with the given name and value if a value is defined.
@@ -257,28 +371,35 @@ class SlotNode(template.Node):
         except ValueError:
             headline_transpose = 0
 
-        # run through content pipeline
+        # the rendered slot content is cached per page, slot and all
+        # other arguments that the rendered content depends on...
         cms = get_cms()
         request = context.get('request')
-        content = cms.on_render_content_pipeline(request, content, context)
-
-        # rewrite image url to use responsive lazy-load mechanism for images,
-        # (we are not doing this in preview mode).
-        if not preview and not is_enquiry_template and 'cubane.media' in settings.INSTALLED_APPS:
-            from cubane.media.templatetags.media_tags import render_image
-            content = rewrite_images(content, images, render_image, noscript, image_shape)
-
-        # page links
+        page_links = context.get('page_links', {})
+        cache_key = None
         if not preview:
-            page_links = context.get('page_links', {})
-            content = rewrite_page_links(content, page_links)
+            cache_key = get_slot_cache_key(context, page, slotname, images, page_links, is_enquiry_template, noscript, image_shape, headline_transpose)
+
+        # run through content pipeline. If the result of the pipeline depends
+        # on the template context, it cannot be cached and the result becomes
+        # part of the cache key instead.
+        pipeline_cacheable = cache_key is not None and cms.is_content_pipeline_cacheable()
+        if not pipeline_cacheable:
+            content = cms.on_render_content_pipeline(request, content, context)
+            if cache_key is not None:
+                cache_key += (content,)
+
+        cached_content = _SLOT_CACHE.get(cache_key) if cache_key is not None else None
+        if cached_content is not None:
+            content = cached_content
+        else:
+            if pipeline_cacheable:
+                content = cms.on_render_content_pipeline(request, content, context)
 
-        # transpose headlines
-        content = transpose_html_headlines(content, headline_transpose)
+            content = rewrite_slot_content(content, images, page_links, preview, is_enquiry_template, noscript, image_shape, headline_transpose)
 
-        # cleanup markup
-        if settings.CMS_CLEAN_HTML:
-            content = cleanup_html(content)
+            if cache_key is not None:
+                set_slot_cache(cache_key, content)
 
         # mark content as safe
         content = mark_safe(content)
@@ -1,6 +1,8 @@
 from cubane.cms.tests.api import *
+from cubane.cms.tests.batch import *
 from cubane.cms.tests.cache import *
 from cubane.cms.tests.cachegen import *
+from cubane.cms.tests.contentmap import *
 from cubane.cms.tests.decorators import *
 from cubane.cms.tests.forms import *
 from cubane.cms.tests.models import *
@@ -0,0 +1,205 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.http import HttpResponse
+from cubane.tests.base import CubaneTestCase
+from cubane.cms.batch import content_change_batch
+from cubane.cms.batch import get_content_change_batch
+from cubane.cms.batch import begin_content_change_batch
+from cubane.cms.views import CMS
+from cubane.middleware import ContentChangeBatchMiddleware
+from cubane.testapp.models import TestModel, Settings
+import mock
+
+
+class CMSContentChangeBatchTestCase(CubaneTestCase):
+    """
+    cubane.cms.batch.content_change_batch()
+    """
+    def tearDown(self):
+        TestModel.objects.all().delete()
+
+
+    def test_should_process_changes_immediately_without_batch(self):
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            a = TestModel.objects.create(title='a')
+            TestModel.objects.create(title='b')
+
+        self.assertEqual(2, on_content_changed.call_count)
+        self.assertEqual([(TestModel, False, a)], on_content_changed.call_args_list[0][0][0])
+
+
+    def test_should_process_changes_once_at_end_of_batch(self):
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            with content_change_batch():
+                a = TestModel.objects.create(title='a')
+                b = TestModel.objects.create(title='b')
+                a.title = 'changed'
+                a.save()
+                self.assertFalse(on_content_changed.called)
+
+        self.assertEqual(1, on_content_changed.call_count)
+        self.assertEqual(
+            [(TestModel, False, a), (TestModel, False, b)],
+            on_content_changed.call_args[0][0]
+        )
+
+
+    def test_should_process_nested_batches_at_end_of_outermost_batch(self):
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            with content_change_batch():
+                with content_change_batch():
+                    TestModel.objects.create(title='a')
+                self.assertFalse(on_content_changed.called)
+
+        self.assertEqual(1, on_content_changed.call_count)
+        self.assertIsNone(get_content_change_batch())
+
+
+    def test_should_process_changes_if_batch_failed(self):
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            try:
+                with content_change_batch():
+                    TestModel.objects.create(title='a')
+                    raise ValueError()
+            except ValueError:
+                pass
+
+        self.assertEqual(1, on_content_changed.call_count)
+        self.assertIsNone(get_content_change_batch())
+
+
+    def test_should_decorate_function(self):
+        @content_change_batch()
+        def create():
+            TestModel.objects.create(title='a')
+            TestModel.objects.create(title='b')
+
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            create()
+
+        self.assertEqual(1, on_content_changed.call_count)
+
+
+    def test_should_clear_local_settings_cache_immediately_if_settings_changed(self):
+        with mock.patch.object(CMS, 'on_content_changed'):
+            with mock.patch('cubane.cms.views.clear_settings_cache') as clear_settings_cache:
+                with mock.patch('cubane.cms.views.clear_local_settings_cache') as clear_local_settings_cache:
+                    with content_change_batch():
+                        Settings().save()
+                        self.assertTrue(clear_local_settings_cache.called)
+
+        self.assertFalse(clear_settings_cache.called)
+
+
+    def test_should_not_clear_local_settings_cache_for_other_content(self):
+        with mock.patch.object(CMS, 'on_content_changed'):
+            with mock.patch('cubane.cms.views.clear_local_settings_cache') as clear_local_settings_cache:
+                with content_change_batch():
+                    TestModel.objects.create(title='a')
+
+        self.assertFalse(clear_local_settings_cache.called)
+
+
+    def test_should_not_process_empty_batch(self):
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            with content_change_batch():
+                pass
+
+        self.assertFalse(on_content_changed.called)
+
+
+@override_settings(CACHE_ENABLED=True, CACHE_PARTIAL_INVALIDATION=True)
+class CMSOnContentChangedTestCase(CubaneTestCase):
+    """
+    cubane.cms.views.CMS.on_content_changed()
+    """
+    def setUp(self):
+        self.cms = CMS()
+        self.a = TestModel(id=1, title='a')
+        self.b = TestModel(id=2, title='b')
+
+
+    def test_should_invalidate_all_changed_instances_at_once(self):
+        with mock.patch.object(CMS, 'invalidate_instances') as invalidate_instances:
+            with mock.patch.object(CMS, 'invalidate') as invalidate:
+                self.cms.on_content_changed([
+                    (TestModel, False, self.a),
+                    (TestModel, False, self.b)
+                ])
+
+        invalidate_instances.assert_called_once_with([self.a, self.b], verbose=False)
+        self.assertFalse(invalidate.called)
+
+
+    def test_should_invalidate_everything_once_if_any_instance_was_deleted(self):
+        with mock.patch.object(CMS, 'invalidate_instances') as invalidate_instances:
+            with mock.patch.object(CMS, 'invalidate') as invalidate:
+                self.cms.on_content_changed([
+                    (TestModel, False, self.a),
+                    (TestModel, True, self.b)
+                ])
+
+        self.assertFalse(invalidate_instances.called)
+        self.assertEqual(1, invalidate.call_count)
+
+
+    def test_should_invalidate_everything_once_if_settings_changed(self):
+        with mock.patch.object(CMS, 'invalidate_instances') as invalidate_instances:
+            with mock.patch.object(CMS, 'invalidate') as invalidate:
+                self.cms.on_content_changed([
+                    (TestModel, False, self.a),
+                    (Settings, False, Settings(id=1))
+                ])
+
+        self.assertFalse(invalidate_instances.called)
+        self.assertEqual(1, invalidate.call_count)
+
+
+class ContentChangeBatchMiddlewareTestCase(CubaneTestCase):
+    """
+    cubane.middleware.ContentChangeBatchMiddleware
+    """
+    def setUp(self):
+        self.middleware = ContentChangeBatchMiddleware()
+        self.request = RequestFactory().get('/')
+
+
+    def tearDown(self):
+        TestModel.objects.all().delete()
+
+
+    def test_should_process_changes_once_at_end_of_request(self):
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            self.middleware.process_request(self.request)
+            TestModel.objects.create(title='a')
+            TestModel.objects.create(title='b')
+            self.assertFalse(on_content_changed.called)
+
+            self.middleware.process_response(self.request, HttpResponse())
+
+        self.assertEqual(1, on_content_changed.call_count)
+        self.assertIsNone(get_content_change_batch())
+
+
+    def test_should_process_changes_on_exception(self):
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            self.middleware.process_request(self.request)
+            TestModel.objects.create(title='a')
+            self.middleware.process_exception(self.request, ValueError())
+            self.middleware.process_response(self.request, HttpResponse())
+
+        self.assertEqual(1, on_content_changed.call_count)
+        self.assertIsNone(get_content_change_batch())
+
+
+    def test_should_end_batch_left_over_by_previous_request(self):
+        begin_content_change_batch()
+        with mock.patch.object(CMS, 'on_content_changed') as on_content_changed:
+            TestModel.objects.create(title='a')
+            self.middleware.process_request(self.request)
+            self.assertEqual(1, on_content_changed.call_count)
+            self.middleware.process_response(self.request, HttpResponse())
+
+        self.assertIsNone(get_content_change_batch())
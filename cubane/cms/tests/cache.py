@@ -5,18 +5,25 @@ from django.test.utils import override_settings
 from cubane.tests.base import CubaneTestCase
 from cubane.media.models import Media
 from cubane.cms.cache import Cache, CacheContext
+from cubane.cms.cache import get_cache_dependency_key
 from cubane.testapp.models import CustomPage, TestModel, Settings
 from cubane.lib.deploy import save_deploy_timestamp
 from cubane.lib.deploy import delete_deploy_timestamp
 from cubane.lib.file import file_put_contents
 from cubane.lib.file import file_get_contents
 from cubane.lib.file import file_set_mtime
+from cubane.lib.libjson import decode_json
 from datetime import datetime
 from freezegun import freeze_time
 import os
 import tempfile
 import stat
 import time
+import gzip
+import hashlib
+import codecs
+import resource
+import multiprocessing
 import mock
 
 
@@ -74,6 +81,17 @@ class CMSCacheInvalidateTestCase(CubaneTestCase):
         self.assertEqual(2, self.cache.items)
 
 
+    def test_merge_should_add_filenames_and_size(self):
+        self.cache.add('test1.html', None, None, '<h1>Hello Foo</h1>', minify_html=False)
+        self.cache.merge({
+            'filenames': ['test2.html', 'foo/test3.html'],
+            'size': 36
+        })
+        self.assertEqual(3, self.cache.items)
+        self.assertEqual(54, self.cache.size)
+
+
+    @override_settings(CACHE_COMPRESSION=[])
     def test_cache_should_generate_cache_index_file_sorted_by_path_length(self):
         self.assertFalse(os.path.isfile(self.cache.index_filename))
         self.cache.add('test1.html', None, None, '<h1>Hello Foo</h1>', minify_html=False)
@@ -178,6 +196,135 @@ class CMSCacheInvalidateTestCase(CubaneTestCase):
         self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, self.cache.index_filename)))
 
 
+    def test_write_should_generate_dependency_index(self):
+        self.cache.add('foo.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.add('bar.html', None, None, '<h1>Bar</h1>', minify_html=False)
+        self.cache.set_dependencies('foo.html', ['testapp.testmodel:1', 'testapp.testmodel'])
+        self.cache.write()
+        self.assertEqual({
+            'testapp.testmodel:1': ['foo.html'],
+            'testapp.testmodel': ['foo.html'],
+            Cache.ANY_DEPENDENCY: ['bar.html']
+        }, self.cache.get_dependency_index())
+
+
+    def test_get_dependency_index_should_return_none_if_no_index_exists(self):
+        self.assertIsNone(self.cache.get_dependency_index())
+
+
+    def test_invalidate_dependencies_should_only_invalidate_dependent_files(self):
+        self.cache.add('foo.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.add('bar.html', None, None, '<h1>Bar</h1>', minify_html=False)
+        self.cache.add('test.html', None, None, '<h1>Test</h1>', minify_html=False)
+        self.cache.set_dependencies('foo.html', ['testapp.testmodel:1'])
+        self.cache.set_dependencies('bar.html', ['testapp.testmodel:2'])
+        self.cache.write()
+        self.assertFalse(self.cache.publish_required())
+
+        # test.html has no known dependencies and is always invalidated
+        self.assertEqual(2, self.cache.invalidate_dependencies(['testapp.testmodel:1']))
+        self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'foo.html')))
+        self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, '.foo.html')))
+        self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'bar.html')))
+        self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'test.html')))
+
+        # index is kept, but we need to publish again
+        self.assertTrue(os.path.isfile(self.cache.index_filename))
+        self.assertTrue(self.cache.publish_required())
+
+
+    def test_invalidate_dependencies_should_invalidate_all_without_dependency_index(self):
+        self.cache.add('foo.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.add('bar.html', None, None, '<h1>Bar</h1>', minify_html=False)
+        self.cache.set_index(self.cache.filenames)
+        self.assertEqual(2, self.cache.invalidate_dependencies(['testapp.testmodel:1']))
+        self.assertFalse(os.path.isfile(self.cache.index_filename))
+
+
+    def test_write_should_reset_partial_invalidation(self):
+        self.cache.add('foo.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.cache.invalidate_dependencies(['testapp.testmodel:1'])
+        self.assertTrue(self.cache.publish_required())
+
+        self.cache = Cache()
+        self.cache.add('foo.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.assertFalse(self.cache.publish_required())
+
+
+    @override_settings(CACHE_COMPRESSION=['gzip'])
+    def test_add_should_write_gzip_version_with_same_mtime(self):
+        lastmod = datetime(2016, 6, 18, 16, 55, 23)
+        self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        path = os.path.join(settings.CACHE_ROOT, 'index.html.gz')
+        with gzip.open(path, 'rb') as f:
+            self.assertEqual('<h1>Foo</h1>', f.read())
+        self.assertEqual(lastmod, self._get_cache_mtime('index.html.gz'))
+
+
+    @override_settings(CACHE_COMPRESSION=['gzip'])
+    def test_write_should_add_compressed_versions_to_index(self):
+        self.cache.add('index.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.assertEqual(['index.html.gz', 'index.html'], self.cache.get_index())
+        self.assertEqual(1, self.cache.items)
+
+
+    @override_settings(CACHE_COMPRESSION=['gzip'])
+    def test_invalidate_should_rename_compressed_versions(self):
+        lastmod = datetime(2016, 6, 18, 16, 55, 23)
+        self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        self.assertEqual(1, self.cache.invalidate())
+        self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'index.html.gz')))
+        self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, '.index.html.gz')))
+
+        # restore (not changed)
+        self.cache = Cache()
+        self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'index.html.gz')))
+        self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, '.index.html.gz')))
+
+
+    def test_add_should_generate_missing_compressed_version_if_not_changed(self):
+        lastmod = datetime(2016, 6, 18, 16, 55, 23)
+        with self.settings(CACHE_COMPRESSION=[]):
+            self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+            self.cache.write()
+            self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'index.html.gz')))
+
+        with self.settings(CACHE_COMPRESSION=['gzip']):
+            self.cache = Cache()
+            self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+            self.cache.write()
+            self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'index.html.gz')))
+            self.assertEqual(lastmod, self._get_cache_mtime('index.html.gz'))
+
+
+    @override_settings(CACHE_COMPRESSION=[])
+    def test_cleanup_should_remove_compressed_versions_if_compression_is_disabled(self):
+        with self.settings(CACHE_COMPRESSION=['gzip']):
+            self.cache.add('index.html', None, None, '<h1>Foo</h1>', minify_html=False)
+            self.cache.write()
+
+        self.cache = Cache()
+        self.cache.add('index.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.cache.cleanup()
+        self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'index.html')))
+        self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'index.html.gz')))
+
+
+    def test_get_cache_dependency_key_should_identify_model_and_instance(self):
+        self.assertEqual('testapp.testmodel', get_cache_dependency_key(TestModel))
+        self.assertEqual('testapp.testmodel:5', get_cache_dependency_key(TestModel, 5))
+
+
     def test_add_file_to_cache_should_set_last_modification_timestamp(self):
         # build cache
         lastmod = datetime(2016, 6, 18, 16, 55, 23)
@@ -205,15 +352,97 @@ class CMSCacheInvalidateTestCase(CubaneTestCase):
         # add updated content with a newer timestamp again (changed)
         new_lastmod = datetime(2016, 6, 18, 17, 55, 23)
         self.cache = Cache()
-        self.cache.add('index.html', new_lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.add('index.html', new_lastmod, None, '<h1>Bar</h1>', minify_html=False)
         self.cache.write()
 
         # invalidated version should have been removed
         self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, '.index.html')))
-        self.assertEqual('<h1>Foo</h1>', file_get_contents(os.path.join(settings.CACHE_ROOT, 'index.html')))
+        self.assertEqual('<h1>Bar</h1>', file_get_contents(os.path.join(settings.CACHE_ROOT, 'index.html')))
         self.assertEqual(new_lastmod, self._get_cache_mtime('index.html'))
 
 
+    def test_add_file_to_cache_should_not_rewrite_identical_content_with_newer_timestamp(self):
+        lastmod = datetime(2016, 6, 18, 16, 55, 23)
+        self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        self.cache = Cache()
+        new_lastmod = datetime(2016, 6, 18, 17, 55, 23)
+        size, changed = self.cache.add('index.html', new_lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        self.assertFalse(changed)
+        self.assertEqual(set(), self.cache.changed_filenames)
+        self.assertEqual(lastmod, self._get_cache_mtime('index.html'))
+
+
+    def test_get_mtime_should_return_timestamp_of_identical_content_with_newer_timestamp(self):
+        lastmod = datetime(2016, 6, 18, 16, 55, 23)
+        self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        self.cache = Cache()
+        new_lastmod = datetime(2016, 6, 18, 17, 55, 23)
+        self.cache.add('index.html', new_lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        # file is kept, but content is not considered to be changed again
+        self.cache = Cache()
+        self.assertEqual(lastmod, self._get_cache_mtime('index.html'))
+        self.assertEqual(new_lastmod, self.cache.get_mtime('index.html'))
+        size, changed = self.cache.add('index.html', new_lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.assertFalse(changed)
+
+
+    def test_add_file_to_cache_should_restore_invalidated_identical_content(self):
+        lastmod = datetime(2016, 6, 18, 16, 55, 23)
+        self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.cache.invalidate()
+
+        self.cache = Cache()
+        new_lastmod = datetime(2016, 6, 18, 17, 55, 23)
+        size, changed = self.cache.add('index.html', new_lastmod, True, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        self.assertFalse(changed)
+        self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, '.index.html')))
+        self.assertEqual(lastmod, self._get_cache_mtime('index.html'))
+
+
+    def test_add_file_to_cache_should_record_changed_content(self):
+        self.cache.add('index.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        self.cache = Cache()
+        size, changed = self.cache.add('index.html', None, True, '<h1>Bar</h1>', minify_html=False)
+        self.cache.write()
+
+        self.assertTrue(changed)
+        self.assertEqual(set(['index.html']), self.cache.changed_filenames)
+        self.assertEqual('<h1>Bar</h1>', file_get_contents(os.path.join(settings.CACHE_ROOT, 'index.html')))
+
+
+    def test_write_should_generate_digest_index(self):
+        lastmod = datetime(2016, 6, 18, 16, 55, 23)
+        self.cache.add('index.html', lastmod, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.assertEqual(
+            {'index.html': [
+                hashlib.sha1(b'<h1>Foo</h1>').hexdigest(),
+                int(time.mktime(lastmod.timetuple()))
+            ]},
+            decode_json(file_get_contents(self.cache.digest_index_filename))
+        )
+
+
+    def test_invalidate_should_keep_digest_index(self):
+        self.cache.add('index.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+        self.cache.invalidate()
+        self.assertTrue(os.path.isfile(self.cache.digest_index_filename))
+
+
     def test_add_file_to_cache_should_rename_invalidated_content_if_not_changed(self):
         # build cache
         lastmod = datetime(2016, 6, 18, 16, 55, 23)
@@ -279,12 +508,54 @@ class CMSCacheInvalidateTestCase(CubaneTestCase):
             self.assertTrue(self.cache.publish_required(), 'Deleting instance of %s did not invalidate cache.' % model)
 
 
+    def test_save_cms_model_should_only_invalidate_dependent_cache_files(self):
+        a = TestModel(title='a')
+        a.save()
+        b = TestModel(title='b')
+        b.save()
+        try:
+            self.cache.add('a.html', None, None, '<h1>A</h1>', minify_html=False)
+            self.cache.add('b.html', None, None, '<h1>B</h1>', minify_html=False)
+            self.cache.set_dependencies('a.html', [get_cache_dependency_key(TestModel, a.pk)])
+            self.cache.set_dependencies('b.html', [get_cache_dependency_key(TestModel, b.pk)])
+            self.cache.write()
+
+            a.title = 'changed'
+            a.save()
+
+            self.assertTrue(self.cache.publish_required())
+            self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'a.html')))
+            self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'b.html')))
+        finally:
+            a.delete()
+            b.delete()
+
+
+    @override_settings(CACHE_PARTIAL_INVALIDATION=False)
+    def test_save_cms_model_should_invalidate_all_if_partial_invalidation_disabled(self):
+        a = TestModel(title='a')
+        a.save()
+        try:
+            self.cache.add('a.html', None, None, '<h1>A</h1>', minify_html=False)
+            self.cache.add('b.html', None, None, '<h1>B</h1>', minify_html=False)
+            self.cache.set_dependencies('b.html', ['testapp.testmodel:0'])
+            self.cache.write()
+
+            a.save()
+
+            self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'a.html')))
+            self.assertFalse(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'b.html')))
+            self.assertFalse(os.path.isfile(self.cache.index_filename))
+        finally:
+            a.delete()
+
+
     def test_should_minify_html_content(self):
         self.cache.add('index.html', None, None, '<h1>Foo</h1>    <p>Test</p>', minify_html=True)
         self.cache.write()
         self.assertFileContent(
             os.path.join(settings.CACHE_ROOT, 'index.html'),
-            '<html><head></head><body><h1>Foo</h1><p>Test</p></body></html>'
+            '<h1>Foo</h1> <p>Test</p>'
         )
 
 
@@ -293,14 +564,57 @@ class CMSCacheInvalidateTestCase(CubaneTestCase):
         self.cache.write()
         self.assertFileContent(
             os.path.join(settings.CACHE_ROOT, 'index.html'),
-            '<html><head></head><body><source src="https://video.m4v" type="video/m4v"></body></html>',
-            '<html><head></head><body><source src="https://video.m4v" type="video/m4v"/></body></html>'
+            '<source src="https://video.m4v" type="video/m4v">'
+        )
+
+
+    def test_should_minify_html_content_across_chunks(self):
+        content = '<p>  Hello   <b>World</b>  </p>\n' * 10000
+        self.cache.add('index.html', None, None, content, minify_html=True)
+        self.cache.write()
+        self.assertFileContent(
+            os.path.join(settings.CACHE_ROOT, 'index.html'),
+            ' '.join(['<p>Hello <b>World</b> </p>'] * 10000)
         )
 
 
-    @mock.patch('cubane.cms.cache.html_minify')
-    def test_should_ignore_error_minifying_content(self, html_minify):
-        html_minify.side_effect = Exception('Boom!')
+    def test_add_should_write_utf8_encoded_content(self):
+        self.cache.add('index.html', None, None, '<p>Caf\xe9</p>'.encode('utf-8'), minify_html=True)
+        self.cache.add('foo.html', None, None, '<p>Caf\xe9</p>', minify_html=False)
+        self.cache.write()
+        self.assertEqual('<p>Caf\xe9</p>', file_get_contents(os.path.join(settings.CACHE_ROOT, 'index.html')))
+        self.assertEqual('<p>Caf\xe9</p>', file_get_contents(os.path.join(settings.CACHE_ROOT, 'foo.html')))
+
+
+    def test_add_should_not_leave_temporary_files_behind(self):
+        self.cache.add('foo/index.html', None, None, '<h1>Foo</h1>', minify_html=True)
+        self.cache.add('foo/index.html', None, True, '<h1>Foo</h1>', minify_html=True)
+        self.assertEqual(
+            ['index.html', 'index.html.gz'],
+            sorted(os.listdir(os.path.join(settings.CACHE_ROOT, 'foo')))
+        )
+
+
+    def test_add_should_write_files_readable_by_web_server(self):
+        self.cache.add('index.html', None, None, '<h1>Foo</h1>', minify_html=True)
+        mode = os.stat(os.path.join(settings.CACHE_ROOT, 'index.html')).st_mode
+        self.assertTrue(mode & stat.S_IROTH)
+
+
+    @mock.patch('cubane.cms.cache.os.rename')
+    def test_add_should_not_replace_existing_file_if_writing_fails(self, rename):
+        self.cache.add('index.html', None, None, '<h1>Foo</h1>', minify_html=False)
+
+        rename.side_effect = OSError('Boom!')
+        with self.assertRaises(OSError):
+            self.cache.add('index.html', None, True, '<h1>Bar</h1>', minify_html=False)
+
+        self.assertEqual('<h1>Foo</h1>', file_get_contents(os.path.join(settings.CACHE_ROOT, 'index.html')))
+
+
+    @mock.patch('cubane.cms.cache.html_minify_stream')
+    def test_should_ignore_error_minifying_content(self, html_minify_stream):
+        html_minify_stream.side_effect = Exception('Boom!')
         self.cache.add('index.html', None, None, '<h1>Foo</h1>    <p>Test</p>', minify_html=True)
         self.cache.write()
         self.assertFileContent(
@@ -330,6 +644,22 @@ class CMSCacheInvalidateTestCase(CubaneTestCase):
         self.assertFalse(os.path.isdir(os.path.join(settings.CACHE_ROOT, 'test', 'foo')))
 
 
+    def test_cleanup_should_remove_nested_empty_folders_but_keep_folders_with_cached_files(self):
+        self.cache.add('foo/index.html', None, None, '<h1>Foo</h1>', minify_html=False)
+        self.cache.write()
+
+        os.makedirs(os.path.join(settings.CACHE_ROOT, 'foo', 'bar', 'baz'))
+        os.makedirs(os.path.join(settings.CACHE_ROOT, 'test', 'a', 'b'))
+        file_put_contents(os.path.join(settings.CACHE_ROOT, 'test', 'a', 'b', 'index.html'), 'Test')
+
+        self.assertEqual(1, self.cache.cleanup())
+
+        self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'foo', 'index.html')))
+        self.assertFalse(os.path.isdir(os.path.join(settings.CACHE_ROOT, 'foo', 'bar')))
+        self.assertFalse(os.path.isdir(os.path.join(settings.CACHE_ROOT, 'test')))
+        self.assertTrue(os.path.isfile(self.cache.index_filename))
+
+
     def _get_cache_mtime(self, filename):
         """
         Return the last modification timestamp for the given cache file as
@@ -338,3 +668,143 @@ class CMSCacheInvalidateTestCase(CubaneTestCase):
         return datetime.fromtimestamp(
             os.path.getmtime(os.path.join(settings.CACHE_ROOT, filename))
         )
+
+
+@CubaneTestCase.benchmark()
+class CMSCacheCleanupBenchmarkTestCase(CubaneTestCase):
+    """
+    cubane.cms.cache.Cache.cleanup()
+    """
+    FILES = 100000
+    STALE_FILES = 1000
+
+
+    def setUp(self):
+        self.cache = Cache()
+        self.cache.clear()
+
+
+    def tearDown(self):
+        self.cache.clear()
+
+
+    def test_cleanup_of_large_cache(self):
+        # publish synthetic cache files, 100 files per folder
+        start = time.time()
+        for i in range(0, self.FILES):
+            filename = 'section-%d/page-%d/index.html' % (i / 100, i)
+            self.cache.add(filename, None, True, '<h1>%d</h1>' % i, minify_html=False)
+        self.cache.write()
+        publish_time = time.time() - start
+
+        # stale content the cache is not aware of (within stale folders)
+        for i in range(0, self.STALE_FILES):
+            path = os.path.join(settings.CACHE_ROOT, 'stale-%d' % (i / 100), 'page-%d' % i)
+            os.makedirs(path)
+            file_put_contents(os.path.join(path, 'index.html'), 'Stale')
+
+        # cleanup
+        start = time.time()
+        n = self.cache.cleanup()
+        cleanup_time = time.time() - start
+
+        self.assertEqual(self.STALE_FILES, n)
+        self.assertFalse(os.path.isdir(os.path.join(settings.CACHE_ROOT, 'stale-0')))
+        self.assertTrue(os.path.isfile(os.path.join(settings.CACHE_ROOT, 'section-0', 'page-0', 'index.html')))
+
+        self.report_benchmark('Cache cleanup', [
+            ('Files published', self.FILES),
+            ('Stale files removed', n),
+            ('Publish time (sec)', '%.2f' % publish_time),
+            ('Cleanup time (sec)', '%.2f' % cleanup_time),
+        ])
+
+
+@CubaneTestCase.benchmark()
+@override_settings(CACHE_COMPRESSION=[])
+class CMSCacheWriteBenchmarkTestCase(CubaneTestCase):
+    """
+    cubane.cms.cache.Cache.add()
+    """
+    PAGES = 10
+    PAGE_BLOCKS = 2000
+
+
+    def setUp(self):
+        self.cache = Cache()
+        self.cache.clear()
+
+
+    def tearDown(self):
+        self.cache.clear()
+
+
+    def test_minify_and_write_large_pages(self):
+        content = ''.join([
+            '<div class="product">\n' +
+            '    <h2>  Product %d </h2>\n' % i +
+            '    <p>Lorem  ipsum   <b>dolor</b> sit amet, <a href="/p/%d/">more</a></p>\n' % i +
+            '    <!-- product %d -->\n' % i +
+            '    <picture><source srcset="/media/%d.webp"></source><img src="/media/%d.jpg"></picture>\n' % (i, i) +
+            '</div>\n'
+            for i in range(0, self.PAGE_BLOCKS)
+        ])
+        mb = len(content.encode('utf-8')) * self.PAGES / (1024.0 * 1024.0)
+
+        legacy_time, legacy_memory = self._measure(self._add_legacy, content)
+        streaming_time, streaming_memory = self._measure(self._add_streaming, content)
+
+        self.report_benchmark('Minify and write cached pages', [
+            ('Pages written', self.PAGES),
+            ('Content (MB)', '%.2f' % mb),
+            ('Legacy throughput (MB/sec)', '%.2f' % (mb / legacy_time)),
+            ('Streaming throughput (MB/sec)', '%.2f' % (mb / streaming_time)),
+            ('Legacy peak memory (KB)', legacy_memory),
+            ('Streaming peak memory (KB)', streaming_memory),
+        ])
+
+
+    def _add_legacy(self, filename, content):
+        """
+        Minify the entire content and write it to the cache, which is how the
+        cache system used to write content.
+        """
+        from htmlmin.minify import html_minify
+
+        fullpath = os.path.join(settings.CACHE_ROOT, filename)
+        path = os.path.dirname(fullpath)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        content = html_minify(content).replace('</source>', '')
+        with codecs.open(fullpath, 'w', 'utf-8') as f:
+            f.write(content)
+
+
+    def _add_streaming(self, filename, content):
+        self.cache.add(filename, None, True, content, minify_html=True)
+
+
+    def _measure(self, func, content):
+        """
+        Write all pages using the given function within a separate process
+        and return the time in seconds and the growth of the peak memory
+        usage of the process (KB).
+        """
+        queue = multiprocessing.Queue()
+
+        def _run():
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.time()
+            for i in range(0, self.PAGES):
+                func('page-%d/index.html' % i, content)
+            queue.put((
+                time.time() - start,
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+            ))
+
+        p = multiprocessing.Process(target=_run)
+        p.start()
+        result = queue.get()
+        p.join()
+        return result
@@ -3,15 +3,59 @@ from __future__ import unicode_literals
 from django.conf import settings
 from django.test.utils import override_settings
 from django.core.management import call_command
+from django.http import HttpResponse
 from cubane.tests.base import CubaneTestCase
 from cubane.cms.tests.views import CMSViewsCMSBaseTestCase
-from cubane.cms.views import get_cms, fake_request
+from cubane.cms import get_page_model
+from cubane.cms.cache import get_cache_dependency_key
+from cubane.cms.cachegen import CacheGenerator
+from cubane.cms.views import get_cms, fake_request, RenderResponse
 from cubane.cms.models import Page
 from cubane.testapp.models import TestModel, Settings
 from freezegun import freeze_time
 from datetime import datetime
 import os
 import shutil
+import mock
+
+
+class FakePublishResults(object):
+    """
+    Results of publish jobs that have been executed by FakePublishPool.
+    """
+    def __init__(self, results):
+        self.results = iter(results)
+
+
+    def next(self, timeout=None):
+        return next(self.results)
+
+
+class FakePublishPool(object):
+    """
+    Executes publish jobs within the current process rather than distributing
+    them over a pool of worker processes.
+    """
+    def __init__(self, processes, initializer=None):
+        self.processes = processes
+        if initializer:
+            initializer()
+
+
+    def imap_unordered(self, func, iterable):
+        return FakePublishResults([func(args) for args in iterable])
+
+
+    def close(self):
+        pass
+
+
+    def terminate(self):
+        pass
+
+
+    def join(self):
+        pass
 
 
 class CMSCacheGenMaterialiseTemplateContextTestCase(CubaneTestCase):
@@ -57,6 +101,130 @@ class CMSCacheGenMaterialiseTemplateContextTestCase(CubaneTestCase):
         self.assertIsInstance(d.get('info').get('objects'), list)
 
 
+class CMSCacheGenDependenciesTestCase(CubaneTestCase):
+    """
+    cubane.cms.cachegen.CacheGenerator.get_dependencies_from_template_context()
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(CMSCacheGenDependenciesTestCase, cls).setUpClass()
+        cls.generator = get_cms().get_cache_generator()
+        cls.a = TestModel(title='a')
+        cls.a.save()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.a.delete()
+        super(CMSCacheGenDependenciesTestCase, cls).tearDownClass()
+
+
+    def test_should_depend_on_instance(self):
+        self.assertEqual(
+            set(['testapp.testmodel:%d' % self.a.pk]),
+            self.generator.get_dependencies_from_template_context({'object': self.a})
+        )
+
+
+    def test_should_depend_on_model_for_list_of_instances(self):
+        self.assertEqual(
+            set(['testapp.testmodel:%d' % self.a.pk, 'testapp.testmodel']),
+            self.generator.get_dependencies_from_template_context({'info': {'objects': [self.a]}})
+        )
+
+
+    def test_should_depend_on_model_of_materialised_queryset(self):
+        d = {'objects': TestModel.objects.none()}
+        collection_models = []
+        self.generator.materialise_template_context(d, collection_models=collection_models)
+        self.assertEqual(
+            set(['testapp.testmodel']),
+            self.generator.get_dependencies_from_template_context(d, collection_models)
+        )
+
+
+    def test_should_depend_on_page_model_for_navigation(self):
+        self.assertEqual(
+            set([get_cache_dependency_key(get_page_model())]),
+            self.generator.get_dependencies_from_template_context({'nav': {}})
+        )
+
+
+    def test_should_ignore_unsaved_instances(self):
+        self.assertEqual(
+            set(),
+            self.generator.get_dependencies_from_template_context({'object': TestModel()})
+        )
+
+
+def fake_render_page_by_url(cms, filepath, url, args, cache_generator=None):
+    """
+    Render a page without accessing the database.
+    """
+    return RenderResponse(
+        HttpResponse('<p>%s</p>' % filepath),
+        filepath=filepath,
+        mtime=datetime(2017, 1, 1),
+        changed=True
+    )
+
+
+class CMSCacheGenParallelPublishTestCase(CubaneTestCase):
+    """
+    cubane.cms.cachegen.CacheGenerator._process_publish_jobs_parallel()
+    """
+    def setUp(self):
+        self.cms = get_cms()
+        self.generator = self.cms.get_cache_generator()
+        self.generator.terminate_lock = self.generator._get_lock('cache-terminate')
+        self.generator.quit = False
+        self.jobs = [('url', 'page', [], 'page-%d/index.html' % i) for i in range(8)]
+        self.patchers = [
+            mock.patch.object(self.cms.__class__, 'render_page_by_url', fake_render_page_by_url),
+            mock.patch('cubane.cms.cachegen.multiprocessing.Pool', FakePublishPool)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        if os.path.exists(settings.CACHE_ROOT):
+            shutil.rmtree(settings.CACHE_ROOT)
+
+
+    def test_should_not_terminate_workers_rendering_pages(self):
+        self.generator._process_publish_jobs_parallel(self.jobs, 4)
+        self.assertFalse(self.generator.quit)
+        self.assertEqual(
+            set([job[3] for job in self.jobs]),
+            set(self.generator.cache.filenames)
+        )
+
+
+    def test_should_terminate_if_another_process_requests_termination(self):
+        lock = self.generator._get_lock('cache-terminate')
+        lock.acquire()
+        try:
+            self.generator._process_publish_jobs_parallel(self.jobs, 2)
+        finally:
+            lock.release()
+
+        self.assertTrue(self.generator.quit)
+        self.assertTrue(len(self.generator.cache.filenames) < len(self.jobs))
+
+
+    def test_should_process_jobs_sequentially_within_transaction(self):
+        with mock.patch('cubane.cms.cachegen.multiprocessing.Pool') as pool:
+            self.generator._process_publish_jobs_with_workers(self.jobs, 4)
+        self.assertFalse(pool.called)
+        self.assertEqual(
+            set([job[3] for job in self.jobs]),
+            set(self.generator.cache.filenames)
+        )
+
+
 class CMSCacheGenPublishTestCase(CMSViewsCMSBaseTestCase):
     @classmethod
     def setUpClass(cls):
@@ -153,6 +321,98 @@ class CMSCacheGenPublishTestCase(CMSViewsCMSBaseTestCase):
         self.assertEqual(cache_size >= 0, True)
 
 
+    @mock.patch('cubane.cms.cachegen.multiprocessing.Pool', FakePublishPool)
+    @mock.patch.object(CacheGenerator, '_in_atomic_block', lambda self: False)
+    def test_should_merge_cache_files_generated_by_multiple_workers(self):
+        settings = self.set_settings_vars({
+            'paging_enabled': True,
+            'paging_child_pages': ['blog_blogpost'],
+            'page_size': 2
+        })
+        self.page.entity_type = 'BlogPost'
+        self.page.save()
+        child_page_one = self.create_child_page(2)
+        child_page_two = self.create_child_page(3)
+        child_page_three = self.create_child_page(4)
+        cache_items, cache_size, _ = self.cms.publish(True, workers=4)
+        self.assertEqual(cache_items, 6, 'There should be 6 cache files as there is pagination.')
+        self.assertTrue(cache_size > 0)
+        self.assertEqual(6, len(self.generator.cache.get_index()))
+
+
+    def test_get_publish_jobs_should_return_pages_and_child_pages(self):
+        self.page.entity_type = 'BlogPost'
+        self.page.save()
+        self.assertEqual(
+            [('page', self.page), ('child_page', self.child_page)],
+            self.generator.get_publish_jobs()
+        )
+
+
+    @override_settings(CACHE_PUBLISH_WORKERS=3)
+    def test_get_publish_workers_should_default_to_settings(self):
+        self.assertEqual(3, self.generator.get_publish_workers())
+
+
+    def test_get_publish_workers_should_return_at_least_one_worker(self):
+        self.assertEqual(1, self.generator.get_publish_workers(0))
+        self.assertEqual(1, self.generator.get_publish_workers(-2))
+        self.assertEqual(1, self.generator.get_publish_workers('not a number'))
+
+
+    def test_publish_should_consume_journal(self):
+        self.generator.cache.add_to_journal(['testapp.testmodel:1'])
+        self.cms.publish(True)
+        self.assertFalse(os.path.isfile(self.generator.cache.journal_filename))
+        self.assertFalse(os.path.isfile(self.generator.cache.publish_journal_filename))
+
+
+    def test_publish_should_record_source_of_cache_files(self):
+        self.cms.publish(True)
+        self.assertEqual(
+            {self.page.get_filepath(): ['instance', get_cache_dependency_key(Page, self.page.pk)]},
+            self.generator.cache.get_source_index()
+        )
+
+
+    def test_incremental_publish_should_keep_unaffected_content(self):
+        self.cms.publish(True)
+        cache_items, cache_size, _ = self.cms.publish(True, incremental=True)
+        self.assertEqual(1, cache_items)
+        self.assertTrue(cache_size > 0)
+        self.assertEqual([self.page.get_filepath()], [
+            filename for filename in self.generator.cache.get_index()
+            if not filename.endswith('.gz')
+        ])
+
+
+    def test_incremental_publish_jobs_should_include_changed_child_page_and_listing_pages(self):
+        self.page.entity_type = 'BlogPost'
+        self.page.save()
+        self.cms.publish(True)
+
+        self.child_page.title = 'Changed'
+        self.child_page.save()
+
+        jobs, filenames = self.generator.get_incremental_publish_jobs(
+            self.generator.cache.begin_journal()
+        )
+        self.assertEqual([('page', self.page), ('child_page', self.child_page)], jobs)
+        self.assertIn(self.child_page.get_filepath(), filenames)
+
+
+    def test_incremental_publish_jobs_should_require_full_publish_if_nothing_published(self):
+        self.assertIsNone(self.generator.get_incremental_publish_jobs(set(['testapp.testmodel:1'])))
+
+
+    def test_incremental_publish_jobs_should_require_full_publish_for_global_changes(self):
+        self.cms.publish(True)
+        self.cms.invalidate()
+        self.assertIsNone(self.generator.get_incremental_publish_jobs(
+            self.generator.cache.begin_journal()
+        ))
+
+
     def test_should_determine_updated_on_from_page(self):
         [m.delete() for m in TestModel.objects.all()]
         [s.delete() for s in Settings.objects.all()]
@@ -0,0 +1,127 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.test.client import RequestFactory
+from cubane.tests.base import CubaneTestCase
+from cubane.cms.contentmap import ContentMap, compile_patterns
+import time
+
+
+class CMSContentMapTestCase(CubaneTestCase):
+    """
+    cubane.cms.contentmap.ContentMap
+    """
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.content_map = ContentMap()
+
+
+    def test_should_return_content_without_rules(self):
+        self.assertEqual('Hello {FOO}', self.content_map.apply(self.request, 'Hello {FOO}', {}))
+
+
+    def test_should_replace_all_rules_at_once(self):
+        self.content_map.add('{FOO}', 'foo')
+        self.content_map.add('{BAR}', 'bar')
+        self.assertEqual(
+            'foo bar foo {BAZ}',
+            self.content_map.apply(self.request, '{FOO} {BAR} {FOO} {BAZ}', {})
+        )
+
+
+    def test_should_render_template_with_named_groups(self):
+        self.content_map.add(r'{FOO (?P<name>\w+)}', '<b>{{ name }}</b>{{ subject }}')
+        self.assertEqual(
+            'Hello <b>World</b>!',
+            self.content_map.apply(self.request, 'Hello {FOO World}', {'subject': '!'})
+        )
+
+
+    def test_should_call_callable_with_named_groups(self):
+        self.content_map.add(r'{FOO (?P<name>\w+)}', lambda request, context: context.get('name').upper())
+        self.assertEqual('Hello WORLD', self.content_map.apply(self.request, 'Hello {FOO World}', {}))
+
+
+    def test_should_support_same_group_name_in_multiple_rules(self):
+        self.content_map.add(r'{FOO (?P<name>\w+)}', 'foo:{{ name }}')
+        self.content_map.add(r'{BAR (?P<name>\w+)}', 'bar:{{ name }}')
+        self.assertEqual(
+            'foo:a bar:b',
+            self.content_map.apply(self.request, '{FOO a} {BAR b}', {})
+        )
+
+
+    def test_should_support_named_group_references(self):
+        self.content_map.add(r'{(?P<tag>\w+)}(?P<text>.*?){/(?P=tag)}', '[{{ text }}]')
+        self.assertEqual('a [b] c', self.content_map.apply(self.request, 'a {x}b{/x} c', {}))
+
+
+    def test_should_apply_rules_sequentially_if_patterns_cannot_be_combined(self):
+        self.content_map.add(r'{(\w+)}(.*?){/\1}', 'replaced')
+        self.content_map.add(r'{FOO}', 'foo')
+        self.assertIsNone(compile_patterns([rule.pattern for rule in self.content_map.rules()]))
+        self.assertEqual('replaced foo', self.content_map.apply(self.request, '{x}b{/x} {FOO}', {}))
+
+
+    def test_should_replace_existing_rule_for_same_pattern(self):
+        self.content_map.add('{FOO}', 'foo')
+        self.content_map.add('{FOO}', 'bar')
+        self.assertEqual(1, len(self.content_map))
+        self.assertEqual('bar', self.content_map.apply(self.request, '{FOO}', {}))
+
+
+    def test_should_compile_template_once(self):
+        a = ContentMap()
+        b = ContentMap()
+        a.add('{FOO}', '{{ subject }}')
+        b.add('{FOO}', '{{ subject }}')
+        self.assertTrue(a.rules()[0].contains_template_code)
+        self.assertIs(a.rules()[0].template, b.rules()[0].template)
+
+
+    def test_should_not_modify_given_context(self):
+        context = {'subject': 'a'}
+        self.content_map.add(r'{FOO (?P<subject>\w+)}', '{{ subject }}')
+        self.assertEqual('b', self.content_map.apply(self.request, '{FOO b}', context))
+        self.assertEqual({'subject': 'a'}, context)
+
+
+@CubaneTestCase.benchmark()
+class CMSContentMapBenchmarkTestCase(CubaneTestCase):
+    """
+    cubane.cms.contentmap.ContentMap
+    """
+    RULES = 50
+    RENDERS = 100
+
+
+    def test_apply_50_rules_to_large_page(self):
+        request = RequestFactory().get('/')
+        content_map = ContentMap()
+        for i in range(self.RULES):
+            if i % 2 == 0:
+                content_map.add('{RULE%d}' % i, 'Replacement %d' % i)
+            else:
+                content_map.add(r'{RULE%d (?P<name>\w+)}' % i, '<b>{{ name }}</b>')
+
+        # a large page with a placeholder in every 10th paragraph
+        paragraphs = []
+        for i in range(1000):
+            if i % 10 == 0:
+                paragraphs.append('<p>Lorem ipsum {RULE%d} {RULE%d word}</p>' % (i % self.RULES, (i + 1) % self.RULES))
+            else:
+                paragraphs.append('<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>')
+        content = ''.join(paragraphs)
+
+        result = [('Rules', self.RULES), ('Content length', len(content))]
+        for label, apply in [('combined', content_map.apply), ('sequential', content_map.apply_sequential)]:
+            start = time.time()
+            for _ in range(self.RENDERS):
+                apply(request, content, {})
+            elapsed = time.time() - start
+            result.append(('Time per page in ms (%s)' % label, '%.2f' % (1000 * elapsed / self.RENDERS)))
+
+        self.assertEqual(
+            content_map.apply_sequential(request, content, {}),
+            content_map.apply(request, content, {})
+        )
+        self.report_benchmark('Content mapping', result)
@@ -4,11 +4,14 @@ from django.conf import settings
 from django.test.utils import override_settings
 from django.utils.safestring import SafeText
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.template import Template, Context
 from cubane.tests.base import CubaneTestCase
 from cubane.cms.models import ChildPageWithoutParentError
 from cubane.cms.models import PageBase, Page, MediaGallery, SettingsBase
 from cubane.cms.models import get_child_page_models
 from cubane.cms.models import get_child_page_model_choices
+from cubane.cms.models import decode_content_data
 from cubane.media.models import Media
 from cubane.testapp.models import CustomChildPage
 from cubane.testapp.models import TestModel
@@ -16,6 +19,8 @@ from cubane.testapp.models import Settings
 from cubane.testapp.models import TestDirectoryChildPageAggregator
 from cubane.blog.models import BlogPost
 from datetime import datetime
+from mock import patch
+import time
 
 
 class CMSModelsEditableContentMixinTestCase(CubaneTestCase):
@@ -107,6 +112,142 @@ class CMSModelsEditableContentMixinTestCase(CubaneTestCase):
         self.assertEqual({}, self.page.content_by_slot())
 
 
+    def test_get_data_should_decode_content_once(self):
+        self.page.set_slot_content('content', '<h1>Test</h1>')
+        with patch('cubane.cms.models.decode_content_data', wraps=decode_content_data) as decode:
+            self.page.get_slot_content('content')
+            self.page.get_slot_content('content')
+            self.page.slotnames_with_content()
+            self.page.content_by_slot()
+            self.page.get_data()
+        self.assertEqual(1, decode.call_count)
+
+
+    def test_set_data_should_invalidate_decoded_content(self):
+        self.page.set_slot_content('content', 'Foo')
+        self.assertEqual('Foo', self.page.get_slot_content('content'))
+        self.page.set_slot_content('content', 'Bar')
+        self.assertEqual('Bar', self.page.get_slot_content('content'))
+
+
+    def test_assigning_encoded_data_should_invalidate_decoded_content(self):
+        other = Page()
+        other.set_slot_content('content', 'Bar')
+        self.page.set_slot_content('content', 'Foo')
+        self.assertEqual('Foo', self.page.get_slot_content('content'))
+        self.page._data = other._data
+        self.assertEqual('Bar', self.page.get_slot_content('content'))
+
+
+    def test_get_data_should_not_expose_decoded_content(self):
+        self.page.set_slot_content('content', 'Foo')
+        self.page.get_data()['content'] = 'Bar'
+        self.assertEqual('Foo', self.page.get_slot_content('content'))
+
+
+    @override_settings(CMS_CONTENT_ENCODING='pickle')
+    def test_set_data_should_pickle_content_by_default(self):
+        self.page.set_data({'content': 'Foo'})
+        self.assertFalse(self.page._data.startswith('{'))
+        self.assertEqual({'content': 'Foo'}, decode_content_data(self.page._data))
+
+
+    @override_settings(CMS_CONTENT_ENCODING='json')
+    def test_set_data_should_encode_content_as_json(self):
+        self.page.set_data({'content': 'Foo'})
+        self.assertEqual('{"content":"Foo"}', self.page._data)
+        self.assertEqual({'content': 'Foo'}, self.page.get_data())
+
+
+    @override_settings(CMS_CONTENT_ENCODING='json')
+    def test_set_data_should_pickle_content_that_is_not_a_dict(self):
+        self.page.set_data('Hello World')
+        self.assertFalse(self.page._data.startswith('{'))
+        self.assertEqual('Hello World', self.page.get_data())
+
+
+    @override_settings(CMS_CONTENT_ENCODING='json')
+    def test_get_data_should_decode_legacy_pickled_content(self):
+        with self.settings(CMS_CONTENT_ENCODING='pickle'):
+            self.page.set_slot_content('content', 'Foo')
+        self.assertEqual('Foo', Page(_data=self.page._data).get_slot_content('content'))
+
+
+class CMSModelsEditableContentMixinEncodeCommandTestCase(CubaneTestCase):
+    """
+    cubane.cms.management.commands.encode_content
+    """
+    def tearDown(self):
+        Page.objects.all().delete()
+
+
+    @override_settings(CMS_CONTENT_ENCODING='json')
+    def test_should_re_encode_legacy_content(self):
+        page = Page(title='Foo', slug='foo')
+        with self.settings(CMS_CONTENT_ENCODING='pickle'):
+            page.set_slot_content('content', 'Foo')
+        page.save()
+        updated_on = Page.objects.get(pk=page.pk).updated_on
+
+        with patch('cubane.cms.management.commands.encode_content.out'):
+            call_command('encode_content')
+
+        page = Page.objects.get(pk=page.pk)
+        self.assertEqual('{"content":"Foo"}', page._data)
+        self.assertEqual(updated_on, page.updated_on)
+
+
+    @override_settings(CMS_CONTENT_ENCODING='json')
+    def test_should_not_re_encode_in_simulation_mode(self):
+        page = Page(title='Foo', slug='foo')
+        with self.settings(CMS_CONTENT_ENCODING='pickle'):
+            page.set_slot_content('content', 'Foo')
+        page.save()
+
+        with patch('cubane.cms.management.commands.encode_content.out'):
+            call_command('encode_content', simulate=True)
+
+        self.assertEqual(page._data, Page.objects.get(pk=page.pk)._data)
+
+
+@CubaneTestCase.benchmark()
+@override_settings(CMS_SLOTNAMES=['slot%d' % i for i in range(12)])
+class CMSModelsEditableContentMixinBenchmarkTestCase(CubaneTestCase):
+    """
+    cubane.cms.models.EditableContentMixin
+    """
+    RENDERS = 1000
+
+
+    def test_render_page_with_many_slots(self):
+        template = Template(
+            '{% load cms_tags %}' +
+            ''.join(["{%% slot '%s' %%}" % slotname for slotname in settings.CMS_SLOTNAMES])
+        )
+
+        result = []
+        for encoding in ['pickle', 'json']:
+            with self.settings(CMS_CONTENT_ENCODING=encoding):
+                page = Page()
+                for slotname in settings.CMS_SLOTNAMES:
+                    page.set_slot_content(slotname, '<p>%s</p>' % ('Lorem ipsum dolor sit amet. ' * 50))
+
+                # each render loads the page's content freshly from the database
+                pages = [Page(_data=page._data) for _ in range(self.RENDERS)]
+                with patch('cubane.cms.models.decode_content_data', wraps=decode_content_data) as decode:
+                    start = time.time()
+                    for p in pages:
+                        template.render(Context({'page': p}))
+                    elapsed = time.time() - start
+
+                result.extend([
+                    ('Decodes per render (%s)' % encoding, '%.1f' % (decode.call_count / float(self.RENDERS))),
+                    ('Renders per second (%s)' % encoding, '%.0f' % (self.RENDERS / elapsed))
+                ])
+
+        self.report_benchmark('Render page with %d slots' % len(settings.CMS_SLOTNAMES), result)
+
+
 class CMSModelsExcerptMixinTestCase(CubaneTestCase):
     @classmethod
     def setUpClass(cls):
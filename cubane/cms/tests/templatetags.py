@@ -13,6 +13,7 @@ from cubane.media.models import Media
 from cubane.lib.paginator import create_paginator
 from cubane.testapp.models import Settings
 from mock import Mock, patch
+import cubane.cms.templatetags.cms_tags
 import datetime
 
 
@@ -596,6 +597,106 @@ class CMSSlotTestCase(CubaneTestCase):
         }
 
 
+class CMSSlotCacheTestCase(CubaneTestCase):
+    """
+    cubane.cms.templatetags.cms_tags.SlotNode (cached content)
+    """
+    def setUp(self):
+        clear_slot_cache()
+        self.page = Page(id=1, updated_on=datetime.datetime(2016, 1, 1))
+        self.page.set_slot_content('content', '<h1>Page</h1><a href="#link[Page:2]">Foo</a>')
+        self.page_links = {'Page': {'2': Page(id=2, slug='foo')}}
+
+
+    def tearDown(self):
+        clear_slot_cache()
+
+
+    def test_should_render_slot_content_only_once(self):
+        with patch('cubane.cms.templatetags.cms_tags.rewrite_slot_content', wraps=rewrite_slot_content) as rewrite:
+            a = self._render()
+            b = self._render()
+        self.assertEqual('<h1>Page</h1><a href="http://www.testapp.cubane.innershed.com/foo/">Foo</a>', a)
+        self.assertEqual(a, b)
+        self.assertEqual(1, rewrite.call_count)
+
+
+    def test_should_render_again_if_page_changed(self):
+        self._render()
+        self.page.updated_on = datetime.datetime(2016, 1, 2)
+        self.page.set_slot_content('content', '<h1>Changed</h1>')
+        self.assertEqual('<h1>Changed</h1>', self._render())
+
+
+    def test_should_cache_content_per_headline_transpose(self):
+        self.assertEqual('<h1>Page</h1>', self._render(slot="'content'", page_links=None)[:13])
+        self.assertEqual('<h3>Page</h3>', self._render(slot="'content' 2", page_links=None)[:13])
+
+
+    def test_should_render_again_if_page_link_changed(self):
+        self._render()
+        self.page_links = {'Page': {'2': Page(id=2, slug='bar')}}
+        self.assertIn('http://www.testapp.cubane.innershed.com/bar/', self._render())
+
+
+    def test_should_render_again_if_image_changed(self):
+        with patch('cubane.cms.templatetags.cms_tags.rewrite_slot_content', wraps=rewrite_slot_content) as rewrite:
+            self._render(images={1: Media(id=1, updated_on=datetime.datetime(2016, 1, 1))})
+            self._render(images={1: Media(id=1, updated_on=datetime.datetime(2016, 1, 1))})
+            self._render(images={1: Media(id=1, updated_on=datetime.datetime(2016, 1, 2))})
+        self.assertEqual(2, rewrite.call_count)
+
+
+    def test_should_not_cache_unsaved_page(self):
+        self.page.id = None
+        with patch('cubane.cms.templatetags.cms_tags.rewrite_slot_content', wraps=rewrite_slot_content) as rewrite:
+            self._render()
+            self._render()
+        self.assertEqual(2, rewrite.call_count)
+
+
+    def test_should_not_cache_in_preview_mode(self):
+        with patch('cubane.cms.templatetags.cms_tags.rewrite_slot_content', wraps=rewrite_slot_content) as rewrite:
+            self._render(cms_preview=True)
+            self._render(cms_preview=True)
+        self.assertEqual(2, rewrite.call_count)
+
+
+    @override_settings(CMS_SLOT_CACHE_SIZE=0)
+    def test_should_not_cache_if_disabled(self):
+        with patch('cubane.cms.templatetags.cms_tags.rewrite_slot_content', wraps=rewrite_slot_content) as rewrite:
+            self._render()
+            self._render()
+        self.assertEqual(2, rewrite.call_count)
+
+
+    def test_should_run_content_pipeline_if_not_cacheable(self):
+        cms_class = get_cms().__class__
+        with patch.object(cms_class, 'is_content_pipeline_cacheable', return_value=False):
+            with patch.object(cms_class, 'on_render_content_pipeline', side_effect=['<p>A</p>', '<p>B</p>', '<p>A</p>']):
+                with patch('cubane.cms.templatetags.cms_tags.rewrite_slot_content', wraps=rewrite_slot_content) as rewrite:
+                    self.assertEqual('<p>A</p>', self._render())
+                    self.assertEqual('<p>B</p>', self._render())
+                    self.assertEqual('<p>A</p>', self._render())
+        self.assertEqual(2, rewrite.call_count)
+
+
+    @override_settings(CMS_SLOT_CACHE_SIZE=2)
+    def test_should_clear_cache_when_full(self):
+        for i in range(3):
+            self._render(slot="'content' %d" % i)
+        self.assertEqual(1, len(cubane.cms.templatetags.cms_tags._SLOT_CACHE))
+
+
+    def _render(self, slot="'content'", page_links=True, **kwargs):
+        context = {
+            'page': self.page,
+            'page_links': self.page_links if page_links else {}
+        }
+        context.update(kwargs)
+        return Template("{%% load cms_tags %%}{%% slot %s %%}" % slot).render(Context(context))
+
+
 class CMSGoogleAnalyticsKeyTestCase(CubaneTestCase):
     @override_settings(DEBUG=True, DEBUG_GOOGLE_ANALYTICS='12345678')
     def test_should_return_default_analytics_key_for_debugging_if_configured(self):
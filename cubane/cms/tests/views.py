@@ -8,10 +8,14 @@ from django.template.context import Context
 from django.template.defaultfilters import slugify
 from django.db.models.query import QuerySet
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import caches
 from django.contrib.auth.models import User
 from cubane.tests.base import CubaneTestCase
 from cubane.cms.tests.base import CMSTestBase
 from cubane.cms.views import *
+from cubane.cms.nav import NAVIGATION_VERSION_KEY, invalidate_navigation_cache
 from cubane.cms.models import Page, MediaGallery
 from cubane.directory.models import DirectoryTag
 from cubane.blog.models import BlogPost
@@ -21,6 +25,10 @@ from cubane.testapp.models import TestGroupedModelA, TestDirectoryContent, TestD
 from cubane.testapp.views import TestAppCMS
 from mock import Mock, patch
 from datetime import datetime
+import cubane.cms.views
+import multiprocessing
+import tempfile
+import shutil
 import json
 
 
@@ -680,6 +688,82 @@ class CMSViewsNavigationTestCase(CMSViewsPageContextBaseTestCase):
         return None
 
 
+@override_settings(CMS_NAVIGATION_CACHE_ALIAS=None)
+class CMSViewsNavigationCacheTestCase(CMSViewsPageContextBaseTestCase):
+    """
+    cubane.cms.nav.CMSNavigationBuilder (process-wide navigation cache)
+    """
+    def setUp(self):
+        super(CMSViewsNavigationCacheTestCase, self).setUp()
+        invalidate_navigation_cache()
+        self.cms = get_cms()
+
+
+    def tearDown(self):
+        super(CMSViewsNavigationCacheTestCase, self).tearDown()
+        invalidate_navigation_cache()
+
+
+    def test_should_not_query_pages_again(self):
+        self._get_navigation(self.page)
+        with CaptureQueriesContext(connection) as ctx:
+            nav = self._get_navigation(self.page)
+        self.assertEqual(0, len(ctx.captured_queries))
+        self.assertEqual([self.page.pk], [item.get('id') for item in nav.get('header')])
+
+
+    @override_settings(CMS_NAVIGATION_INCLUDE_CHILD_PAGES=True)
+    def test_should_not_query_child_pages_again(self):
+        self._get_navigation(self.page)
+        with CaptureQueriesContext(connection) as ctx:
+            nav = self._get_navigation(self.page)
+        self.assertEqual(0, len(ctx.captured_queries))
+        self.assertEqual(10, len(nav.get('header')[0].get('posts')))
+
+
+    def test_should_mark_active_page_for_each_request(self):
+        other = self.create_page('Other', seq=1)
+        self.assertEqual([True, False], [item.get('active') for item in self._get_navigation(self.page).get('header')])
+        self.assertEqual([False, True], [item.get('active') for item in self._get_navigation(other).get('header')])
+
+
+    def test_should_load_pages_again_after_content_changed(self):
+        self._get_navigation(self.page)
+        page = self.create_page('Other', seq=1)
+        self.assertEqual(
+            [self.page.pk, page.pk],
+            [item.get('id') for item in self._get_navigation(self.page).get('header')]
+        )
+
+
+    @override_settings(CMS_NAVIGATION_CACHE=False)
+    def test_should_query_pages_every_time_if_disabled(self):
+        self._get_navigation(self.page)
+        with CaptureQueriesContext(connection) as ctx:
+            self._get_navigation(self.page)
+        self.assertTrue(len(ctx.captured_queries) > 0)
+
+
+    @override_settings(CMS_NAVIGATION_CACHE_ALIAS='default', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    })
+    def test_should_load_pages_again_if_version_changed_by_other_process(self):
+        self._get_navigation(self.page)
+
+        # another process changed content
+        Page.objects.filter(pk=self.page.pk).update(title='Changed')
+        caches['default'].set(NAVIGATION_VERSION_KEY, 'other', None)
+
+        self.assertEqual('Changed', self._get_navigation(self.page).get('header')[0].get('title'))
+
+
+    def _get_navigation(self, page):
+        context = self.cms.get_page_context(create_fake_request(path=''), page=page)
+        builder = context.get_navigation_builder(active_page=page, current_page_or_child_page=page)
+        nav, active_nav, pages = builder.get_navigation()
+        return nav
+
+
 class CMSViewsGetHomepageTestCase(CMSViewsPageContextBaseTestCase):
     def test_raises_404_if_no_homepage_defined(self):
         with self.assertRaises(Http404):
@@ -1311,6 +1395,95 @@ class CMSViewsGetSettingsModelTestCase(CubaneTestCase):
         self.assertRaises(ValueError, _get_settings_model)
 
 
+class CMSViewsSettingsCacheTestCase(CubaneTestCase):
+    """
+    cubane.cms.views.get_cms_settings_or_none()
+    cubane.cms.views.clear_settings_cache()
+    """
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            CACHES={
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': self.tmp
+                }
+            },
+            CMS_SETTINGS_CACHE_ALIAS='default',
+            CMS_SETTINGS_CACHE_CHECK_INTERVAL=0
+        )
+        self.settings_override.enable()
+        clear_settings_cache()
+
+
+    def tearDown(self):
+        self.settings_override.disable()
+        clear_settings_cache()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+    def test_should_load_settings_once(self):
+        with patch('cubane.cms.views.load_cms_settings', side_effect=lambda: Mock()) as load:
+            s = get_cms_settings_or_none()
+            self.assertIs(s, get_cms_settings_or_none())
+        self.assertEqual(1, load.call_count)
+
+
+    def test_should_reload_settings_if_changed_by_other_process(self):
+        with patch('cubane.cms.views.load_cms_settings', side_effect=lambda: Mock()):
+            s = get_cms_settings_or_none()
+            caches['default'].set(SETTINGS_VERSION_KEY, 'changed', None)
+            self.assertIsNot(s, get_cms_settings_or_none())
+
+
+    @override_settings(CMS_SETTINGS_CACHE_CHECK_INTERVAL=60)
+    def test_should_not_check_version_again_within_check_interval(self):
+        with patch('cubane.cms.views.load_cms_settings', side_effect=lambda: Mock()):
+            s = get_cms_settings_or_none()
+            caches['default'].set(SETTINGS_VERSION_KEY, 'changed', None)
+            self.assertIs(s, get_cms_settings_or_none())
+
+
+    def test_should_determine_related_fields_once(self):
+        cubane.cms.views._SETTINGS_RELATED_FIELDS.pop(Settings, None)
+        with patch('cubane.cms.views.get_fields', side_effect=lambda model: []) as _get_fields:
+            related = get_settings_related_fields(Settings)
+            self.assertIs(related, get_settings_related_fields(Settings))
+        self.assertEqual(1, _get_fields.call_count)
+        cubane.cms.views._SETTINGS_RELATED_FIELDS.pop(Settings, None)
+
+
+    def test_should_invalidate_settings_of_all_processes(self):
+        def worker(primed_id, changed, results):
+            results.put(id(get_cms_settings_or_none()) == primed_id)
+            changed.wait(10)
+            results.put(id(get_cms_settings_or_none()) == primed_id)
+
+        with patch('cubane.cms.views.load_cms_settings', side_effect=lambda: Mock()):
+            s = get_cms_settings_or_none()
+            changed = multiprocessing.Event()
+            results = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(target=worker, args=(id(s), changed, results))
+                for _ in range(3)
+            ]
+            for p in workers:
+                p.start()
+
+            try:
+                # all workers share the settings loaded by the parent process
+                self.assertEqual([True] * 3, [results.get(timeout=10) for _ in workers])
+
+                # changing settings in the parent invalidates all workers
+                clear_settings_cache()
+                changed.set()
+                self.assertEqual([False] * 3, [results.get(timeout=10) for _ in workers])
+            finally:
+                changed.set()
+                for p in workers:
+                    p.join(10)
+
+
 class CMSViewGetPageModelTestCase(CubaneTestCase):
     @override_settings(CMS_PAGE_MODEL='cubane.testapp.models.CustomPage')
     def test_get_page_model_returns_correct_model_if_custom_model_defined(self):
@@ -1348,6 +1521,39 @@ class CMSViewOnRenderContentPipelinePatcher(CubaneTestCase):
         self.assertEqual('Hello BAR', result)
 
 
+class CMSViewIsContentPipelineCacheableTestCase(CubaneTestCase):
+    """
+    cubane.cms.views.CMS.is_content_pipeline_cacheable()
+    """
+    def test_should_be_cacheable_without_content_mapping(self):
+        self.assertTrue(CMS().is_content_pipeline_cacheable())
+
+
+    def test_should_be_cacheable_with_text_replacement(self):
+        cms = CMS()
+        cms.map_content('FOO', 'BAR')
+        self.assertTrue(cms.is_content_pipeline_cacheable())
+
+
+    def test_should_not_be_cacheable_with_template_code(self):
+        cms = CMS()
+        cms.map_content('FOO', '{{ subject }}')
+        self.assertFalse(cms.is_content_pipeline_cacheable())
+
+
+    def test_should_not_be_cacheable_with_callable(self):
+        cms = CMS()
+        cms.map_content('FOO', lambda request, context: 'BAR')
+        self.assertFalse(cms.is_content_pipeline_cacheable())
+
+
+    def test_should_not_be_cacheable_if_on_render_content_is_overridden(self):
+        class CustomCMS(CMS):
+            def on_render_content(self, request, content):
+                return content
+        self.assertFalse(CustomCMS().is_content_pipeline_cacheable())
+
+
 class CMSViewGetSitemapTestCase(CubaneTestCase):
     def setUp(self):
         self.cms = get_cms()
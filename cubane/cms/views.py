@@ -2,10 +2,9 @@
 from __future__ import unicode_literals
 from django.conf import settings
 from django.http import HttpRequest, HttpResponse, Http404
-from django.http import HttpResponseRedirect, HttpResponsePermanentRedirect, FileResponse
+from django.http import HttpResponseRedirect, HttpResponsePermanentRedirect
 from django.test import RequestFactory
 from django.core import urlresolvers
-from django.template import engines
 from django.core.urlresolvers import reverse_lazy, reverse, resolve
 from django.core.exceptions import FieldDoesNotExist
 from django.shortcuts import render, get_object_or_404
@@ -24,7 +23,9 @@ from cubane.cms.models import SettingsBase
 from cubane.cms.models import PageAbstract, PageBase, Page, ChildPage, Entity, MediaGallery
 from cubane.cms.cache import Cache, CacheContext
 from cubane.cms.cachegen import CacheGenerator
-from cubane.cms.nav import CMSNavigationBuilder
+from cubane.cms.batch import get_content_change_batch
+from cubane.cms.contentmap import ContentMap
+from cubane.cms.nav import CMSNavigationBuilder, invalidate_navigation_cache
 from cubane.cms.sitemap import SitemapSection
 from cubane.decorators import template
 from cubane.views import View, ModelView, view, view_url
@@ -45,14 +46,22 @@ from cubane.lib.mail import cubane_send_mail_template
 from cubane.lib.mail import get_ordered_list_of_fields
 from cubane.lib.mail import send_exception_email
 from cubane.lib.text import char_range
-from cubane.lib.template import get_compatible_template
+from cubane.lib.sendfile import sendfile
+from cubane.lib.version import get_version_stamp, bump_version_stamp
 from datetime import datetime
+import time
 import re
 import os
-import copy
 
 
 _SETTINGS_CACHE = None
+_SETTINGS_CACHE_VERSION = None
+_SETTINGS_CACHE_CHECKED_ON = None
+_SETTINGS_RELATED_FIELDS = {}
+
+
+# cache key of the settings version stamp (shared cache)
+SETTINGS_VERSION_KEY = 'cubane_cms_settings_version'
 
 
 PAGE_PATTERN = '^(?P<slug>.*)$'
@@ -117,24 +126,20 @@ def get_settings_model():
             )
 
 
-def get_cms_settings_or_none():
+def get_settings_related_fields(settings_model):
     """
-    Return the cms settings if exists or none.
+    Return the list of related fields that are loaded together with the
+    given settings model (cached).
     """
-    global _SETTINGS_CACHE
-
-    if _SETTINGS_CACHE == None:
-        Settings = get_settings_model()
-
-        # determine related fields required
+    if settings_model not in _SETTINGS_RELATED_FIELDS:
         related = ['country']
         if 'cubane.ishop' in settings.INSTALLED_APPS:
             from cubane.ishop.models import ShopSettings
-            if issubclass(Settings, ShopSettings):
+            if issubclass(settings_model, ShopSettings):
                 related.append('image_placeholder')
 
         # find all foreign relationships and load them as well
-        for field in get_fields(Settings):
+        for field in get_fields(settings_model):
             if isinstance(field, ForeignKey):
                 # skip DateTimeBase fields
                 if field.name in ['created_by', 'updated_by', 'deleted_by']:
@@ -143,13 +148,56 @@ def get_cms_settings_or_none():
                 if field.name not in related:
                     related.append(field.name)
 
-        # get settings
-        try:
-            s = Settings.objects.select_related(*related)[0]
-        except (Settings.DoesNotExist, IndexError) as e:
-            s = None
+        _SETTINGS_RELATED_FIELDS[settings_model] = related
+
+    return _SETTINGS_RELATED_FIELDS[settings_model]
+
+
+def load_cms_settings():
+    """
+    Load the cms settings from the database or return None.
+    """
+    Settings = get_settings_model()
+    try:
+        return Settings.objects.select_related(*get_settings_related_fields(Settings))[0]
+    except (Settings.DoesNotExist, IndexError) as e:
+        return None
+
+
+def validate_settings_cache():
+    """
+    Clear the settings cache if settings have been changed by any other
+    process since the settings were loaded. The shared version stamp is
+    checked at most once per CMS_SETTINGS_CACHE_CHECK_INTERVAL seconds.
+    """
+    global _SETTINGS_CACHE, _SETTINGS_CACHE_CHECKED_ON
 
-        _SETTINGS_CACHE = s
+    if _SETTINGS_CACHE is None:
+        return
+
+    now = time.time()
+    if _SETTINGS_CACHE_CHECKED_ON is not None and now - _SETTINGS_CACHE_CHECKED_ON < settings.CMS_SETTINGS_CACHE_CHECK_INTERVAL:
+        return
+
+    _SETTINGS_CACHE_CHECKED_ON = now
+    if get_version_stamp(SETTINGS_VERSION_KEY, settings.CMS_SETTINGS_CACHE_ALIAS) != _SETTINGS_CACHE_VERSION:
+        _SETTINGS_CACHE = None
+
+
+def get_cms_settings_or_none():
+    """
+    Return the cms settings if exists or none.
+    """
+    global _SETTINGS_CACHE, _SETTINGS_CACHE_VERSION, _SETTINGS_CACHE_CHECKED_ON
+
+    validate_settings_cache()
+
+    if _SETTINGS_CACHE == None:
+        # the version is determined first, so that we would not miss any
+        # changes that are made while loading settings
+        _SETTINGS_CACHE_VERSION = get_version_stamp(SETTINGS_VERSION_KEY, settings.CMS_SETTINGS_CACHE_ALIAS)
+        _SETTINGS_CACHE_CHECKED_ON = time.time()
+        _SETTINGS_CACHE = load_cms_settings()
 
     return _SETTINGS_CACHE
 
@@ -168,15 +216,23 @@ def get_cms_settings():
         return s
 
 
-def clear_settings_cache():
+def clear_local_settings_cache():
     """
-    Clear settings cache.
+    Clear settings cache for the current process only.
     """
     global _SETTINGS_CACHE
 
     _SETTINGS_CACHE = None
 
 
+def clear_settings_cache():
+    """
+    Clear settings cache for all processes.
+    """
+    clear_local_settings_cache()
+    bump_version_stamp(SETTINGS_VERSION_KEY, settings.CMS_SETTINGS_CACHE_ALIAS)
+
+
 class RedirectException(Exception):
     """
     Identifies a request where we need to redirect to the given url.
@@ -1436,7 +1492,7 @@ class CMS(View):
         Create a new instance of the CMS class.
         """
         super(CMS, self).__init__(*args, **kwargs)
-        self._content_map = {}
+        self._content_map = ContentMap()
 
 
     @classmethod
@@ -1491,15 +1547,7 @@ class CMS(View):
         content will be replaced with the given replacement string. The pattern
         will match any text or content in the format {pattern}.
         """
-        key = '{%s}' % pattern
-        if callable(replacement):
-            is_callable = True
-            contains_template_code = False
-        else:
-            is_callable = False
-            contains_template_code = '{{' in replacement or '{%' in replacement
-
-        self._content_map[key] = (replacement, contains_template_code, is_callable)
+        self._content_map.add('{%s}' % pattern, replacement)
 
 
     def get_pages(self):
@@ -1800,33 +1848,29 @@ class CMS(View):
         ultimately rendered.
         """
         # execute content mapping
-        for pattern, repl in self._content_map.items():
-            if re.search(pattern, content):
-                (replacement, contains_template_code, is_callable) = repl
-                c = copy.copy(context)
-
-                if contains_template_code:
-                    django_engine = engines['django']
-                    template = django_engine.from_string(replacement)
-                else:
-                    template = None
-
-                def patcher(m):
-                    if is_callable:
-                        c.update(m.groupdict())
-                        return replacement(request, c)
-                    elif template:
-                        c.update(m.groupdict())
-                        return get_compatible_template(template).render(c)
-                    else:
-                        return replacement
-
-                content = re.sub(pattern, patcher, content)
+        content = self._content_map.apply(request, content, context)
 
         # allow user code to run
         return self.on_render_content(request, content)
 
 
+    def is_content_pipeline_cacheable(self):
+        """
+        Return True, if the result of the content pipeline only depends on the
+        given content itself, which is the case if all content mapping rules
+        are plain text replacements and on_render_content() has not been
+        overridden.
+        """
+        if self.on_render_content.__func__ is not CMS.on_render_content.__func__:
+            return False
+
+        for rule in self._content_map.rules():
+            if rule.contains_template_code or rule.is_callable:
+                return False
+
+        return True
+
+
     def on_render_content(self, request, content):
         """
         Virtual: Called whenever a snippet of the given content will be rendered
@@ -2328,6 +2372,17 @@ class CMS(View):
         pass
 
 
+    def on_cache_content_changed(self, filenames, verbose=False):
+        """
+        Virtual: Called after publishing content with the list of cache
+        filenames whose content actually changed, for example in order to
+        purge such content from a content delivery network. Content that
+        has been rendered again but is identical to the content that was
+        published before is not included.
+        """
+        pass
+
+
     def get_cache_generator(self):
         """
         Return a new instance of the cache generator.
@@ -2336,12 +2391,13 @@ class CMS(View):
         return CacheGenerator(self, cache)
 
 
-    def publish(self, verbose=False):
+    def publish(self, verbose=False, workers=None, incremental=False):
         """
-        Publish cms content.
+        Publish cms content. If incremental is True, only content that is
+        affected by changes since the last publish is generated.
         """
         generator = self.get_cache_generator()
-        return generator.publish(verbose)
+        return generator.publish(verbose, workers, incremental)
 
 
     def invalidate(self, verbose=False):
@@ -2361,29 +2417,83 @@ class CMS(View):
         return generator.clear_cache(verbose)
 
 
-    def notify_content_changed(self, sender, bases, delete=False):
+    def invalidate_instance(self, instance, verbose=False):
+        """
+        Invalidates all CMS content from the cache which depends on the given
+        model instance.
+        """
+        generator = self.get_cache_generator()
+        return generator.invalidate_instance(instance, verbose)
+
+
+    def invalidate_instances(self, instances, verbose=False):
+        """
+        Invalidates all CMS content from the cache which depends on any of the
+        given model instances.
+        """
+        generator = self.get_cache_generator()
+        return generator.invalidate_instances(instances, verbose)
+
+
+    def notify_content_changed(self, sender, bases, delete=False, instance=None):
         """
         Should be called by the backend system whenever any content as part
         of the website's content model has been changed or deleted. The given
         deleted flag should be set to True, if an entity has been deleted.
+        If the changed model instance is given, only cached content that
+        depends on the given instance is invalidated.
         """
         # is target entity of any relevance?
         if not issubclass(sender, bases):
             return
 
+        # collect changes within a batch, otherwise process them right away
+        batch = get_content_change_batch()
+        if batch is not None:
+            batch.add(sender, delete, instance)
+
+            # changed settings must be visible for the rest of the batch,
+            # other processes are notified once the batch is processed
+            if issubclass(sender, SettingsBase):
+                clear_local_settings_cache()
+        else:
+            self.on_content_changed([(sender, delete, instance)])
+
+
+    def on_content_changed(self, changes):
+        """
+        Process the given list of content changes at once, where each change
+        is a tuple of sender, delete flag and the changed model instance (or
+        None). The cache is invalidated once for all changes.
+        """
         if settings.CACHE_ENABLED:
             # any CMS entity deleted should reflect this within the settings as a
             # seperate timestamp in order to detect content changes due to content
             # deletion...
-            if delete:
+            if any([delete for sender, delete, instance in changes]):
                 settings_model = get_settings_model()
                 settings_model.objects.update(entity_deleted_on=datetime.now())
 
-            # invalidate cache
-            self.invalidate(verbose=False)
+            # invalidate cache. Settings affect all content and deleting
+            # content affects the last modification timestamp of all content.
+            partial = settings.CACHE_PARTIAL_INVALIDATION and all([
+                instance is not None and
+                instance.pk is not None and
+                not delete and
+                not issubclass(sender, SettingsBase)
+                for sender, delete, instance in changes
+            ])
+            if partial:
+                self.invalidate_instances(
+                    [instance for sender, delete, instance in changes],
+                    verbose=False
+                )
+            else:
+                self.invalidate(verbose=False)
 
-        # invalidate settings cache
+        # invalidate settings and navigation cache
         clear_settings_cache()
+        invalidate_navigation_cache()
 
 
     @view(csrf_exempt)
@@ -2448,12 +2558,13 @@ class CMS(View):
         # get media
         media = get_object_or_404(Media, share_enabled=True, share_filename=filename)
 
-        # serve file
-        f = open(media.original_path, 'rb')
-        response = FileResponse(f)
-        response['Content-Type'] = 'application/force-download'
-        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
-        return response
+        # serve file (may be offloaded to the web server)
+        return sendfile(
+            request,
+            media.original_path,
+            'application/force-download',
+            filename
+        )
 
 
     def append_to_nav(self, nav, items, before=None, after=None):
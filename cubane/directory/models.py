@@ -746,9 +746,8 @@ class DirectoryEntity(DateTimeBase):
 #
 @receiver(post_delete)
 def update_entity_deleted_on(sender, **kwargs):
-    from cubane.cms.views import get_cms
-    cms = get_cms()
-    cms.notify_content_changed(sender, (DirectoryEntity, DirectoryCategory), delete=True)
+    from cubane.cms.batch import notify_content_changed
+    notify_content_changed(sender, (DirectoryEntity, DirectoryCategory), delete=True, instance=kwargs.get('instance'))
 
 
 #
@@ -756,6 +755,5 @@ def update_entity_deleted_on(sender, **kwargs):
 #
 @receiver(post_save)
 def invalidate_cache_on_content_changed(sender, **kwargs):
-    from cubane.cms.views import get_cms
-    cms = get_cms()
-    cms.notify_content_changed(sender, (DirectoryEntity, DirectoryCategory))
+    from cubane.cms.batch import notify_content_changed
+    notify_content_changed(sender, (DirectoryEntity, DirectoryCategory), instance=kwargs.get('instance'))
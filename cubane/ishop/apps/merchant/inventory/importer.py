@@ -2,14 +2,19 @@
 from __future__ import unicode_literals
 from django.conf import settings
 from django.utils.text import slugify
+from django.utils import timezone
 from cubane.lib.utf8 import utf8_stream, DETECT_ENCODING
 from cubane.ishop import get_category_model, get_product_model
 from cubane.ishop.models import Variety, VarietyOption, VarietyAssignment
 from cubane.ishop.models import ProductSKU
 from cubane.cms.views import get_cms
+from cubane.cms.batch import content_change_batch
 from cubane.media.models import Media
 from cubane.media.views import load_media_gallery, save_media_gallery
+from cubane.models import DateTimeBase
+from cubane.lib.model import bulk_update
 from cubane.tasks import TaskRunner
+from collections import OrderedDict
 from copy import copy
 from decimal import Decimal
 import cubane.lib.ucsv as csv
@@ -329,6 +334,9 @@ class ShopDataImporter(object):
         'price'
     ]
 
+    # max. number of records that are looked up or written at once
+    BATCH_SIZE = 500
+
 
     @property
     def has_errors(self):
@@ -351,8 +359,10 @@ class ShopDataImporter(object):
         Create a new shop data importer for the given user.
         """
         self._import_images = import_images
+        self._media = None
 
 
+    @content_change_batch()
     def import_from_stream(self, request, stream, encoding=DETECT_ENCODING):
         """
         Import shop data from given stream, read the data as CSV data, process
@@ -401,6 +411,10 @@ class ShopDataImporter(object):
         self.import_variety_assignments(groups, varieties)
         self.import_product_sku(groups, varieties)
 
+        # products, assignments and SKUs are written in bulk, which does not
+        # send any signals, therefore we invalidate the cache once
+        self.cms.notify_content_changed(get_product_model(), DateTimeBase)
+
         # download and import images, but only if we have not observed any
         # errors yet, otherwise it is likely that we will end up downloading
         # media data for no good reason, since we will revert all changes due
@@ -539,6 +553,20 @@ class ShopDataImporter(object):
             raise ValueError()
 
 
+    def _filter_in_batches(self, queryset, fieldname, values):
+        """
+        Return all objects of the given queryset for which the given field
+        matches any of the given values. The database is queried in batches.
+        """
+        values = list(values)
+        result = []
+        for i in range(0, len(values), self.BATCH_SIZE):
+            result.extend(queryset.filter(**{
+                '%s__in' % fieldname: values[i:i + self.BATCH_SIZE]
+            }))
+        return result
+
+
     def _skip_lines(self, lines):
         """
         Skip given number of lines.
@@ -703,6 +731,7 @@ class ShopDataImporter(object):
         product.
         """
         category_model = get_category_model()
+        imported_categories = {}
         for row in data:
             parent_category = None
             category_titles = []
@@ -711,16 +740,22 @@ class ShopDataImporter(object):
             for category_title in categories:
                 category_titles.append(category_title)
                 slug = slugify('-'.join(category_titles))
-                try:
-                    category = category_model.objects.get(parent=parent_category, slug=slug)
-                except category_model.DoesNotExist:
-                    category = category_model()
-                    category.title = category_title
-                    category.slug = slug
 
-                category.parent = parent_category
-                category.set_nav(settings.CMS_DEFAULT_NAVIGATION)
-                category.save()
+                # each category is only imported once
+                key = (parent_category.pk if parent_category else None, slug)
+                category = imported_categories.get(key)
+                if category is None:
+                    try:
+                        category = category_model.objects.get(parent=parent_category, slug=slug)
+                    except category_model.DoesNotExist:
+                        category = category_model()
+                        category.title = category_title
+                        category.slug = slug
+
+                    category.parent = parent_category
+                    category.set_nav(settings.CMS_DEFAULT_NAVIGATION)
+                    category.save()
+                    imported_categories[key] = category
 
                 parent_category = category
 
@@ -763,23 +798,48 @@ class ShopDataImporter(object):
                 if option != '' and not option in variety._options:
                     variety._options.append(option)
 
-        # create individual options for each variety
+        # fetch existing options for all varieties at once
+        self._variety_options = {}
+        options = VarietyOption.objects.filter(variety__in=varieties)
+        for option in options.order_by('-id'):
+            self._variety_options[(option.variety_id, option.title)] = option
+
+        # create or update individual options for each variety
+        now = timezone.now()
+        created = []
+        updated = []
         for variety in varieties:
             seq = 1
             for option_title in variety._options:
-                try:
-                    option = VarietyOption.objects.get(variety=variety, title=option_title)
-                except VarietyOption.DoesNotExist:
+                option = self._variety_options.get((variety.pk, option_title))
+                if option is None:
                     option = VarietyOption()
                     option.title = option_title
                     option.variety = variety
+                    option.created_on = now
+                    created.append(option)
+                    self._variety_options[(variety.pk, option_title)] = option
+                else:
+                    updated.append(option)
 
                 option.seq = seq
                 option.enabled = True
-                option.save()
+                option.updated_on = now
 
                 seq += 1
 
+        VarietyOption.objects.bulk_create(created, batch_size=self.BATCH_SIZE)
+        bulk_update(updated, ['seq', 'enabled', 'updated_on'], batch_size=self.BATCH_SIZE)
+
+        # determine primary keys of new options (not all databases return
+        # primary keys from bulk_create)
+        if created and created[0].pk is None:
+            titles = set([option.title for option in created])
+            for option in self._filter_in_batches(options, 'title', titles):
+                target = self._variety_options.get((option.variety_id, option.title))
+                if target is not None and target.pk is None:
+                    target.pk = option.pk
+
 
     def import_products(self, data):
         """
@@ -820,8 +880,23 @@ class ShopDataImporter(object):
                     if image not in group.get('images'):
                         group['images'].append(image)
 
-        # process products (groups).
+        # fetch existing products for all groups at once and determine the
+        # products (sku) for all titles and slugs that are in use
         product_model = get_product_model()
+        products = {}
+        for product in self._filter_in_batches(product_model.objects.all(), 'sku', groups.keys()):
+            products.setdefault(product.sku, product)
+
+        skus_by_title = {}
+        skus_by_slug = {}
+        for pk, sku, title, slug in product_model.objects.values_list('pk', 'sku', 'title', 'slug'):
+            skus_by_title.setdefault(title, []).append((pk, sku))
+            skus_by_slug.setdefault(slug, []).append((pk, sku))
+
+        # process products (groups).
+        now = timezone.now()
+        created = []
+        updated = []
         for product_sku, group in groups.items():
             row = group.get('rows')[0]
 
@@ -829,55 +904,117 @@ class ShopDataImporter(object):
             if not group.get('title'):
                 continue
 
-            try:
-                product = product_model.objects.get(sku=product_sku)
-            except product_model.DoesNotExist:
+            product = products.get(product_sku)
+            if product is None:
                 product = product_model()
                 product.sku = product_sku
 
             # title cannot already exist, unless for the product
             # we are working with
             title = group.get('title')
-            products_with_same_title = product_model.objects.filter(title=title)
-            if product.pk:
-                products_with_same_title = products_with_same_title.exclude(pk=product.pk)
-            if products_with_same_title.count() > 0:
+            products_with_same_title = self._get_other_product_skus(skus_by_title, title, product)
+            if products_with_same_title:
                 self._field_error(row, 'title', 'The product title \'%s\' is used multiple times. A product with the same title already exists with the SKUs \'%s\'.' % (
                     title,
-                    ', '.join(['<em>%s</em>' % p.sku for p in products_with_same_title])
+                    ', '.join(['<em>%s</em>' % sku for sku in products_with_same_title])
                 ))
                 continue
 
             # slug cannot already exist, unless for the product
             # we are working with
             slug = slugify(title)
-            products_with_same_slug = product_model.objects.filter(slug=slug)
-            if product.pk:
-                products_with_same_slug = products_with_same_slug.exclude(pk=product.pk)
-            if products_with_same_slug.count() > 0:
+            products_with_same_slug = self._get_other_product_skus(skus_by_slug, slug, product)
+            if products_with_same_slug:
                 self._field_error(row, 'title', 'The product slug \'%s\', which has been automatically generated from the product title \'%s\' already exists. A product with the same title already exists with the SKUs \'%s\'.' % (
                     slug,
                     title,
-                    ', '.join(['<em>%s</em>' % p.sku for p in products_with_same_slug])
+                    ', '.join(['<em>%s</em>' % sku for sku in products_with_same_slug])
                 ))
                 continue
 
+            # maintain titles and slugs in use
+            if product.pk:
+                self._remove_product_sku(skus_by_title, product.title, product)
+                self._remove_product_sku(skus_by_slug, product.slug, product)
+            skus_by_title.setdefault(title, []).append((product.pk, product.sku))
+            skus_by_slug.setdefault(slug, []).append((product.pk, product.sku))
+
             product.title = title
             product.slug = slug
             product.category = group.get('category')
             product.price = group.get('price')
             product.draft = False
             self.on_import_product(product, group)
-            product.save()
+
+            # maintain modification timestamps, since bulk operations do
+            # not call save()
+            if not product.created_on:
+                product.created_on = now
+            product.updated_on = now
+
+            if product.pk:
+                updated.append(product)
+            else:
+                created.append(product)
             group['product'] = product
 
+        # write all products in bulk
+        product_model.objects.bulk_create(created, batch_size=self.BATCH_SIZE)
+        bulk_update(updated, [
+            field.name for field in product_model._meta.concrete_fields
+            if not field.primary_key
+        ], batch_size=self.BATCH_SIZE)
+
+        # determine primary keys of new products (not all databases return
+        # primary keys from bulk_create)
+        if created and created[0].pk is None:
+            created_by_sku = dict([(product.sku, product) for product in created])
+            for pk, sku in self._filter_in_batches(product_model.objects.values_list('pk', 'sku'), 'sku', created_by_sku.keys()):
+                product = created_by_sku.get(sku)
+                if product is not None and product.pk is None:
+                    product.pk = pk
+
         return groups
 
 
+    def _get_other_product_skus(self, skus_by_value, value, product):
+        """
+        Return the list of SKUs of all products (other than the given product)
+        that are using the given value (title or slug).
+        """
+        return [
+            sku for pk, sku in skus_by_value.get(value, [])
+            if product.pk is None or pk != product.pk
+        ]
+
+
+    def _remove_product_sku(self, skus_by_value, value, product):
+        """
+        Remove the given product from the list of products that are using the
+        given value (title or slug).
+        """
+        skus = skus_by_value.get(value, [])
+        if (product.pk, product.sku) in skus:
+            skus.remove((product.pk, product.sku))
+
+
     def import_variety_assignments(self, groups, varieties):
         """
         Import variety assignments
         """
+        products = [group.get('product') for group in groups.values() if group.get('product')]
+
+        # fetch existing assignments for all products at once
+        assignments = {}
+        for pk, product_id, option_id in self._filter_in_batches(
+            VarietyAssignment.objects.values_list('pk', 'product_id', 'variety_option_id'),
+            'product_id',
+            [product.pk for product in products]
+        ):
+            assignments.setdefault(product_id, {})[option_id] = pk
+
+        created = []
+        deprecated_assignment_ids = []
         for product_sku, group in groups.items():
             product = group.get('product')
             if not product:
@@ -886,51 +1023,78 @@ class ShopDataImporter(object):
             variety_options = []
             for row in group.get('rows'):
                 # determine unique set of variety options used by the product
-                for variety, option in zip(varieties, row.get('variety_options')):
-                    if option != '':
-                        option = VarietyOption.objects.get(variety=variety, title=option)
-                        if option not in variety_options:
-                            variety_options.append(option)
+                for option in self._get_variety_options(varieties, row):
+                    if option not in variety_options:
+                        variety_options.append(option)
 
             # assign all varieties to the product
-            assignment_ids = []
+            product_assignments = assignments.get(product.pk, {})
             for option in variety_options:
-                try:
-                    assignment = VarietyAssignment.objects.get(product=product, variety_option=option)
-                except VarietyAssignment.DoesNotExist:
+                if option.pk not in product_assignments:
                     assignment = VarietyAssignment()
                     assignment.product = product
                     assignment.variety_option = option
-                    assignment.save()
-                assignment_ids.append(assignment.id)
+                    created.append(assignment)
 
-            # delete all deprecated assignments
-            deprecated_assignments = VarietyAssignment.objects.filter(product=product).exclude(pk__in=assignment_ids)
-            for assignment in deprecated_assignments:
-                assignment.delete()
+            # all deprecated assignments
+            option_ids = [option.pk for option in variety_options]
+            for option_id, pk in product_assignments.items():
+                if option_id not in option_ids:
+                    deprecated_assignment_ids.append(pk)
+
+        VarietyAssignment.objects.bulk_create(created, batch_size=self.BATCH_SIZE)
+
+        # delete all deprecated assignments
+        for i in range(0, len(deprecated_assignment_ids), self.BATCH_SIZE):
+            VarietyAssignment.objects.filter(pk__in=deprecated_assignment_ids[i:i + self.BATCH_SIZE]).delete()
+
+
+    def _get_variety_options(self, varieties, row):
+        """
+        Return the list of variety options for the given row.
+        """
+        variety_options = []
+        for variety, option in zip(varieties, row.get('variety_options')):
+            if option != '':
+                variety_options.append(self._variety_options[(variety.pk, option)])
+        return variety_options
 
 
     def import_product_sku(self, groups, varieties):
         """
         Import SKU records
         """
+        # fetch existing SKUs for all rows at once
+        skus = {}
+        sku_numbers = [
+            row.get('sku')
+            for group in groups.values() if group.get('product')
+            for row in group.get('rows')
+        ]
+        for sku in self._filter_in_batches(ProductSKU.objects.all(), 'sku', sku_numbers):
+            skus.setdefault(sku.sku, sku)
+
+        created = []
+        updated = []
+        variety_options_by_sku = OrderedDict()
         for product_sku, group in groups.items():
             product = group.get('product')
             if not product:
                 continue
 
             for row in group.get('rows'):
-                variety_options = []
-                for variety, option in zip(varieties, row.get('variety_options')):
-                    if option != '':
-                        option = VarietyOption.objects.get(variety=variety, title=option)
-                        variety_options.append(option)
+                variety_options = self._get_variety_options(varieties, row)
 
-                # generate product skus
-                try:
-                    sku = ProductSKU.objects.get(sku=row.get('sku'))
-                except ProductSKU.DoesNotExist:
+                # generate product skus (the same SKU may appear multiple
+                # times, in which case the last row wins)
+                sku_number = row.get('sku')
+                sku = skus.get(sku_number)
+                if sku is None:
                     sku = ProductSKU()
+                    skus[sku_number] = sku
+                    created.append(sku)
+                elif sku.pk and sku_number not in variety_options_by_sku:
+                    updated.append(sku)
 
                 sku.product = product
                 sku.sku = row.get('sku')
@@ -938,8 +1102,62 @@ class ShopDataImporter(object):
                     sku.price = self._parse_decimal(row.get('price'))
                 except ValueError:
                     self._field_error(row, 'price', 'Unable to parse cell value \'<em>%s</em>\' as a decimal value for field \'price\'.' % row.get('price'))
-                sku.save()
-                sku.variety_options = variety_options
+                variety_options_by_sku[sku_number] = (sku, variety_options)
+
+        # write all SKUs in bulk
+        ProductSKU.objects.bulk_create(created, batch_size=self.BATCH_SIZE)
+        bulk_update(updated, ['product', 'sku', 'price'], batch_size=self.BATCH_SIZE)
+
+        # determine primary keys of new SKUs (not all databases return
+        # primary keys from bulk_create)
+        if created and created[0].pk is None:
+            created_by_sku = dict([(sku.sku, sku) for sku in created])
+            for pk, sku_number in self._filter_in_batches(ProductSKU.objects.values_list('pk', 'sku'), 'sku', created_by_sku.keys()):
+                sku = created_by_sku.get(sku_number)
+                if sku is not None and sku.pk is None:
+                    sku.pk = pk
+
+        self._set_sku_variety_options(variety_options_by_sku.values())
+
+
+    def _set_sku_variety_options(self, variety_options_by_sku):
+        """
+        Assign the given variety options to each SKU, where each item is a
+        tuple of SKU and list of variety options. Many-to-many relationships
+        are added and removed in bulk.
+        """
+        field = ProductSKU._meta.get_field('variety_options')
+        through_model = field.remote_field.through
+        sku_column = field.m2m_column_name()
+        option_column = field.m2m_reverse_name()
+
+        existing = {}
+        for pk, sku_id, option_id in self._filter_in_batches(
+            through_model.objects.values_list('pk', sku_column, option_column),
+            sku_column,
+            [sku.pk for sku, _ in variety_options_by_sku]
+        ):
+            existing.setdefault(sku_id, {})[option_id] = pk
+
+        created = []
+        deprecated_ids = []
+        for sku, variety_options in variety_options_by_sku:
+            sku_options = existing.get(sku.pk, {})
+            option_ids = [option.pk for option in variety_options]
+            for option_id in option_ids:
+                if option_id not in sku_options:
+                    created.append(through_model(**{
+                        sku_column: sku.pk,
+                        option_column: option_id
+                    }))
+                    sku_options[option_id] = None
+            for option_id, pk in sku_options.items():
+                if option_id not in option_ids:
+                    deprecated_ids.append(pk)
+
+        through_model.objects.bulk_create(created, batch_size=self.BATCH_SIZE)
+        for i in range(0, len(deprecated_ids), self.BATCH_SIZE):
+            through_model.objects.filter(pk__in=deprecated_ids[i:i + self.BATCH_SIZE]).delete()
 
 
     def import_images(self, groups):
@@ -953,6 +1171,13 @@ class ShopDataImporter(object):
         """
         Import product images.
         """
+        # fetch or download all media assets for all products at once
+        self.prefetch_media([
+            image_link
+            for group in groups.values() if group.get('product')
+            for image_link in group.get('images', [])
+        ])
+
         # process all products
         for product_sku, group in groups.items():
             product = group.get('product')
@@ -968,7 +1193,8 @@ class ShopDataImporter(object):
             for image_link in image_links:
                 if image_link != '':
                     m = self.download_media(image_link, product_folder)
-                    media.append(m)
+                    if m is not None:
+                        media.append(m)
 
             if len(media) > 0:
                 # assign first image in the set as the main image of the product
@@ -979,22 +1205,65 @@ class ShopDataImporter(object):
                 save_media_gallery(self._request, request, product, media)
 
 
+    def prefetch_media(self, links):
+        """
+        Fetch media assets for all given links at once. Media assets that do
+        not exist yet are created and downloaded concurrently (unless the task
+        runner is available, which will download them eventually). Identical
+        links are only downloaded once.
+        """
+        urls = []
+        for link in links:
+            if link != '':
+                url = self.get_download_link(link)
+                if url not in urls:
+                    urls.append(url)
+
+        # existing media assets
+        self._media = {}
+        for m in self._filter_in_batches(Media.objects.all(), 'external_url', urls):
+            self._media.setdefault(m.external_url, m)
+
+        # create empty media items for all new urls
+        created = []
+        for url in urls:
+            if url not in self._media:
+                m = self.cms.create_blank_external_media(url)
+                self._media[url] = m
+                created.append(m)
+
+        # without task runner, download all new media assets now
+        if created and not TaskRunner.is_available():
+            downloaded = Media.download_many_from_external_source(created)
+            for m in set(created) - set(downloaded):
+                del self._media[m.external_url]
+                m.delete()
+
+
     def download_media(self, url, folder=None):
         """
         Download a media asset with given link (or receive from previously
-        downloaded asset).
+        downloaded asset). Returns None if the media asset could not be
+        downloaded.
         """
         url = self.get_download_link(url)
 
-        try:
-            m = Media.objects.get(external_url=url)
-        except Media.DoesNotExist:
-            # create empty media item
-            if TaskRunner.is_available():
-                m = self.cms.create_blank_external_media(url, folder=folder)
-            else:
-                m = self.cms.create_media_from_url(url, folder=folder)
-                m.external_url = url
+        if self._media is not None:
+            m = self._media.get(url)
+            if m is None:
+                return None
+        else:
+            try:
+                m = Media.objects.get(external_url=url)
+            except Media.DoesNotExist:
+                # create empty media item
+                if TaskRunner.is_available():
+                    m = self.cms.create_blank_external_media(url, folder=folder)
+                else:
+                    m = self.cms.create_media_from_url(url, folder=folder)
+                    if m is None:
+                        return None
+                    m.external_url = url
 
         if m.pk is None or m.parent_id != folder.pk:
             m.parent = folder
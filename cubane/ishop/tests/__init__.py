@@ -1,3 +1,4 @@
 from cubane.ishop.tests.basket import *
 from cubane.ishop.tests.models import *
-from cubane.ishop.tests.views import *
\ No newline at end of file
+from cubane.ishop.tests.views import *
+from cubane.ishop.tests.importer import *
@@ -0,0 +1,192 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.contrib.auth.models import User
+from cubane.tests.base import CubaneTestCase
+from cubane.ishop.apps.merchant.inventory.importer import ShopDataImporter
+from cubane.ishop.models import Variety, VarietyOption, VarietyAssignment
+from cubane.ishop.models import ProductSKU
+from cubane.testapp.models import Category
+from cubane.testapp.models import Product
+from decimal import Decimal
+from StringIO import StringIO
+import time
+
+
+IMPORT_SETTINGS = {
+    'skip': 0,
+    'header': {
+        'sku': 'SKU',
+        'product_sku': 'Product SKU',
+        'title': 'Title',
+        'price': 'Price',
+        'categories': r'Category \d+',
+        'variety_options': r'Option (.+)',
+        'images': r'Image \d+'
+    }
+}
+
+
+@override_settings(CUBANE_SHOP_IMPORT=IMPORT_SETTINGS)
+class ShopDataImporterTestCaseBase(CubaneTestCase):
+    HEADER = ['SKU', 'Product SKU', 'Title', 'Price', 'Category 1', 'Category 2', 'Option Size', 'Option Colour', 'Image 1', 'Image 2']
+
+
+    def tearDown(self):
+        ProductSKU.objects.all().delete()
+        VarietyAssignment.objects.all().delete()
+        VarietyOption.objects.all().delete()
+        Variety.objects.all().delete()
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+
+
+    def get_csv(self, rows):
+        lines = [self.HEADER] + rows
+        return StringIO('\n'.join([
+            ','.join(['"%s"' % cell for cell in line])
+            for line in lines
+        ]).encode('utf-8'))
+
+
+    def get_rows(self, products, skus_per_product=3):
+        rows = []
+        for i in range(products):
+            for j in range(skus_per_product):
+                rows.append([
+                    'P%05d-%d' % (i, j),
+                    'P%05d' % i,
+                    'Product %d' % i,
+                    '%d.99' % (10 + j),
+                    'Clothing',
+                    'Shirts',
+                    'Size %d' % j,
+                    'Red',
+                    '',
+                    ''
+                ])
+        return rows
+
+
+    def import_rows(self, rows):
+        request = RequestFactory().post('/')
+        request.user = User(username='admin')
+
+        importer = ShopDataImporter(import_images=False)
+        importer.import_from_stream(request, self.get_csv(rows), encoding='utf_8')
+        return importer
+
+
+class ShopDataImporterTestCase(ShopDataImporterTestCaseBase):
+    """
+    cubane.ishop.apps.merchant.inventory.importer.ShopDataImporter
+    """
+    def test_import_should_create_products_skus_and_variety_options(self):
+        importer = self.import_rows(self.get_rows(2))
+        self.assertFalse(importer.has_errors)
+
+        products = list(Product.objects.order_by('sku'))
+        self.assertEqual(['P00000', 'P00001'], [p.sku for p in products])
+        self.assertEqual(['product-0', 'product-1'], [p.slug for p in products])
+        self.assertEqual([Decimal('10.99'), Decimal('10.99')], [p.price for p in products])
+        self.assertEqual(['Shirts', 'Shirts'], [p.category.title for p in products])
+        self.assertIsNotNone(products[0].created_on)
+
+        self.assertEqual(
+            ['Colour: Red', 'Size: Size 0', 'Size: Size 1', 'Size: Size 2'],
+            sorted(['%s: %s' % (o.variety.title, o.title) for o in VarietyOption.objects.all()])
+        )
+        self.assertEqual(8, VarietyAssignment.objects.count())
+
+        sku = ProductSKU.objects.get(sku='P00001-2')
+        self.assertEqual(products[1].pk, sku.product_id)
+        self.assertEqual(Decimal('12.99'), sku.price)
+        self.assertEqual(['Red', 'Size 2'], sorted([o.title for o in sku.variety_options.all()]))
+
+
+    def test_import_should_update_existing_products_and_skus(self):
+        self.import_rows(self.get_rows(2))
+        product_ids = list(Product.objects.order_by('sku').values_list('pk', flat=True))
+
+        rows = self.get_rows(2, skus_per_product=2)
+        for row in rows:
+            row[3] = '20.00'
+            row[7] = 'Blue'
+        importer = self.import_rows(rows)
+        self.assertFalse(importer.has_errors)
+
+        self.assertEqual(product_ids, list(Product.objects.order_by('sku').values_list('pk', flat=True)))
+        self.assertEqual([Decimal('20.00')] * 2, [p.price for p in Product.objects.order_by('sku')])
+        self.assertEqual(6, ProductSKU.objects.count())
+
+        # variety assignments of options that are no longer used are removed
+        self.assertEqual(
+            ['Blue', 'Size 0', 'Size 1'],
+            sorted(VarietyAssignment.objects.filter(product_id=product_ids[0]).values_list('variety_option__title', flat=True))
+        )
+
+        sku = ProductSKU.objects.get(sku='P00000-1')
+        self.assertEqual(Decimal('20.00'), sku.price)
+        self.assertEqual(['Blue', 'Size 1'], sorted([o.title for o in sku.variety_options.all()]))
+
+
+    def test_import_should_reject_title_of_another_product(self):
+        Product.objects.create(sku='OTHER', title='Product 1', slug='other')
+        importer = self.import_rows(self.get_rows(2))
+        self.assertTrue(importer.has_errors)
+        self.assertIn('<em>OTHER</em>', importer.get_formatted_errors()[0])
+        self.assertFalse(Product.objects.filter(sku='P00001').exists())
+
+
+    def test_import_should_reject_same_title_used_by_multiple_products_in_file(self):
+        rows = self.get_rows(2, skus_per_product=1)
+        rows[1][2] = 'Product 0'
+        importer = self.import_rows(rows)
+        self.assertTrue(importer.has_errors)
+        self.assertEqual(1, Product.objects.count())
+
+
+    def test_import_should_not_query_database_per_row(self):
+        def count_queries(products):
+            self.tearDown()
+            with CaptureQueriesContext(connection) as ctx:
+                self.import_rows(self.get_rows(products))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(3), count_queries(6))
+
+
+@CubaneTestCase.benchmark()
+class ShopDataImporterBenchmarkTestCase(ShopDataImporterTestCaseBase):
+    """
+    cubane.ishop.apps.merchant.inventory.importer.ShopDataImporter
+    """
+    PRODUCTS = 12500
+    SKUS_PER_PRODUCT = 4
+
+
+    def test_import_50k_rows(self):
+        rows = self.get_rows(self.PRODUCTS, self.SKUS_PER_PRODUCT)
+
+        start = time.time()
+        with CaptureQueriesContext(connection) as ctx:
+            importer = self.import_rows(rows)
+        create_time = time.time() - start
+
+        start = time.time()
+        importer = self.import_rows(rows)
+        update_time = time.time() - start
+
+        self.assertFalse(importer.has_errors)
+        self.assertEqual(len(rows), ProductSKU.objects.count())
+
+        self.report_benchmark('Import shop data', [
+            ('Rows', len(rows)),
+            ('Products', self.PRODUCTS),
+            ('Queries (create)', len(ctx.captured_queries)),
+            ('Create time (sec)', '%.2f' % create_time),
+            ('Update time (sec)', '%.2f' % update_time),
+            ('Rows per second (create)', '%.0f' % (len(rows) / create_time)),
+        ])
@@ -0,0 +1,152 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
+import os
+import tempfile
+import threading
+import requests
+
+
+# size of chunks that are written to disk while downloading
+CHUNK_SIZE = 64 * 1024
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_download_workers():
+    """
+    Return the number of threads that are used to download files
+    concurrently.
+    """
+    try:
+        workers = int(settings.MEDIA_DOWNLOAD_WORKERS)
+    except (TypeError, ValueError):
+        workers = 1
+
+    return max(1, workers)
+
+
+def create_download_session(pool_size=None):
+    """
+    Create a new http session for downloading files, which keeps up to the
+    given number of connections per host alive, so that connections are
+    re-used by subsequent downloads from the same host.
+    """
+    if pool_size is None:
+        pool_size = get_download_workers()
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_download_session():
+    """
+    Return the process-wide http session for downloading files.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_download_session()
+        return _session
+
+
+def download_file(url, path, session=None, timeout=None):
+    """
+    Download the given url and write its content to the given file. The
+    content is streamed to disk in chunks and the file is only replaced once
+    the download completed successfully. Return True, if the file has been
+    downloaded successfully.
+    """
+    if session is None:
+        session = get_download_session()
+
+    if timeout is None:
+        timeout = settings.MEDIA_DOWNLOAD_TIMEOUT
+
+    folder = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(prefix='.download.', dir=folder)
+    try:
+        # mkstemp() creates files that are only readable by the owner, but
+        # downloaded files may be served by the web server
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+
+        try:
+            response = session.get(url, timeout=timeout, stream=True)
+        except requests.RequestException:
+            return False
+
+        try:
+            if response.status_code != 200:
+                return False
+
+            with os.fdopen(fd, 'wb') as f:
+                fd = None
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+        except (requests.RequestException, IOError):
+            return False
+        finally:
+            response.close()
+
+        os.rename(temp_path, path)
+        return True
+    finally:
+        if fd is not None:
+            os.close(fd)
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+
+def download_files(files, workers=None, session=None, timeout=None):
+    """
+    Download the given list of files concurrently by a bounded pool of
+    threads sharing the same http session, where each file is given as a
+    tuple of url and the full path to the file on disk. Identical urls are
+    only downloaded once (to the first path given for the url). Return a
+    dictionary containing the path to each downloaded file by url or None
+    if the download failed.
+    """
+    if workers is None:
+        workers = get_download_workers()
+
+    if session is None:
+        session = get_download_session()
+
+    # identical urls are only downloaded once
+    paths = OrderedDict()
+    for url, path in files:
+        if url not in paths:
+            paths[url] = path
+
+    def _download(item):
+        url, path = item
+        if download_file(url, path, session, timeout):
+            return url, path
+        else:
+            return url, None
+
+    workers = min(workers, len(paths))
+    if workers > 1:
+        pool = ThreadPool(workers)
+        try:
+            result = dict(pool.imap_unordered(_download, paths.items()))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        result = dict([_download(item) for item in paths.items()])
+
+    return result
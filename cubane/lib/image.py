@@ -11,6 +11,7 @@ from cubane.lib.style import (
     remove_attr
 )
 from bs4 import BeautifulSoup, element
+from collections import OrderedDict
 import sys
 import io
 import os
@@ -419,6 +420,45 @@ def generate_preview_image(filename, dest_filename):
     return True
 
 
+def get_image_resize_geometry(
+    width,
+    height,
+    target_width,
+    target_height,
+    mode='crop',
+    valign='center',
+    focal_point=None
+):
+    """
+    Return the crop region (x, y, w, h) and the resulting image size (w, h)
+    for resizing an image with the given width and height to the given target
+    width and height according to the given mode. If mode is 'scale', the crop
+    region is the entire image.
+    """
+    if mode == 'scale':
+        # do not upscale!
+        if target_width > width or target_height > height:
+            target_width = width
+            target_height = height
+
+        # force width and height to be bigger than zero, if scale result of
+        # the one dimension is zero (i.e 8000x10 image)
+        if target_width < 1:
+            target_width = 1
+
+        if target_height < 1:
+            target_height = 1
+
+        # calc. new width and height by fitting it into the
+        # desired boundaries
+        return (0, 0, width, height), get_image_fitting(width, height, target_width, target_height)
+    elif mode == 'crop':
+        x, y, w, h = get_image_crop_area(width, height, target_width, target_height, focal_point, valign)
+        return (int(x), int(y), int(w), int(h)), (target_width, target_height)
+    else:
+        return (0, 0, width, height), (width, height)
+
+
 def resize_image_object(
     img,
     dst_filename,
@@ -442,8 +482,7 @@ def resize_image_object(
     try:
         # if the resulting file is a jpg, remove transparency from the image,
         # since this might be a png source with transparency on it...
-        _, ext = os.path.splitext(dst_filename)
-        if ext not in ['.png', '.gif']:
+        if not _keeps_image_transparency(dst_filename):
             img = remove_image_transparency(img)
 
         # auto fitting:
@@ -451,43 +490,23 @@ def resize_image_object(
             img = auto_fit_image_object(img, width, height, settings.IMAGE_FITTING_COLOR)
 
         # process image based on given mode
+        (x, y, w, h), (width, height) = get_image_resize_geometry(
+            img.width,
+            img.height,
+            width,
+            height,
+            mode,
+            valign,
+            focal_point
+        )
         if mode == 'scale':
-            # do not upscale!
-            w, h = img.size
-            if width > w or height > h:
-                width = w
-                height = h
-
-            # force width and height to be bigger than zero, if scale result of
-            # the one dimension is zero (i.e 8000x10 image)
-            if width < 1:
-                width = 1
-
-            if height < 1:
-                height = 1
-
-            # calc. new width and height by fitting it into the
-            # desired boundaries
-            w, h = get_image_fitting(w, h, width, height)
-            img.resize(w, h)
+            img.resize(width, height)
         elif mode == 'crop':
-            x, y, w, h = get_image_crop_area(img.width, img.height, width, height, focal_point, valign)
-            x = int(x)
-            y = int(y)
-            w = int(w)
-            h = int(h)
             img.crop(x, y, width=w, height=h)
             if width != w or height != h:
                 img.resize(width, height)
 
-        # determine image quality. Do not use a higher image quality
-        # as the input image. Smaller images may use a lower quality level.
-        if is_jpeg_image_object(img):
-            img.compression_quality = min(img.compression_quality, quality)
-
-        # save image back to target format
-        img.strip()
-        img.save(filename=dst_filename)
+        _save_resized_image_object(img, dst_filename, quality)
     finally:
         img.destroy()
 
@@ -496,6 +515,160 @@ def resize_image_object(
         optimize_image(dst_filename)
 
 
+def resize_image_object_pyramid(img, versions):
+    """
+    Generate multiple versions of the given image object in the same way as
+    resize_image_object() would for each version, where each version is given
+    as a dict of keyword arguments for resize_image_object(). Versions of the
+    same kind (e.g. all image sizes for the same image shape) are generated
+    largest-first and each smaller version is resampled from the previous
+    (larger) version in memory rather than from the (usually much larger)
+    input image.
+    """
+    # group versions of the same kind, so that the crop region of each version
+    # is approximately the same and only the resulting image size differs.
+    groups = OrderedDict()
+    for kwargs in versions:
+        focal_point = kwargs.get('focal_point')
+        key = (
+            _keeps_image_transparency(kwargs.get('dst_filename')),
+            kwargs.get('mode', 'crop'),
+            kwargs.get('valign', 'center'),
+            kwargs.get('auto_fit', False),
+            tuple(focal_point) if focal_point is not None else None
+        )
+        groups.setdefault(key, []).append(kwargs)
+
+    for (keep_transparency, mode, valign, auto_fit, focal_point), group in groups.items():
+        group = sorted(group, key=lambda kwargs: kwargs.get('width') * kwargs.get('height'), reverse=True)
+        _resize_image_object_pyramid_group(img, group, keep_transparency, mode, valign, auto_fit, focal_point)
+
+
+def _resize_image_object_pyramid_group(img, versions, keep_transparency, mode, valign, auto_fit, focal_point):
+    """
+    Generate the given list of image versions of the same kind based on the
+    given image object, largest version first.
+    """
+    base = img.clone()
+    prev = None
+    try:
+        if not keep_transparency:
+            base = remove_image_transparency(base)
+
+        # auto fitting: all versions share (approximately) the same aspect
+        # ratio, so we only need to fit the image once.
+        if auto_fit:
+            base = auto_fit_image_object(
+                base,
+                versions[0].get('width'),
+                versions[0].get('height'),
+                settings.IMAGE_FITTING_COLOR
+            )
+
+        for kwargs in versions:
+            # crop region within the base image and the resulting image size
+            region, (width, height) = get_image_resize_geometry(
+                base.width,
+                base.height,
+                kwargs.get('width'),
+                kwargs.get('height'),
+                mode,
+                valign,
+                focal_point
+            )
+
+            # resample from the previous version if it covers the crop
+            # region of this version, otherwise from the base image
+            src, crop = base, region
+            if prev is not None:
+                prev_img, prev_region = prev
+                prev_crop = _get_image_pyramid_crop_area(prev_img, prev_region, region)
+                if prev_crop is not None and prev_crop[2] >= width and prev_crop[3] >= height:
+                    src, crop = prev_img, prev_crop
+
+            version = src.clone()
+            try:
+                x, y, w, h = crop
+                if x != 0 or y != 0 or w != version.width or h != version.height:
+                    version.crop(x, y, width=w, height=h)
+                if version.width != width or version.height != height:
+                    version.resize(width, height)
+
+                _save_resized_image_object(
+                    version,
+                    kwargs.get('dst_filename'),
+                    kwargs.get('quality', settings.IMAGE_COMPRESSION_QUALITY)
+                )
+            except:
+                version.destroy()
+                raise
+
+            if prev is not None:
+                prev[0].destroy()
+            prev = (version, region)
+
+            # optimize image
+            if kwargs.get('optimize', settings.IMAGE_OPTIMIZE):
+                optimize_image(kwargs.get('dst_filename'))
+    finally:
+        base.destroy()
+        if prev is not None:
+            prev[0].destroy()
+
+
+def _get_image_pyramid_crop_area(img, img_region, region):
+    """
+    Return the given crop region (within the base image) in the coordinate
+    space of the given image, which represents the given crop region of the
+    base image. Return None if the given image does not cover the crop
+    region, allowing for an error of one pixel due to rounding.
+    """
+    px, py, pw, ph = img_region
+    if pw == 0 or ph == 0:
+        return None
+
+    sx = float(img.width) / float(pw)
+    sy = float(img.height) / float(ph)
+
+    x, y, w, h = region
+    x1 = (x - px) * sx
+    y1 = (y - py) * sy
+    x2 = (x + w - px) * sx
+    y2 = (y + h - py) * sy
+
+    if x1 < -1.0 or y1 < -1.0 or x2 > img.width + 1.0 or y2 > img.height + 1.0:
+        return None
+
+    x1 = max(0, int(round(x1)))
+    y1 = max(0, int(round(y1)))
+    x2 = min(img.width, int(round(x2)))
+    y2 = min(img.height, int(round(y2)))
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def _keeps_image_transparency(dst_filename):
+    """
+    Return True, if the given target image file may contain transparency
+    based on its file extension.
+    """
+    _, ext = os.path.splitext(dst_filename)
+    return ext in ['.png', '.gif']
+
+
+def _save_resized_image_object(img, dst_filename, quality):
+    """
+    Save the given (resized) image object under the given filename.
+    """
+    # determine image quality. Do not use a higher image quality
+    # as the input image. Smaller images may use a lower quality level.
+    if is_jpeg_image_object(img):
+        img.compression_quality = min(img.compression_quality, quality)
+
+    # save image back to target format
+    img.strip()
+    img.save(filename=dst_filename)
+
+
 def auto_fit_image_object(img, width, height, bg_color):
     """
     Automatically fit the given input image into a canvas with the given
@@ -1015,32 +1188,21 @@ def resize_svg_image(
     file_put_contents(dst_filename, markup)
 
 
-def get_colorized_svg_image(filename, layers):
+def get_svg_layer_instructions(layers):
     """
-    Open the given svg file and colorise all given layers (by id) to the given
-    colour values. The given layers argument represents a dictionary that maps
-    any given layer to the new fill colour, which is given as a hex-value,
-    like #rrggbb.
+    Return the given colourisation instructions for layers of an svg image in
+    a normalised form as a sorted tuple of layer identifiers and a sorted tuple
+    of (attr, value) pairs for each layer. Instructions that we do not
+    understand or that are not supported are ignored. Two equivalent sets of
+    instructions therefore result in the same normalised form.
     """
-    # load xml (svg)
-    xml = BeautifulSoup(open(filename), 'xml')
-
-    # determine layer prefix (if any)
-    prefix = xml.svg.get('data-prefix', '')
-    if prefix != '':
-        prefix += '_'
-
-    # find all layers we need to colorise...
+    result = []
     for layer_id, instructions in layers.items():
-        el = xml.find(id='%s%s' % (prefix, layer_id))
-        if el is None:
-            continue
-
         # assume a list of instructions
         if not isinstance(instructions, list):
             instructions = [instructions]
 
-        style = parse_inline_style(el.get('style', ''))
+        style = {}
         for instruction in instructions:
             # split attr:value
             instr = instruction.strip()
@@ -1062,17 +1224,46 @@ def get_colorized_svg_image(filename, layers):
             if attr not in SUPPORTED_SVG_STYLE_OVERWRITES:
                 continue
 
+            # if the value is hexadecimal, append a # to encode the correct
+            # colour information if it is missing.
+            if not value.startswith('#') and re.match(r'^[0-9a-fA-F]+$', value):
+                value = '#' + value
+
+            style[attr] = value
+
+        result.append((layer_id, tuple(sorted(style.items()))))
+    return tuple(sorted(result))
+
+
+def get_colorized_svg_image(filename, layers):
+    """
+    Open the given svg file and colorise all given layers (by id) to the given
+    colour values. The given layers argument represents a dictionary that maps
+    any given layer to the new fill colour, which is given as a hex-value,
+    like #rrggbb.
+    """
+    # load xml (svg)
+    xml = BeautifulSoup(open(filename), 'xml')
+
+    # determine layer prefix (if any)
+    prefix = xml.svg.get('data-prefix', '')
+    if prefix != '':
+        prefix += '_'
+
+    # find all layers we need to colorise...
+    for layer_id, instructions in get_svg_layer_instructions(layers):
+        el = xml.find(id='%s%s' % (prefix, layer_id))
+        if el is None:
+            continue
+
+        style = parse_inline_style(el.get('style', ''))
+        for attr, value in instructions:
             # remove attribute if exists, for example 'fill' might be expressed
             # as an attribute or inline style. We will write this as inline
             # style, therefore we remove the corresponding attribute if it
             # exists...
             del el[attr]
 
-            # if the value is hexadecimal, append a # to encode the correct
-            # colour information if it is missing.
-            if not value.startswith('#') and re.match(r'^[0-9a-fA-F]+$', value):
-                value = '#' + value
-
             # add to style
             style[attr] = value
 
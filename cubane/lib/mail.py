@@ -9,6 +9,7 @@ from django.test import RequestFactory
 from cubane.lib.text import text_from_html
 from cubane.lib.template import get_template
 import email
+import base64
 import os
 import sys
 import traceback
@@ -44,6 +45,83 @@ def send_exception_email(request=None):
     )
 
 
+def get_email_message_payload(msg):
+    """
+    Return a json-serialisable representation of the given email message,
+    so that the message can be sent later. Returns None if the message
+    cannot be represented, for example because of attachments that are
+    given as MIME objects.
+    """
+    attachments = []
+    for attachment in msg.attachments:
+        if not isinstance(attachment, tuple):
+            return None
+
+        filename, content, mimetype = attachment
+        if isinstance(content, unicode):
+            attachments.append((filename, content, mimetype, False))
+        else:
+            attachments.append((filename, base64.b64encode(content), mimetype, True))
+
+    return {
+        'subject': msg.subject,
+        'body': msg.body,
+        'from_email': msg.from_email,
+        'to': msg.to,
+        'cc': msg.cc,
+        'bcc': msg.bcc,
+        'reply_to': msg.reply_to,
+        'headers': msg.extra_headers,
+        'alternatives': getattr(msg, 'alternatives', []),
+        'attachments': attachments
+    }
+
+
+def get_email_message_from_payload(payload, connection=None):
+    """
+    Return a new email message from the given json-serialisable
+    representation of an email message for the given mail connection.
+    """
+    msg = EmailMultiAlternatives(
+        payload.get('subject'),
+        payload.get('body'),
+        payload.get('from_email'),
+        payload.get('to'),
+        bcc=payload.get('bcc'),
+        connection=connection,
+        headers=payload.get('headers'),
+        cc=payload.get('cc'),
+        reply_to=payload.get('reply_to')
+    )
+
+    for content, mimetype in payload.get('alternatives', []):
+        msg.attach_alternative(content, mimetype)
+
+    for filename, content, mimetype, encoded in payload.get('attachments', []):
+        if encoded:
+            content = base64.b64decode(content)
+        msg.attach(filename, content, mimetype)
+
+    return msg
+
+
+def cubane_send_message(msg):
+    """
+    Send the given email message. If settings.CUBANE_MAIL_ASYNC is True, the
+    message is enqueued and sent by the task runner later instead, so that
+    we do not have to wait for the mail server.
+    """
+    if settings.CUBANE_MAIL_ASYNC:
+        from cubane.tasks import TaskRunner
+        if TaskRunner.is_available():
+            payload = get_email_message_payload(msg)
+            if payload is not None:
+                TaskRunner.enqueue('mail', payload)
+                return
+
+    msg.send()
+
+
 def cubane_send_mail_no_html(to, subject, text, attachments=None):
     """
     Send an email to the given recepient with given subject line and text
@@ -74,7 +152,7 @@ def cubane_send_mail_no_html(to, subject, text, attachments=None):
             msg.attach_file(attachment)
 
     # send it off
-    msg.send()
+    cubane_send_message(msg)
 
 
 def cubane_send_mail(to, subject, html, attachments=None, cc=None, bcc=None):
@@ -117,7 +195,7 @@ def cubane_send_mail(to, subject, html, attachments=None, cc=None, bcc=None):
                 msg.attach_file(attachment)
 
     # send it off
-    msg.send()
+    cubane_send_message(msg)
 
 
 def cubane_send_mail_template(request, to, subject, template, template_context, attachments=None):
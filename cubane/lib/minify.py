@@ -7,10 +7,35 @@ import os
 import re
 import subprocess
 import codecs
+import HTMLParser
 
 
 YUI_VERSION = '2.4.8'
 PATTERN_JS_CONSOLE = re.compile(r'^\s*console\.\w+\(.*?\);\s*$', re.MULTILINE | re.I | re.DOTALL)
+PATTERN_HTML_SPACE = re.compile(r'[ \t\n\r\f\v]+')
+
+
+# content of such html elements is not minified
+HTML_PRESERVE_TAGS = frozenset([
+    'pre', 'textarea', 'script', 'style'
+])
+
+
+# html elements that are part of the text flow, white space around such
+# elements is significant
+HTML_INLINE_TAGS = frozenset([
+    'a', 'em', 'strong', 'small', 's', 'cite', 'q', 'dfn', 'abbr', 'data',
+    'time', 'code', 'var', 'samp', 'kbd', 'sup', 'sub', 'i', 'b', 'u', 'mark',
+    'ruby', 'rt', 'rp', 'bdi', 'bdo', 'span', 'br', 'wbr', 'ins', 'del', 'img',
+    'picture', 'svg', 'button', 'input', 'label', 'select', 'textarea'
+])
+
+
+# html elements that must not have an end tag
+HTML_VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+])
 
 
 def fix_calc_compressor_bug(css):
@@ -254,3 +279,148 @@ def minify_files(filenames, base, dst_filename, filetype='js', identifier=None):
     f = codecs.open(dst_filename, 'w', 'utf8')
     f.write(content)
     f.close()
+
+
+class HtmlMinifier(HTMLParser.HTMLParser):
+    """
+    Minifies html content incrementally while it is fed into the parser,
+    without building a document tree. Runs of white space are collapsed into
+    a single space. White space between text and elements that are not part
+    of the text flow is removed, while white space between two elements is
+    kept as a single space, since it may be significant, for example for
+    inline-block elements. Comments are removed, except for conditional
+    comments. The content of pre, textarea, script and style elements is
+    preserved and end tags of void elements, such as </source>, are removed.
+    Minified content is passed to the given write function.
+    """
+    def __init__(self, write):
+        HTMLParser.HTMLParser.__init__(self)
+        self._write = write
+        self._preserve = 0
+        self._space = False
+        self._inline = None
+        self._tag = False
+        self._rawpos = 0
+
+
+    def goahead(self, end):
+        self._rawpos = 0
+        HTMLParser.HTMLParser.goahead(self, end)
+
+
+    def updatepos(self, i, j):
+        # keep track of the position of the current token within rawdata
+        self._rawpos = j
+        return HTMLParser.HTMLParser.updatepos(self, i, j)
+
+
+    def _is_terminated_ref(self, ref):
+        """
+        Return True, if the given entity or character reference, which starts
+        at the current position, is terminated by a semicolon in the source.
+        """
+        return self.rawdata.startswith('%s;' % ref, self._rawpos)
+
+
+    def _emit(self, content, inline, tag=True):
+        """
+        Write the given content. Pending white space is only written if it
+        separates two items of the text flow or two elements.
+        """
+        if self._space and self._inline is not None:
+            if (inline and self._inline) or (tag and self._tag):
+                self._write(' ')
+
+        self._space = False
+        self._inline = inline
+        self._tag = tag
+        self._write(content)
+
+
+    def handle_starttag(self, tag, attrs):
+        self._emit(self.get_starttag_text(), tag in HTML_INLINE_TAGS)
+        if tag in HTML_PRESERVE_TAGS:
+            self._preserve += 1
+
+
+    def handle_startendtag(self, tag, attrs):
+        self._emit(self.get_starttag_text(), tag in HTML_INLINE_TAGS)
+
+
+    def handle_endtag(self, tag):
+        if tag in HTML_VOID_TAGS:
+            return
+
+        if tag in HTML_PRESERVE_TAGS and self._preserve > 0:
+            self._preserve -= 1
+
+        self._emit('</%s>' % tag, tag in HTML_INLINE_TAGS)
+
+
+    def handle_data(self, data):
+        if self._preserve > 0:
+            self._emit(data, True, False)
+            return
+
+        data = PATTERN_HTML_SPACE.sub(' ', data)
+        text = data.strip(' ')
+        if text:
+            if data.startswith(' '):
+                self._space = True
+            self._emit(text, True, False)
+            if data.endswith(' '):
+                self._space = True
+        elif data:
+            self._space = True
+
+
+    def handle_entityref(self, name):
+        # keep references as they are, e.g. do not add a semicolon to AT&T
+        ref = '&%s' % name
+        if self._is_terminated_ref(ref):
+            ref += ';'
+        self._emit(ref, True, False)
+
+
+    def handle_charref(self, name):
+        ref = '&#%s' % name
+        if self._is_terminated_ref(ref):
+            ref += ';'
+        self._emit(ref, True, False)
+
+
+    def handle_comment(self, data):
+        # keep conditional comments, e.g. <!--[if IE]>...<![endif]-->
+        if self._preserve > 0 or data.startswith('[') or data.startswith('<!['):
+            self._emit('<!--%s-->' % data, False)
+
+
+    def handle_decl(self, decl):
+        self._emit('<!%s>' % decl, False)
+
+
+    def handle_pi(self, data):
+        self._emit('<?%s>' % data, False)
+
+
+    def unknown_decl(self, data):
+        self._emit('<![%s]]>' % data, False)
+
+
+def html_minify_stream(chunks):
+    """
+    Minify the given sequence of html content chunks (unicode) and yield
+    minified html content chunks as soon as they become available.
+    """
+    output = []
+    minifier = HtmlMinifier(output.append)
+
+    for chunk in chunks:
+        minifier.feed(chunk)
+        if output:
+            yield ''.join(output)
+            del output[:]
+
+    minifier.close()
+    if output:
+        yield ''.join(output)
@@ -1,6 +1,7 @@
 # coding=UTF-8
 from __future__ import unicode_literals
-from django.db import models
+from django.db import models, connections
+from django.db.models import Case, When, Value
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models.fields.related_descriptors import ReverseManyToOneDescriptor
 from django.db.models.fields.reverse_related import ForeignObjectRel
@@ -171,6 +172,45 @@ def save_model(d, instance):
     return instance
 
 
+def bulk_update(objects, fieldnames, batch_size=None, using='default'):
+    """
+    Update the given fields of all given model instances (of the same model)
+    with one database query per batch. Like bulk_create(), this does not
+    call save() and does not send any signals. Return the number of rows
+    updated.
+    """
+    if not objects:
+        return 0
+
+    model = objects[0].__class__
+    fields = [model._meta.get_field(fieldname) for fieldname in fieldnames]
+
+    # the max. batch size depends on the number of query parameters the
+    # database supports. Each object requires one When(pk=...) and one
+    # Value() parameter per field and one parameter for pk__in
+    connection = connections[using]
+    max_batch_size = connection.ops.bulk_batch_size(['pk'] * (2 * len(fields) + 1), objects)
+    batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+    batch_size = max(1, batch_size)
+
+    updated = 0
+    for i in range(0, len(objects), batch_size):
+        batch = objects[i:i + batch_size]
+        values = {}
+        for field in fields:
+            output_field = field.target_field if field.is_relation else field
+            values[field.name] = Case(*[
+                When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=output_field))
+                for obj in batch
+            ], output_field=output_field)
+
+        updated += model._base_manager.using(using).filter(
+            pk__in=[obj.pk for obj in batch]
+        ).update(**values)
+
+    return updated
+
+
 def invalid_model_error(model, message):
     """
     Raise incompatibility error for the given model with given message.
@@ -0,0 +1,150 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from django.http import HttpResponse, FileResponse, HttpResponseNotModified
+from django.views.static import was_modified_since
+from django.utils.http import http_date, urlquote
+from cubane.lib.module import get_class_from_string
+import os
+import stat
+import mimetypes
+
+
+class SendfileBackendBase(object):
+    """
+    Base class for sendfile backends, which are responsible for sending the
+    content of a file on disk to the client.
+    """
+    def get_response(self, filepath, statobj):
+        """
+        Return a response object for sending the content of the given file.
+        """
+        raise NotImplementedError('Override get_response() method to implement the mechanism for sending files.')
+
+
+class StreamingSendfileBackend(SendfileBackendBase):
+    """
+    Streams the content of a file as part of the response. The open file is
+    handed over to the WSGI server (wsgi.file_wrapper), which may use
+    zero-copy sendfile() to transmit the file without passing its content
+    through python.
+    """
+    def get_response(self, filepath, statobj):
+        response = FileResponse(open(filepath, 'rb'))
+        if stat.S_ISREG(statobj.st_mode):
+            response['Content-Length'] = statobj.st_size
+        return response
+
+
+class OffloadSendfileBackendBase(SendfileBackendBase):
+    """
+    Base class for sendfile backends that offload the transmission of a file
+    to the web server by sending a special response header. The response
+    itself has no content; the web server will determine the length of the
+    content based on the file it is sending.
+    """
+    header = None
+
+
+    def get_response(self, filepath, statobj):
+        value = self.get_header_value(filepath)
+        if value is None:
+            # file cannot be sent by the web server, stream it instead
+            return StreamingSendfileBackend().get_response(filepath, statobj)
+
+        response = HttpResponse()
+        response[self.header] = value
+        return response
+
+
+    def get_header_value(self, filepath):
+        """
+        Return the value of the header which instructs the web server to send
+        the given file or None.
+        """
+        raise NotImplementedError('Override get_header_value() method to implement the header value.')
+
+
+class NginxSendfileBackend(OffloadSendfileBackendBase):
+    """
+    Offloads the transmission of files to nginx by sending the X-Accel-Redirect
+    header, which refers to the file within an internal location that maps to
+    settings.CUBANE_SENDFILE_ROOT, for example:
+
+    location /protected/ {
+        internal;
+        alias /path/to/media/;
+    }
+    """
+    header = 'X-Accel-Redirect'
+
+
+    def get_header_value(self, filepath):
+        root = os.path.abspath(settings.CUBANE_SENDFILE_ROOT)
+        filepath = os.path.abspath(filepath)
+        if not filepath.startswith(root + os.sep):
+            return None
+
+        path = os.path.relpath(filepath, root).replace(os.sep, '/')
+        return '%s%s' % (settings.CUBANE_SENDFILE_URL, urlquote(path))
+
+
+class XSendfileBackend(OffloadSendfileBackendBase):
+    """
+    Offloads the transmission of files to the web server by sending the
+    X-Sendfile header, for example for Apache with mod_xsendfile or lighttpd.
+    """
+    header = 'X-Sendfile'
+
+
+    def get_header_value(self, filepath):
+        return os.path.abspath(filepath)
+
+
+def get_sendfile_backend():
+    """
+    Return the sendfile backend as configured by settings.CUBANE_SENDFILE_BACKEND
+    or the streaming backend if no backend is configured.
+    """
+    if not settings.CUBANE_SENDFILE_BACKEND:
+        return StreamingSendfileBackend()
+
+    _class = get_class_from_string(settings.CUBANE_SENDFILE_BACKEND)
+    return _class()
+
+
+def sendfile(request, filepath, content_type=None, attachment_filename=None):
+    """
+    Return a response for sending the given file to the client by using the
+    configured sendfile backend. The content type is determined based on the
+    given file if not given. If an attachment filename is given, the file is
+    sent as a download with the given filename.
+    """
+    # respect the If-Modified-Since header.
+    statobj = os.stat(filepath)
+    if not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'),
+        statobj.st_mtime,
+        statobj.st_size
+    ):
+        # not modified
+        return HttpResponseNotModified()
+
+    # determine content type
+    encoding = None
+    if content_type is None:
+        content_type, encoding = mimetypes.guess_type(filepath)
+        content_type = content_type or 'application/octet-stream'
+
+    response = get_sendfile_backend().get_response(filepath, statobj)
+    response['Content-Type'] = content_type
+    if encoding:
+        response['Content-Encoding'] = encoding
+
+    if attachment_filename:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % attachment_filename
+
+    # last mod. timestamp
+    response['Last-Modified'] = http_date(statobj.st_mtime)
+
+    return response
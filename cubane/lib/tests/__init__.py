@@ -11,6 +11,7 @@ from cubane.lib.tests.conversion import *
 from cubane.lib.tests.crypt import *
 from cubane.lib.tests.date import *
 from cubane.lib.tests.default import *
+from cubane.lib.tests.download import *
 from cubane.lib.tests.deploy import *
 from cubane.lib.tests.excerpt import *
 from cubane.lib.tests.file import *
@@ -31,6 +32,7 @@ from cubane.lib.tests.password import *
 from cubane.lib.tests.range import *
 from cubane.lib.tests.resources import *
 from cubane.lib.tests.request import *
+from cubane.lib.tests.sendfile import *
 from cubane.lib.tests.serve import *
 from cubane.lib.tests.spfcheck import *
 from cubane.lib.tests.style import *
@@ -40,6 +42,8 @@ from cubane.lib.tests.tree import *
 from cubane.lib.tests.paginator import *
 from cubane.lib.tests.ucsv import *
 from cubane.lib.tests.verbose import *
+from cubane.lib.tests.version import *
+from cubane.lib.tests.zipstream import *
 
 # requires postgresql
 from cubane.lib.tests.fts import *
@@ -0,0 +1,208 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.test.utils import override_settings
+from cubane.tests.base import CubaneTestCase
+from cubane.lib.download import create_download_session
+from cubane.lib.download import download_file
+from cubane.lib.download import download_files
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+import threading
+import tempfile
+import shutil
+import time
+import stat
+import os
+
+
+class DownloadRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the path of the request as content or 404 for paths starting
+    with /missing. Each request is delayed by the server's delay.
+    """
+    protocol_version = 'HTTP/1.1'
+
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            content = b'Not Found'
+        else:
+            self.send_response(200)
+            content = ('content:%s' % self.path).encode('utf-8')
+
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadServer(ThreadingMixIn, HTTPServer):
+    """
+    Local http server standing in for external sources.
+    """
+    daemon_threads = True
+
+
+    def __init__(self, delay=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), DownloadRequestHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], path)
+
+
+class LibDownloadTestCaseBase(CubaneTestCase):
+    delay = 0
+
+
+    def setUp(self):
+        self.server = DownloadServer(self.delay)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.session = create_download_session(4)
+        self.folder = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder)
+
+
+    def get_path(self, filename):
+        return os.path.join(self.folder, filename)
+
+
+    def get_content(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+@override_settings(MEDIA_DOWNLOAD_TIMEOUT=10)
+class LibDownloadFileTestCase(LibDownloadTestCaseBase):
+    """
+    cubane.lib.download.download_file()
+    """
+    def test_should_write_content_to_file(self):
+        path = self.get_path('a.txt')
+        self.assertTrue(download_file(self.server.url('/a.jpg'), path, self.session))
+        self.assertEqual(b'content:/a.jpg', self.get_content(path))
+        self.assertEqual(['a.txt'], os.listdir(self.folder))
+
+
+    def test_should_create_file_that_is_readable_by_others(self):
+        path = self.get_path('a.txt')
+        umask = os.umask(0o022)
+        try:
+            self.assertTrue(download_file(self.server.url('/a.jpg'), path, self.session))
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(path).st_mode))
+
+
+    def test_should_not_write_file_if_not_found(self):
+        path = self.get_path('a.txt')
+        self.assertFalse(download_file(self.server.url('/missing.jpg'), path, self.session))
+        self.assertEqual([], os.listdir(self.folder))
+
+
+    def test_should_keep_existing_file_if_download_failed(self):
+        path = self.get_path('a.txt')
+        with open(path, 'wb') as f:
+            f.write(b'existing')
+
+        self.assertFalse(download_file(self.server.url('/missing.jpg'), path, self.session))
+        self.assertEqual(b'existing', self.get_content(path))
+
+
+    def test_should_return_false_if_host_is_unreachable(self):
+        url = self.server.url('/a.jpg')
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertFalse(download_file(url, self.get_path('a.txt'), self.session, timeout=1))
+        self.assertEqual([], os.listdir(self.folder))
+
+
+@override_settings(MEDIA_DOWNLOAD_TIMEOUT=10)
+class LibDownloadFilesTestCase(LibDownloadTestCaseBase):
+    """
+    cubane.lib.download.download_files()
+    """
+    def test_should_download_each_url_once(self):
+        files = [
+            (self.server.url('/a.jpg'), self.get_path('a1.txt')),
+            (self.server.url('/b.jpg'), self.get_path('b.txt')),
+            (self.server.url('/a.jpg'), self.get_path('a2.txt')),
+            (self.server.url('/missing.jpg'), self.get_path('c.txt'))
+        ]
+        result = download_files(files, workers=4, session=self.session)
+
+        self.assertEqual({
+            self.server.url('/a.jpg'): self.get_path('a1.txt'),
+            self.server.url('/b.jpg'): self.get_path('b.txt'),
+            self.server.url('/missing.jpg'): None
+        }, result)
+        self.assertEqual(['/a.jpg', '/b.jpg', '/missing.jpg'], sorted(self.server.requests))
+        self.assertEqual(['a1.txt', 'b.txt'], sorted(os.listdir(self.folder)))
+        self.assertEqual(b'content:/b.jpg', self.get_content(self.get_path('b.txt')))
+
+
+    def test_should_reuse_connection(self):
+        files = [
+            (self.server.url('/%d.jpg' % i), self.get_path('%d.txt' % i))
+            for i in range(10)
+        ]
+        download_files(files, workers=1, session=self.session)
+
+        self.assertEqual(10, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+
+    def test_should_return_empty_result_without_files(self):
+        self.assertEqual({}, download_files([], workers=4, session=self.session))
+
+
+@override_settings(MEDIA_DOWNLOAD_TIMEOUT=10)
+class LibDownloadFilesConcurrencyTestCase(LibDownloadTestCaseBase):
+    """
+    cubane.lib.download.download_files()
+    """
+    delay = 0.2
+
+
+    def test_should_download_files_concurrently(self):
+        files = [
+            (self.server.url('/%d.jpg' % i), self.get_path('%d.txt' % i))
+            for i in range(8)
+        ]
+
+        start = time.time()
+        result = download_files(files, workers=4, session=self.session)
+        elapsed = time.time() - start
+
+        self.assertEqual(8, len([path for path in result.values() if path]))
+        self.assertTrue(elapsed < 8 * self.delay * 0.75, elapsed)
@@ -14,6 +14,9 @@ from cubane.lib.image import (
     get_image_crop_area,
     get_image_crop_area_normalised,
     resize_image,
+    resize_image_object,
+    resize_image_object_pyramid,
+    open_image_for_resize,
     resize_image_if_too_wide,
     is_jpeg_image_object,
     is_png_image_object,
@@ -32,6 +35,8 @@ from wand.image import Image as WandImage
 import tempfile
 import os
 import shutil
+import time
+import math
 
 
 class TestImage(object):
@@ -55,6 +60,10 @@ TEST_IMAGES = [
 TEST_IMAGES_NO_SVG = [f for f in TEST_IMAGES if get_ext(f.filename) != 'svg']
 
 
+PYRAMID_SIZES = [50, 160, 320, 640, 900, 1200]
+PYRAMID_SHAPES = [(1.0, 'crop'), (16.0 / 9.0, 'crop'), (0.75, 'crop'), (None, 'scale')]
+
+
 class LibImageGetImageFittingTestCase(CubaneTestCase):
     """
     cubane.lib.image.get_image_fitting()
@@ -295,6 +304,146 @@ class LibImageResizeImageTestCase(CubaneTestCase):
         self.assertEqual(size[1], expected_height, 'expected image height of %d, but was %d.' % (expected_height, size[1]))
 
 
+class LibImageResizeImageObjectPyramidTestCase(CubaneTestCase):
+    """
+    cubane.lib.image.resize_image_object_pyramid()
+    """
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_should_generate_all_versions_in_expected_size(self):
+        with open_image_for_resize(self.get_test_image_path('test.jpg')) as img:
+            versions = get_resize_versions(self.path, 'pyramid')
+            resize_image_object_pyramid(img, versions)
+
+        for kwargs in versions:
+            size = get_image_size(kwargs.get('dst_filename'))
+            if kwargs.get('mode') == 'crop':
+                self.assertEqual((kwargs.get('width'), kwargs.get('height')), size)
+            else:
+                self.assertEqual((min(512, kwargs.get('width')), min(512, kwargs.get('height'))), size)
+
+
+    def test_should_generate_versions_in_same_size_as_resize_image_object(self):
+        with open_image_for_resize(self.get_test_image_path('test-transparent.png')) as img:
+            expected = get_resize_versions(self.path, 'original', 'png')
+            actual = get_resize_versions(self.path, 'pyramid', 'png')
+            for kwargs in expected:
+                resize_image_object(img, **kwargs)
+            resize_image_object_pyramid(img, actual)
+
+        for a, b in zip(expected, actual):
+            self.assertEqual(get_image_size(a.get('dst_filename')), get_image_size(b.get('dst_filename')))
+
+
+    def test_quality_should_be_comparable_to_resize_image_object(self):
+        with open_image_for_resize(self.get_test_image_path('test.jpg')) as img:
+            expected = get_resize_versions(self.path, 'original')
+            actual = get_resize_versions(self.path, 'pyramid')
+            for kwargs in expected:
+                resize_image_object(img, **kwargs)
+            resize_image_object_pyramid(img, actual)
+
+        for a, b in zip(expected, actual):
+            psnr = get_psnr(a.get('dst_filename'), b.get('dst_filename'))
+            self.assertTrue(
+                psnr > 30.0,
+                'expected PSNR of more than 30 dB for %s, but was %.2f dB.' % (
+                    os.path.basename(b.get('dst_filename')),
+                    psnr
+                )
+            )
+
+
+@CubaneTestCase.benchmark()
+class LibImageResizeImageObjectPyramidBenchmarkTestCase(CubaneTestCase):
+    """
+    cubane.lib.image.resize_image_object_pyramid()
+    """
+    WIDTH = 6000
+    HEIGHT = 4000
+
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_generate_versions_for_large_image(self):
+        filename = os.path.join(self.path, 'large.jpg')
+        with open_image_for_resize(self.get_test_image_path('test.jpg')) as img:
+            img.resize(self.WIDTH, self.HEIGHT)
+            img.save(filename=filename)
+
+        with open_image_for_resize(filename) as img:
+            expected = get_resize_versions(self.path, 'original')
+            actual = get_resize_versions(self.path, 'pyramid')
+
+            t = time.time()
+            for kwargs in expected:
+                resize_image_object(img, **kwargs)
+            original_time = time.time() - t
+
+            t = time.time()
+            resize_image_object_pyramid(img, actual)
+            pyramid_time = time.time() - t
+
+        psnr = min([get_psnr(a.get('dst_filename'), b.get('dst_filename')) for a, b in zip(expected, actual)])
+
+        self.report_benchmark('Generate image versions', [
+            ('Original image', '%dx%d' % (self.WIDTH, self.HEIGHT)),
+            ('Image versions', len(expected)),
+            ('Resize from original (sec)', '%.2f' % original_time),
+            ('Resize pyramid (sec)', '%.2f' % pyramid_time),
+            ('Speedup', '%.1fx' % (original_time / pyramid_time)),
+            ('Min. PSNR (dB)', '%.2f' % psnr),
+        ])
+
+
+def get_resize_versions(path, prefix, ext='jpg'):
+    """
+    Return a list of image versions for all test image sizes and shapes as
+    keyword arguments for resize_image_object().
+    """
+    versions = []
+    for ar, mode in PYRAMID_SHAPES:
+        for width in PYRAMID_SIZES:
+            height = int(width / ar) if ar else width
+            versions.append({
+                'dst_filename': os.path.join(path, '%s-%s-%s-%d.%s' % (prefix, mode, ar, width, ext)),
+                'width': width,
+                'height': height,
+                'mode': mode,
+                'focal_point': (0.4, 0.6),
+                'optimize': False
+            })
+    return versions
+
+
+def get_psnr(a, b):
+    """
+    Return the peak signal-to-noise ratio (PSNR) in dB between the two given
+    image files of the same size.
+    """
+    with open_image(a) as img_a:
+        with open_image(b) as img_b:
+            pixels_a = bytearray(img_a.make_blob('RGB'))
+            pixels_b = bytearray(img_b.make_blob('RGB'))
+
+    mse = sum([(x - y) ** 2 for x, y in zip(pixels_a, pixels_b)]) / float(len(pixels_a))
+    if mse == 0:
+        return float('inf')
+    return 10.0 * math.log10(255.0 ** 2 / mse)
+
+
 class LibResizeImageIfTooWideTestCase(CubaneTestCase):
     """
     cubane.lib.image.resize_image_if_too_wide()
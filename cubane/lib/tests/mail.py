@@ -4,6 +4,7 @@ from django.conf import settings
 from django.test.utils import override_settings
 from django.core import mail
 from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from cubane.tests.base import CubaneTestCase
 from cubane.lib.mail import send_exception_email
 from cubane.lib.mail import cubane_send_mail
@@ -13,8 +14,12 @@ from cubane.lib.mail import cubane_send_cms_enquiry_mail
 from cubane.lib.mail import cubane_send_shop_mail
 from cubane.lib.mail import get_ordered_list_of_fields
 from cubane.lib.mail import get_decoded_email_body
+from cubane.lib.mail import get_email_message_payload
+from cubane.lib.mail import get_email_message_from_payload
+from cubane.lib.libjson import to_json, decode_json
 from cubane.cms.models import Page
 from cubane.testapp.models import Settings
+from email.mime.text import MIMEText
 import re
 import os
 
@@ -301,3 +306,40 @@ class LibMailGetDecodedEmailBodyTestCase(LibMailBaseTestCase):
             text.decode('utf-8')
         except UnicodeError:
             self.assertTrue(False, 'decoded email message body is not UTF-8 encoded byte string.')
+
+
+class LibMailEmailMessagePayloadTestCase(CubaneTestCase):
+    """
+    cubane.lib.mail.get_email_message_payload()
+    cubane.lib.mail.get_email_message_from_payload()
+    """
+    def test_should_restore_email_message_from_json_payload(self):
+        msg = EmailMultiAlternatives(
+            'Bestellung Nr. 1 – Übersicht',
+            'Text',
+            'shop@innershed.com',
+            ['a@innershed.com'],
+            bcc=['b@innershed.com'],
+            headers={'Reply-To': 'noreply@innershed.com'},
+            cc=['c@innershed.com']
+        )
+        msg.attach_alternative('<h1>Übersicht</h1>', 'text/html')
+        msg.attach('invoice.pdf', b'%PDF-\x00\xff', 'application/pdf')
+        msg.attach('notes.txt', 'Notes', 'text/plain')
+
+        payload = decode_json(to_json(get_email_message_payload(msg)))
+        restored = get_email_message_from_payload(payload)
+
+        self.assertEqual(msg.subject, restored.subject)
+        self.assertEqual(msg.body, restored.body)
+        self.assertEqual(msg.from_email, restored.from_email)
+        self.assertEqual(msg.recipients(), restored.recipients())
+        self.assertEqual(msg.extra_headers, restored.extra_headers)
+        self.assertEqual(msg.alternatives, [tuple(a) for a in restored.alternatives])
+        self.assertEqual(msg.attachments, restored.attachments)
+
+
+    def test_should_not_represent_mime_attachments(self):
+        msg = EmailMultiAlternatives('Test', 'Text', 'shop@innershed.com', ['a@innershed.com'])
+        msg.attach(MIMEText('Text'))
+        self.assertIsNone(get_email_message_payload(msg))
@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 from cubane.tests.base import CubaneTestCase
 from django.test.utils import override_settings
 from cubane.lib.minify import minify_files
+from cubane.lib.minify import html_minify_stream
 from cubane.lib.file import file_get_contents
 import tempfile
 import os
@@ -144,4 +145,115 @@ class LibMinifyFilesTestCase(CubaneTestCase):
         content = file_get_contents(dst_filename)
         os.remove(dst_filename)
 
-        return content
\ No newline at end of file
+        return content
+
+
+class LibHtmlMinifyStreamTestCase(CubaneTestCase):
+    """
+    cubane.lib.minify.html_minify_stream()
+    """
+    def test_should_collapse_white_space(self):
+        self.assertEqual(
+            '<p>Hello <b>World</b> !</p>',
+            self._minify('<p>  Hello \n\n  <b>World</b>\t!  </p>')
+        )
+
+
+    def test_should_collapse_white_space_between_block_elements(self):
+        self.assertEqual(
+            '<div> <h1>Foo</h1> <p>Bar</p> </div>',
+            self._minify('<div>\n  <h1>Foo</h1>\n  <p>Bar</p>\n</div>')
+        )
+
+
+    def test_should_keep_white_space_between_list_items(self):
+        self.assertEqual(
+            '<ul><li>One</li> <li>Two</li></ul>',
+            self._minify('<ul><li>One</li> <li>Two</li></ul>')
+        )
+
+
+    def test_should_remove_white_space_between_text_and_block_elements(self):
+        self.assertEqual('<p>Foo</p>', self._minify('<p>\n  Foo\n</p>'))
+
+
+    def test_should_keep_cdata_sections(self):
+        self.assertEqual(
+            '<svg><style><![CDATA[a > b]]></style><![CDATA[x]]></svg>',
+            self._minify('<svg><style><![CDATA[a > b]]></style><![CDATA[x]]></svg>')
+        )
+
+
+    def test_should_keep_white_space_between_inline_elements(self):
+        self.assertEqual(
+            '<a href="#">Foo</a> <span>Bar</span>',
+            self._minify('<a href="#">Foo</a>\n  <span>Bar</span>')
+        )
+
+
+    def test_should_keep_non_breaking_space(self):
+        self.assertEqual('<p>a\xa0b &nbsp; &#160;</p>', self._minify('<p>a\xa0b &nbsp;  &#160;</p>'))
+
+
+    def test_should_not_add_semicolon_to_bare_ampersand(self):
+        self.assertEqual('<p>AT&T rocks</p>', self._minify('<p>AT&T rocks</p>'))
+        self.assertEqual('<p>Fish &chips</p>', self._minify('<p>Fish &chips</p>'))
+        self.assertEqual('<p>AT&T rocks</p>', self._minify('<p>AT&T rocks</p>', chunk_size=1))
+
+
+    def test_should_not_add_semicolon_to_unterminated_charref(self):
+        self.assertEqual('<p>&#38 x &#x26 y</p>', self._minify('<p>&#38 x &#x26 y</p>'))
+
+
+    def test_should_keep_terminated_references(self):
+        self.assertEqual('<p>A &amp; B &#38; C &#x26;</p>', self._minify('<p>A &amp; B &#38; C &#x26;</p>'))
+
+
+    def test_should_preserve_content_of_pre_textarea_script_and_style(self):
+        html = (
+            '<pre>  a\n  b </pre>' +
+            '<textarea> x  y </textarea>' +
+            '<script>\n  var a = "<b>  x</b>";\n</script>' +
+            '<style>\n  a { color: red; }\n</style>'
+        )
+        self.assertEqual(html, self._minify(html))
+
+
+    def test_should_remove_comments_but_keep_conditional_comments(self):
+        self.assertEqual(
+            '<!--[if IE]><p>IE</p><![endif]--><p>Foo</p>',
+            self._minify('<!-- comment --><!--[if IE]><p>IE</p><![endif]--><p>Foo</p>')
+        )
+
+
+    def test_should_remove_end_tag_of_void_elements(self):
+        self.assertEqual(
+            '<video><source src="a.mp4"></video>',
+            self._minify('<video><source src="a.mp4"></source></video>')
+        )
+
+
+    def test_should_keep_doctype_and_attributes(self):
+        self.assertEqual(
+            '<!DOCTYPE html> <html> <body class="a  b" data-x=\'1\'> <br/> </body> </html>',
+            self._minify('<!DOCTYPE html>\n<html>\n<body class="a  b" data-x=\'1\'>\n<br/>\n</body>\n</html>')
+        )
+
+
+    def test_should_yield_same_result_for_any_chunk_size(self):
+        html = (
+            '<!DOCTYPE html><html><head><title> A &amp; B </title>' +
+            '<script> var a = 1; </script></head><body>' +
+            '<p>Hello   <b>World</b> &nbsp; <a href="/">link</a></p>' +
+            '<pre> x </pre></body></html>'
+        )
+        expected = self._minify(html)
+        for size in range(1, 20):
+            self.assertEqual(expected, self._minify(html, size))
+
+
+    def _minify(self, html, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = len(html)
+        chunks = [html[i:i + chunk_size] for i in range(0, len(html), chunk_size)]
+        return ''.join(html_minify_stream(chunks))
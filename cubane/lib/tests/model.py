@@ -1,5 +1,6 @@
 # coding=UTF-8
 from __future__ import unicode_literals
+from django.db import connection
 from django.db.models import QuerySet
 from cubane.tests.base import CubaneTestCase
 from cubane.lib.model import get_model_field_names
@@ -7,6 +8,7 @@ from cubane.lib.model import model_has_many_to_many
 from cubane.lib.model import model_to_dict
 from cubane.lib.model import dict_to_model
 from cubane.lib.model import save_model
+from cubane.lib.model import bulk_update
 from cubane.lib.model import validate_model
 from cubane.lib.model import IncompatibleModelError
 from cubane.lib.model import get_model_related_field
@@ -17,6 +19,7 @@ from cubane.cms.models import Page
 from cubane.media.models import Media
 from django.template.defaultfilters import slugify
 import datetime
+import mock
 
 
 class GetModelFieldNamesTestCase(CubaneTestCase):
@@ -211,6 +214,51 @@ class SaveModelTestCase(CubaneTestCase):
         self.assertEqual(instance.title, 'New Title', 'Title should have changed')
 
 
+class BulkUpdateTestCase(CubaneTestCase):
+    """
+    cubane.lib.model.bulk_update()
+    """
+    def test_bulk_update_should_update_given_fields_of_all_instances_in_batches(self):
+        instances = [TestModel.objects.create(title='Title %d' % i, text='Text') for i in range(5)]
+        for i, instance in enumerate(instances):
+            instance.title = 'New Title %d' % i
+            instance.text = None
+
+        with self.assertNumQueries(3):
+            self.assertEqual(5, bulk_update(instances, ['title'], batch_size=2))
+
+        self.assertEqual(
+            [('New Title %d' % i, 'Text') for i in range(5)],
+            list(TestModel.objects.filter(pk__in=[instance.pk for instance in instances]).order_by('id').values_list('title', 'text'))
+        )
+        TestModel.objects.all().delete()
+
+
+    def test_bulk_update_should_limit_batch_size_to_max_query_parameters(self):
+        instances = [TestModel.objects.create(title='Title %d' % i, text='Text') for i in range(5)]
+        with mock.patch.object(connection.ops, 'bulk_batch_size', return_value=2) as bulk_batch_size:
+            with self.assertNumQueries(3):
+                self.assertEqual(5, bulk_update(instances, ['title', 'text']))
+
+        self.assertEqual(5, len(bulk_batch_size.call_args[0][0]))
+        TestModel.objects.all().delete()
+
+
+    def test_bulk_update_should_update_foreign_keys(self):
+        media = Media.objects.create(caption='Test')
+        instance = TestModel.objects.create(title='Title')
+        instance.image = media
+        bulk_update([instance], ['image'])
+        self.assertEqual(media.pk, TestModel.objects.get(pk=instance.pk).image_id)
+        instance.delete()
+        media.delete()
+
+
+    def test_bulk_update_should_ignore_empty_list(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(0, bulk_update([], ['title']))
+
+
 class TestValidateModelTestCase(CubaneTestCase):
     """
     cubane.lib.model.validate_model()
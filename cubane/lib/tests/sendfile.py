@@ -0,0 +1,134 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from django.test.utils import override_settings
+from django.test.client import RequestFactory
+from django.utils.http import http_date
+from cubane.tests.base import CubaneTestCase
+from cubane.lib.sendfile import (
+    sendfile,
+    get_sendfile_backend,
+    StreamingSendfileBackend,
+    NginxSendfileBackend,
+    XSendfileBackend
+)
+import os
+import mock
+import shutil
+import tempfile
+
+
+class LibSendfileTestCaseBase(CubaneTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.root, 'folder', 'test file.jpg')
+        os.makedirs(os.path.dirname(self.filepath))
+        shutil.copyfile(self.get_test_image_path('test.jpg'), self.filepath)
+        self.request = RequestFactory().get('/')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+    def assertHeaders(self, response, content_type='image/jpeg'):
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(content_type, response['Content-Type'])
+        self.assertEqual(http_date(os.path.getmtime(self.filepath)), response['Last-Modified'])
+
+
+class LibSendfileGetSendfileBackendTestCase(CubaneTestCase):
+    """
+    cubane.lib.sendfile.get_sendfile_backend()
+    """
+    @override_settings(CUBANE_SENDFILE_BACKEND=None)
+    def test_should_return_streaming_backend_by_default(self):
+        self.assertIsInstance(get_sendfile_backend(), StreamingSendfileBackend)
+
+
+    @override_settings(CUBANE_SENDFILE_BACKEND='cubane.lib.sendfile.NginxSendfileBackend')
+    def test_should_return_configured_backend(self):
+        self.assertIsInstance(get_sendfile_backend(), NginxSendfileBackend)
+
+
+@override_settings(CUBANE_SENDFILE_BACKEND=None)
+class LibSendfileStreamingTestCase(LibSendfileTestCaseBase):
+    """
+    cubane.lib.sendfile.sendfile() (streaming)
+    """
+    def test_should_hand_over_file_to_wsgi_server(self):
+        response = sendfile(self.request, self.filepath)
+        self.assertHeaders(response)
+        self.assertEqual(unicode(os.path.getsize(self.filepath)), response['Content-Length'])
+        self.assertIsNotNone(response.file_to_stream)
+        self.assertEqual(self.filepath, response.file_to_stream.name)
+
+        # nothing has been read from the file yet
+        self.assertEqual(0, response.file_to_stream.tell())
+        response.close()
+
+
+    def test_should_send_attachment(self):
+        response = sendfile(self.request, self.filepath, 'application/force-download', 'download.jpg')
+        self.assertHeaders(response, 'application/force-download')
+        self.assertEqual('attachment; filename="download.jpg"', response['Content-Disposition'])
+        response.close()
+
+
+    def test_should_return_not_modified_if_not_modified_since(self):
+        request = RequestFactory().get('/', HTTP_IF_MODIFIED_SINCE=http_date(os.path.getmtime(self.filepath)))
+        response = sendfile(request, self.filepath)
+        self.assertEqual(304, response.status_code)
+
+
+class LibSendfileOffloadTestCaseBase(LibSendfileTestCaseBase):
+    def sendfile(self, *args, **kwargs):
+        # file content must not pass through python
+        with mock.patch('cubane.lib.sendfile.open', create=True, side_effect=AssertionError('File opened.')):
+            response = sendfile(self.request, self.filepath, *args, **kwargs)
+        self.assertEqual(b'', response.content)
+        self.assertFalse(response.has_header('Content-Length'))
+        return response
+
+
+@override_settings(
+    CUBANE_SENDFILE_BACKEND='cubane.lib.sendfile.NginxSendfileBackend',
+    CUBANE_SENDFILE_URL='/protected/'
+)
+class LibSendfileNginxTestCase(LibSendfileOffloadTestCaseBase):
+    """
+    cubane.lib.sendfile.sendfile() (nginx)
+    """
+    def test_should_offload_file_to_nginx(self):
+        with self.settings(CUBANE_SENDFILE_ROOT=self.root):
+            response = self.sendfile()
+        self.assertHeaders(response)
+        self.assertEqual('/protected/folder/test%20file.jpg', response['X-Accel-Redirect'])
+
+
+    def test_should_offload_attachment_to_nginx(self):
+        with self.settings(CUBANE_SENDFILE_ROOT=self.root):
+            response = self.sendfile('application/force-download', 'download.jpg')
+        self.assertHeaders(response, 'application/force-download')
+        self.assertEqual('attachment; filename="download.jpg"', response['Content-Disposition'])
+        self.assertEqual('/protected/folder/test%20file.jpg', response['X-Accel-Redirect'])
+
+
+    def test_should_stream_file_outside_of_sendfile_root(self):
+        with self.settings(CUBANE_SENDFILE_ROOT=os.path.join(self.root, 'fold')):
+            response = sendfile(self.request, self.filepath)
+        self.assertHeaders(response)
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+        self.assertIsNotNone(response.file_to_stream)
+        response.close()
+
+
+@override_settings(CUBANE_SENDFILE_BACKEND='cubane.lib.sendfile.XSendfileBackend')
+class LibSendfileXSendfileTestCase(LibSendfileOffloadTestCaseBase):
+    """
+    cubane.lib.sendfile.sendfile() (X-Sendfile)
+    """
+    def test_should_offload_file_to_web_server(self):
+        response = self.sendfile()
+        self.assertHeaders(response)
+        self.assertEqual(self.filepath, response['X-Sendfile'])
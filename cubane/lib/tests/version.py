@@ -0,0 +1,71 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.test.utils import override_settings
+from django.core.cache import caches
+from cubane.tests.base import CubaneTestCase
+from cubane.lib.version import get_version_stamp, bump_version_stamp
+import cubane.lib.version
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cubane-lib-version-tests'
+    }
+}
+
+
+class LibVersionStampLocalTestCase(CubaneTestCase):
+    """
+    cubane.lib.version.get_version_stamp()
+    cubane.lib.version.bump_version_stamp()
+    """
+    KEY = 'cubane_test_local_version'
+
+
+    def tearDown(self):
+        cubane.lib.version._LOCAL_VERSIONS.pop(self.KEY, None)
+
+
+    def test_should_return_same_version_until_bumped(self):
+        version = get_version_stamp(self.KEY)
+        self.assertEqual(version, get_version_stamp(self.KEY))
+
+
+    def test_should_return_new_version_after_bump(self):
+        version = get_version_stamp(self.KEY)
+        bumped = bump_version_stamp(self.KEY)
+        self.assertNotEqual(version, bumped)
+        self.assertEqual(bumped, get_version_stamp(self.KEY))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LibVersionStampSharedTestCase(CubaneTestCase):
+    """
+    cubane.lib.version.get_version_stamp()
+    cubane.lib.version.bump_version_stamp()
+    """
+    KEY = 'cubane_test_shared_version'
+
+
+    def tearDown(self):
+        caches['default'].delete(self.KEY)
+        cubane.lib.version._LOCAL_VERSIONS.pop(self.KEY, None)
+
+
+    def test_should_store_version_in_cache(self):
+        version = get_version_stamp(self.KEY, 'default')
+        self.assertEqual(version, caches['default'].get(self.KEY))
+
+
+    def test_should_return_version_changed_by_other_process(self):
+        get_version_stamp(self.KEY, 'default')
+        caches['default'].set(self.KEY, 'changed', None)
+        self.assertEqual('changed', get_version_stamp(self.KEY, 'default'))
+
+
+    def test_should_store_new_version_in_cache_after_bump(self):
+        version = get_version_stamp(self.KEY, 'default')
+        bumped = bump_version_stamp(self.KEY, 'default')
+        self.assertNotEqual(version, bumped)
+        self.assertEqual(bumped, caches['default'].get(self.KEY))
@@ -0,0 +1,83 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from cubane.tests.base import CubaneTestCase
+from cubane.lib.zipstream import zip_stream, is_stored, ZIP_STORED, ZIP_DEFLATED
+import os
+import io
+import mock
+import shutil
+import zipfile
+import tempfile
+
+
+class LibZipStreamTestCase(CubaneTestCase):
+    """
+    cubane.lib.zipstream.zip_stream()
+    """
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.files = [
+            (self._create_file('test.txt', b'Hello World\n' * 10000), 'test.txt'),
+            (self.get_test_image_path('test.jpg'), 'test.jpg'),
+            (self.get_test_image_path('test.png'), 'folder/test.png'),
+            (self._create_file('empty.txt', b''), 'über.txt'),
+        ]
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_should_generate_valid_zip_archive(self):
+        zf = self._get_zip_file(self.files)
+        self.assertIsNone(zf.testzip())
+        self.assertEqual([arcname for _, arcname in self.files], zf.namelist())
+        for filepath, arcname in self.files:
+            with open(filepath, 'rb') as f:
+                self.assertEqual(f.read(), zf.read(arcname))
+
+
+    def test_should_store_compressed_files_without_compression(self):
+        zf = self._get_zip_file(self.files)
+        self.assertEqual(ZIP_DEFLATED, zf.getinfo('test.txt').compress_type)
+        self.assertEqual(ZIP_STORED, zf.getinfo('test.jpg').compress_type)
+        self.assertEqual(ZIP_STORED, zf.getinfo('folder/test.png').compress_type)
+        self.assertTrue(zf.getinfo('test.txt').compress_size < zf.getinfo('test.txt').file_size)
+
+
+    def test_should_yield_chunks_of_bounded_size(self):
+        for chunk in zip_stream(self.files, chunk_size=1024):
+            self.assertTrue(len(chunk) <= 1024 + 64)
+
+
+    def test_should_read_files_lazily(self):
+        stream = zip_stream(self.files + [(os.path.join(self.path, 'does-not-exist.txt'), 'x.txt')])
+        next(stream)
+
+
+    def test_should_generate_zip64_archive_for_large_archives(self):
+        with mock.patch('cubane.lib.zipstream.ZIP64_LIMIT', 1024):
+            zf = self._get_zip_file(self.files)
+        self.assertIsNone(zf.testzip())
+        for filepath, arcname in self.files:
+            with open(filepath, 'rb') as f:
+                self.assertEqual(f.read(), zf.read(arcname))
+
+
+    def test_is_stored_should_return_true_for_compressed_files(self):
+        self.assertTrue(is_stored('test.JPG'))
+        self.assertTrue(is_stored('test.png'))
+        self.assertFalse(is_stored('test.pdf'))
+        self.assertFalse(is_stored('test'))
+
+
+    def _create_file(self, filename, content):
+        path = os.path.join(self.path, filename)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+
+    def _get_zip_file(self, files):
+        return zipfile.ZipFile(io.BytesIO(b''.join(zip_stream(files))))
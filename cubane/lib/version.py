@@ -0,0 +1,40 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.core.cache import caches
+import uuid
+
+
+# version stamps that are local to the current process
+_LOCAL_VERSIONS = {}
+
+
+def get_version_stamp(key, alias=None):
+    """
+    Return the current version stamp with the given key. If the name of a
+    Django cache is given, the version stamp is shared by all processes that
+    use the same cache; otherwise the version stamp is local to the current
+    process.
+    """
+    if alias:
+        cache = caches[alias]
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+        return version
+    else:
+        if key not in _LOCAL_VERSIONS:
+            _LOCAL_VERSIONS[key] = uuid.uuid4().hex
+        return _LOCAL_VERSIONS[key]
+
+
+def bump_version_stamp(key, alias=None):
+    """
+    Replace the version stamp with the given key with a new unique version
+    stamp and return it.
+    """
+    version = uuid.uuid4().hex
+    if alias:
+        caches[alias].set(key, version, None)
+    _LOCAL_VERSIONS[key] = version
+    return version
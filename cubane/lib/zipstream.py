@@ -0,0 +1,276 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+import os
+import stat
+import time
+import zlib
+import struct
+
+
+# size of chunks that are read from files
+CHUNK_SIZE = 64 * 1024
+
+
+# file extensions of files that are already compressed and are therefore
+# stored without any further compression
+STORED_EXTENSIONS = [
+    '.jpg',
+    '.jpeg',
+    '.png',
+    '.gif',
+    '.webp',
+    '.zip',
+    '.gz',
+    '.mp3',
+    '.mp4'
+]
+
+
+# zip format constants
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = 0xffff
+ZIP_MAX = 0xffffffff
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+SYSTEM_UNIX = 3
+
+
+class ZipEntry(object):
+    """
+    Information about a single file within a zip archive that is required for
+    writing the central directory at the end of the archive.
+    """
+    def __init__(self, arcname, offset, mtime, mode, method, zip64):
+        self.arcname = arcname.encode('utf-8')
+        self.offset = offset
+        self.date, self.time = get_dos_date_time(mtime)
+        self.mode = mode
+        self.method = method
+        self.zip64 = zip64
+        self.crc = 0
+        self.compressed_size = 0
+        self.size = 0
+
+
+    @property
+    def flags(self):
+        return FLAG_DATA_DESCRIPTOR | FLAG_UTF8
+
+
+    @property
+    def version(self):
+        return VERSION_ZIP64 if self.zip64 else VERSION_DEFAULT
+
+
+    def get_local_header(self):
+        """
+        Return the local file header for this entry. File sizes and CRC are
+        unknown at this point and follow the file data in a data descriptor.
+        """
+        extra = b''
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+
+        return struct.pack(
+            '<IHHHHHIIIHH',
+            0x04034b50,
+            self.version,
+            self.flags,
+            self.method,
+            self.time,
+            self.date,
+            0,
+            ZIP_MAX if self.zip64 else 0,
+            ZIP_MAX if self.zip64 else 0,
+            len(self.arcname),
+            len(extra)
+        ) + self.arcname + extra
+
+
+    def get_data_descriptor(self):
+        """
+        Return the data descriptor for this entry, which follows the file data.
+        """
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.compressed_size, self.size)
+        else:
+            return struct.pack('<IIII', 0x08074b50, self.crc, self.compressed_size, self.size)
+
+
+    def get_central_directory_header(self):
+        """
+        Return the central directory header for this entry.
+        """
+        size = self.size
+        compressed_size = self.compressed_size
+        offset = self.offset
+        extra_values = []
+        if size > ZIP64_LIMIT or compressed_size > ZIP64_LIMIT:
+            extra_values.extend([size, compressed_size])
+            size = compressed_size = ZIP_MAX
+        if offset > ZIP64_LIMIT:
+            extra_values.append(offset)
+            offset = ZIP_MAX
+
+        extra = b''
+        version = self.version
+        if extra_values:
+            extra = struct.pack(
+                '<HH' + 'Q' * len(extra_values),
+                0x0001,
+                8 * len(extra_values),
+                *extra_values
+            )
+            version = VERSION_ZIP64
+
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII',
+            0x02014b50,
+            version | (SYSTEM_UNIX << 8),
+            version,
+            self.flags,
+            self.method,
+            self.time,
+            self.date,
+            self.crc,
+            compressed_size,
+            size,
+            len(self.arcname),
+            len(extra),
+            0,
+            0,
+            0,
+            (self.mode & 0xffff) << 16,
+            offset
+        ) + self.arcname + extra
+
+
+def get_dos_date_time(mtime):
+    """
+    Return the given timestamp as a tuple of date and time in MS-DOS format.
+    """
+    t = time.localtime(mtime)
+    year = max(1980, min(2107, t.tm_year))
+    date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    _time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return date, _time
+
+
+def is_stored(filename):
+    """
+    Return True, if the given file is already compressed and should therefore
+    be stored within a zip archive without any further compression.
+    """
+    _, ext = os.path.splitext(filename)
+    return ext.lower() in STORED_EXTENSIONS
+
+
+def zip_stream(files, chunk_size=CHUNK_SIZE, compress_level=6):
+    """
+    Generate a zip archive containing the given list of files, where each file
+    is given as a tuple of the full path to the file on disk and the filename
+    within the archive. The archive is yielded in chunks as files are read,
+    therefore the archive is never held in memory or written to disk as a
+    whole. Files that are already compressed (such as JPEG or PNG images) are
+    stored without further compression.
+    """
+    entries = []
+    offset = 0
+
+    for filepath, arcname in files:
+        st = os.stat(filepath)
+        method = ZIP_STORED if is_stored(filepath) else ZIP_DEFLATED
+        entry = ZipEntry(
+            arcname,
+            offset,
+            st.st_mtime,
+            stat.S_IMODE(st.st_mode) | stat.S_IFREG,
+            method,
+            st.st_size > ZIP64_LIMIT
+        )
+
+        header = entry.get_local_header()
+        offset += len(header)
+        yield header
+
+        # file data
+        crc = 0
+        size = 0
+        compressed_size = 0
+        compressor = None
+        if method == ZIP_DEFLATED:
+            compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+
+        with open(filepath, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+
+                if chunk:
+                    compressed_size += len(chunk)
+                    yield chunk
+
+        if compressor:
+            chunk = compressor.flush()
+            compressed_size += len(chunk)
+            yield chunk
+
+        entry.crc = crc & 0xffffffff
+        entry.size = size
+        entry.compressed_size = compressed_size
+        descriptor = entry.get_data_descriptor()
+        offset += compressed_size + len(descriptor)
+        yield descriptor
+        entries.append(entry)
+
+    # central directory
+    cd_offset = offset
+    cd_size = 0
+    for entry in entries:
+        header = entry.get_central_directory_header()
+        cd_size += len(header)
+        yield header
+
+    # end of central directory (zip64 if required)
+    n = len(entries)
+    if n > ZIP_FILECOUNT_LIMIT or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+        zip64_offset = cd_offset + cd_size
+        yield struct.pack(
+            '<IQHHIIQQQQ',
+            0x06064b50,
+            44,
+            VERSION_ZIP64 | (SYSTEM_UNIX << 8),
+            VERSION_ZIP64,
+            0,
+            0,
+            n,
+            n,
+            cd_size,
+            cd_offset
+        )
+        yield struct.pack('<IIQI', 0x07064b50, 0, zip64_offset, 1)
+        n = ZIP_FILECOUNT_LIMIT
+        cd_offset = ZIP_MAX
+        cd_size = ZIP_MAX
+
+    yield struct.pack(
+        '<IHHHHIIH',
+        0x06054b50,
+        0,
+        0,
+        n,
+        n,
+        cd_size,
+        cd_offset,
+        0
+    )
@@ -0,0 +1,346 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from cubane.lib.filelock import FileLock
+from cubane.lib.image import get_svg_layer_instructions, get_colorized_svg_image
+import os
+import time
+import codecs
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class MediaCache(object):
+    """
+    Keeps track of image versions that have been generated on demand and
+    evicts the least recently used image versions once the total size of all
+    image versions on disk exceeds the given maximum size in bytes. Image
+    versions are ordered by their last access time, which is updated whenever
+    an image version is served by the media api.
+    """
+    LOW_WATERMARK = 0.9
+
+
+    def __init__(self, path=None, max_size=-1):
+        """
+        Create a new media cache for the given path (usually the shapes folder
+        within MEDIA_ROOT) and the given maximum size in bytes.
+        """
+        if path is None:
+            path = os.path.join(settings.MEDIA_ROOT, 'shapes')
+
+        if max_size == -1:
+            max_size = settings.IMAGE_ON_DEMAND_MAX_SIZE
+
+        self.path = path
+        self.max_size = max_size
+
+
+    def get_usage_filename(self):
+        """
+        Return the full path to the file that keeps track of the (estimated)
+        total size of all image versions, which lives next to the folder
+        containing all image versions, e.g. `.shapes-usage`.
+        """
+        return os.path.join(
+            os.path.dirname(self.path),
+            '.%s-usage' % os.path.basename(self.path)
+        )
+
+
+    def get_usage(self):
+        """
+        Return the (estimated) total size of all image versions in bytes as
+        recorded by the usage index.
+        """
+        try:
+            with open(self.get_usage_filename(), 'r') as f:
+                return int(f.read().strip())
+        except (IOError, ValueError):
+            return 0
+
+
+    def set_usage(self, usage):
+        """
+        Update the (estimated) total size of all image versions in bytes.
+        """
+        filename = self.get_usage_filename()
+        temp_filename = '%s.tmp' % filename
+        with open(temp_filename, 'w') as f:
+            f.write('%d' % usage)
+        os.rename(temp_filename, filename)
+
+
+    def get_files(self):
+        """
+        Return a list of all image versions as tuples of last access time,
+        file size and full path.
+        """
+        files = []
+        for root, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                # ignore temporary files
+                if filename.startswith('.'):
+                    continue
+
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_atime, st.st_size, path))
+        return files
+
+
+    def touch(self, path):
+        """
+        Mark the given image version as recently used by updating its last
+        access time. The modification time remains the same.
+        """
+        try:
+            st = os.stat(path)
+            os.utime(path, (time.time(), st.st_mtime))
+        except OSError:
+            pass
+
+
+    def add(self, path):
+        """
+        Add the given image version, which has just been generated. If the
+        total size of all image versions exceeds the maximum size, the least
+        recently used image versions are evicted.
+        """
+        if not self.max_size:
+            return
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+
+        lock = FileLock.temp(settings.DOMAIN_NAME, 'media-usage', self.path)
+        lock.acquire()
+        try:
+            usage = self.get_usage() + size
+            if usage > self.max_size:
+                usage = self.evict(exclude=[path])
+            self.set_usage(usage)
+        finally:
+            lock.release()
+
+
+    def evict(self, exclude=[]):
+        """
+        Evict the least recently used image versions until the total size of
+        all image versions is below the maximum size (with some head room).
+        Image versions that are given as part of the exclude list are never
+        evicted. Return the resulting total size of all image versions.
+        """
+        files = self.get_files()
+        usage = sum([size for _, size, _ in files])
+        if not self.max_size or usage <= self.max_size:
+            return usage
+
+        target = int(self.max_size * self.LOW_WATERMARK)
+        for _, size, path in sorted(files):
+            if usage <= target:
+                break
+
+            if path in exclude:
+                continue
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            usage -= size
+
+            # remove parent folder if empty
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+        return usage
+
+
+class SvgCache(object):
+    """
+    Memoises colourised svg images, so that the same svg image with the same
+    colourisation instructions is only parsed and colourised once. Results are
+    kept in a bounded in-memory LRU cache and (optionally) within an on-disk
+    cache which is shared between processes. Cache entries are identified by
+    the svg file, its modification time and size and the normalised
+    colourisation instructions, therefore changing the svg file will
+    implicitly invalidate all cache entries for it.
+    """
+    def __init__(self, max_entries=None, path=-1, max_size=-1):
+        """
+        Create a new svg cache holding at most the given number of entries in
+        memory. If a path is given, cache entries are also stored on disk
+        within the given folder, limited to the given total size in bytes.
+        """
+        if max_entries is None:
+            max_entries = settings.IMAGE_SVG_CACHE_ENTRIES
+
+        if path == -1:
+            path = settings.IMAGE_SVG_CACHE_ROOT
+
+        if max_size == -1:
+            max_size = settings.IMAGE_SVG_CACHE_MAX_SIZE
+
+        self.max_entries = max_entries
+        self.path = path
+        self.disk_cache = MediaCache(path, max_size) if path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get_key(self, filename, layers, st=None):
+        """
+        Return the cache key for the given svg file and the given
+        colourisation instructions, which is also suitable as an ETag.
+        """
+        if st is None:
+            st = os.stat(filename)
+
+        m = hashlib.sha1()
+        m.update(filename.encode('utf-8'))
+        m.update(('|%r|%d|' % (st.st_mtime, st.st_size)).encode('utf-8'))
+        m.update(repr(get_svg_layer_instructions(layers)).encode('utf-8'))
+        return m.hexdigest()
+
+
+    def get(self, key):
+        """
+        Return the cached svg content for the given key or None.
+        """
+        with self._lock:
+            content = self._entries.pop(key, None)
+            if content is not None:
+                self._entries[key] = content
+                return content
+
+        if self.disk_cache:
+            path = self.get_path(key)
+            try:
+                with codecs.open(path, 'r', 'utf-8') as f:
+                    content = f.read()
+            except IOError:
+                return None
+
+            self.disk_cache.touch(path)
+            self._set_entry(key, content)
+            return content
+
+        return None
+
+
+    def set(self, key, content):
+        """
+        Store the given svg content for the given key.
+        """
+        self._set_entry(key, content)
+
+        if self.disk_cache:
+            path = self.get_path(key)
+            if not os.path.isdir(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    pass
+
+            temp_path = get_temp_path(path)
+            try:
+                with codecs.open(temp_path, 'w', 'utf-8') as f:
+                    f.write(content)
+                os.rename(temp_path, path)
+            finally:
+                if os.path.isfile(temp_path):
+                    os.remove(temp_path)
+
+            self.disk_cache.add(path)
+
+
+    def get_colorized_svg_image(self, filename, layers, key=None):
+        """
+        Return the colourised svg image for the given svg file and the given
+        colourisation instructions from cache or colourise the svg image and
+        store the result in the cache.
+        """
+        if key is None:
+            key = self.get_key(filename, layers)
+
+        content = self.get(key)
+        if content is None:
+            content = get_colorized_svg_image(filename, layers)
+            self.set(key, content)
+        return content
+
+
+    def get_path(self, key):
+        """
+        Return the full path to the on-disk cache entry for the given key.
+        """
+        return os.path.join(self.path, key[:2], '%s.svg' % key)
+
+
+    def clear(self):
+        """
+        Clear the in-memory cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+    def _set_entry(self, key, content):
+        """
+        Store the given content for the given key in memory and evict the
+        least recently used entries if we exceeded the maximum number of
+        entries.
+        """
+        if not self.max_entries:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = content
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_svg_cache = None
+
+
+def get_svg_cache():
+    """
+    Return the process-wide svg cache.
+    """
+    global _svg_cache
+    if _svg_cache is None:
+        _svg_cache = SvgCache()
+    return _svg_cache
+
+
+def get_temp_path(path):
+    """
+    Return the full path to a new temporary file within the same folder as the
+    given file with the same file extension, so that the given file can be
+    replaced atomically once the temporary file has been written.
+    """
+    base, ext = os.path.splitext(path)
+    fd, temp_path = tempfile.mkstemp(
+        suffix=ext,
+        prefix='.%s.' % os.path.basename(base),
+        dir=os.path.dirname(path)
+    )
+    os.close(fd)
+
+    # mkstemp() creates files that are only readable by the owner
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(temp_path, 0o666 & ~umask)
+
+    return temp_path
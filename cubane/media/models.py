@@ -2,6 +2,7 @@
 from __future__ import unicode_literals
 from django.conf import settings
 from django.db import models
+from django.db import connections
 from django.template.defaultfilters import slugify
 from django.contrib.humanize.templatetags.humanize import intcomma
 from django.utils import timezone
@@ -12,12 +13,16 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from cubane.models import DateTimeBase
 from cubane.cms.cache import Cache
+from cubane.media.cache import MediaCache, get_temp_path
 from cubane.lib.url import url_join, make_absolute_url
 from cubane.lib.file import ensure_dir, get_caption_from_filename
 from cubane.lib.file import file_move
+from cubane.lib.filelock import FileLock
 from cubane.lib.image import *
 from cubane.lib.libjson import to_json, decode_json
+from cubane.lib.download import download_file, download_files
 from cubane.tasks import TaskRunner
+from collections import OrderedDict
 import re
 import os
 import shutil
@@ -26,12 +31,101 @@ import uuid
 import hashlib
 import random
 import string
-import requests
+import multiprocessing
 
 
 MAX_FILENAME_LENGTH = 255
 
 
+# number of lock files that are shared by all image versions that are
+# generated on demand
+IMAGE_ON_DEMAND_LOCKS = 64
+
+
+# image that is used by an image resize worker process
+_RESIZE_WORKER_IMAGE = None
+
+
+def _init_image_resize_worker(filename):
+    """
+    Initialise an image resize worker process by opening the given image
+    once for the lifetime of the worker process. ImageMagick is restricted
+    to a single thread per worker process, since we are already resizing
+    images in parallel. An initializer must not fail, otherwise the pool
+    would keep replacing failed worker processes forever; if the image
+    cannot be opened, the worker rejects all jobs instead.
+    """
+    global _RESIZE_WORKER_IMAGE
+
+    try:
+        from wand.resource import limits
+        limits['thread'] = 1
+    except:
+        pass
+
+    try:
+        _RESIZE_WORKER_IMAGE = open_image_for_resize(filename)
+    except:
+        _RESIZE_WORKER_IMAGE = None
+
+
+def _image_resize_worker(args):
+    """
+    Generate the given list of image versions within a worker process, where
+    each image version is given as keyword arguments for resize_image_object().
+    Return the index of the job and whether the job has been processed.
+    """
+    index, job = args
+    if _RESIZE_WORKER_IMAGE is None:
+        return index, False
+
+    _resize_image_versions(_RESIZE_WORKER_IMAGE, job)
+    return index, True
+
+
+def _resize_image_versions(img, job):
+    """
+    Generate the given list of image versions based on the given image object.
+    Multiple image versions are generated by cascading from the largest
+    version to the smallest version. Each image version is written to a
+    temporary file first, which is then renamed, so that nobody ever reads a
+    partially written image version.
+    """
+    paths = []
+    temp_job = []
+    for kwargs in job:
+        kwargs = dict(kwargs)
+        paths.append(kwargs['dst_filename'])
+        kwargs['dst_filename'] = get_temp_path(kwargs['dst_filename'])
+        temp_job.append(kwargs)
+
+    try:
+        if len(temp_job) > 1:
+            resize_image_object_pyramid(img, temp_job)
+        else:
+            for kwargs in temp_job:
+                resize_image_object(img, **kwargs)
+
+        for path, kwargs in zip(paths, temp_job):
+            os.rename(kwargs['dst_filename'], path)
+    finally:
+        for kwargs in temp_job:
+            if os.path.isfile(kwargs['dst_filename']):
+                os.remove(kwargs['dst_filename'])
+
+
+def get_image_on_demand_lock(path):
+    """
+    Return the file lock that serialises generating the image version with
+    the given path on demand. Image versions share a fixed number of lock
+    files, so that lock files do not accumulate.
+    """
+    m = hashlib.md5()
+    m.update(path.encode('utf-8'))
+    bucket = int(m.hexdigest(), 16) % IMAGE_ON_DEMAND_LOCKS
+    return FileLock.temp(settings.DOMAIN_NAME, 'media', bucket)
+
+
 pre_delete_media = ModelSignal(providing_args=['instance'], use_caching=True)
 
 
@@ -1137,23 +1231,159 @@ class Media(DateTimeBase):
         return int(self.get_width(size, shape) / self.get_aspect_ratio(shape))
 
 
-    def generate_images_for_shape(self, img, size, shape, valign='center', auto_fit=False):
+    def get_image_resize_args(self, size, shape, valign='center', auto_fit=False):
         """
-        Generate multiple versions of the original media assets depending on
-        global image size configuration for the given image shape.
+        Return the keyword arguments for resize_image_object() in order to
+        generate the version of the original media asset for the given image
+        size and shape.
         """
         path = self.get_image_path(size, shape)
         ensure_dir(path)
 
-        w = self.get_width(size, shape)
-        h = self.get_height(size, shape)
-
         if shape == settings.DEFAULT_IMAGE_SHAPE:
             mode = 'scale'
         else:
             mode = 'crop'
 
-        resize_image_object(img, path, w, h, mode, valign, auto_fit, self.focal_point, self.quality)
+        return {
+            'dst_filename': path,
+            'width': self.get_width(size, shape),
+            'height': self.get_height(size, shape),
+            'mode': mode,
+            'valign': valign,
+            'auto_fit': auto_fit,
+            'focal_point': self.focal_point,
+            'quality': self.quality
+        }
+
+
+    def generate_images_for_shape(self, img, size, shape, valign='center', auto_fit=False):
+        """
+        Generate multiple versions of the original media assets depending on
+        global image size configuration for the given image shape.
+        """
+        resize_image_object(img, **self.get_image_resize_args(size, shape, valign, auto_fit))
+
+
+    def get_image_versions(self, shape=None, valign='center', auto_fit=True):
+        """
+        Return a list of all image versions that need to be generated for
+        this media asset as tuples of (size, shape, valign, auto_fit). If a
+        shape is given, only image versions for the given shape are returned.
+        """
+        versions = []
+        for size in self.get_available_image_sizes().keys():
+            # original shape
+            if shape is None:
+                versions.append((size, settings.DEFAULT_IMAGE_SHAPE, valign, False))
+
+            # all configured shapes
+            for _shape in Media.get_shape_names():
+                if shape is None or shape == _shape:
+                    _auto_fit = (
+                        auto_fit and
+                        self.auto_fit and
+                        settings.IMAGE_FITTING_ENABLED and
+                        _shape in settings.IMAGE_FITTING_SHAPES
+                    )
+                    versions.append((size, _shape, valign, _auto_fit))
+        return versions
+
+
+    def get_image_resize_jobs(self, versions):
+        """
+        Return a list of jobs for generating the given list of image versions,
+        where each job is a list of keyword arguments for
+        resize_image_object(). If settings.IMAGE_RESIZE_PYRAMID is enabled,
+        all image sizes of the same shape are generated by the same job, so
+        that smaller versions can be resampled from larger versions rather
+        than from the original image; otherwise each image version is
+        generated by a separate job.
+        """
+        if not settings.IMAGE_RESIZE_PYRAMID:
+            return [[self.get_image_resize_args(*version)] for version in versions]
+
+        jobs = OrderedDict()
+        for size, shape, valign, auto_fit in versions:
+            jobs.setdefault((shape, valign, auto_fit), []).append(
+                self.get_image_resize_args(size, shape, valign, auto_fit)
+            )
+        return jobs.values()
+
+
+    @classmethod
+    def get_image_resize_workers(cls):
+        """
+        Return the number of worker processes that are used to generate
+        image versions.
+        """
+        try:
+            workers = int(settings.IMAGE_RESIZE_WORKERS)
+        except (TypeError, ValueError):
+            workers = 1
+
+        # a daemon process (e.g. a worker process) cannot have children
+        if multiprocessing.current_process().daemon:
+            workers = 1
+
+        return max(1, workers)
+
+
+    def generate_image_versions(self, request, filename, versions, img=None):
+        """
+        Generate the given list of image versions based on the given image
+        file. Image versions may be generated in parallel by a bounded pool
+        of worker processes according to settings.IMAGE_RESIZE_WORKERS, where
+        each worker opens the image once. Jobs that a worker could not process
+        are processed by the current process afterwards. Progress is reported
+        for each image version that has been generated.
+        """
+        from cubane.backend.views import Progress
+
+        jobs = self.get_image_resize_jobs(versions)
+        total = len(versions)
+        workers = min(self.get_image_resize_workers(), len(jobs))
+        i = 0
+
+        if workers > 1:
+            # worker processes must not share the database connection of
+            # this process. Connections within a transaction are kept open,
+            # since workers never access the database
+            for connection in connections.all():
+                if not connection.in_atomic_block:
+                    connection.close()
+
+            remaining = []
+            pool = multiprocessing.Pool(workers, _init_image_resize_worker, (filename,))
+            try:
+                for index, processed in pool.imap_unordered(_image_resize_worker, list(enumerate(jobs))):
+                    if processed:
+                        i += len(jobs[index])
+                        Progress.set_sub_progress(request, i, total)
+                    else:
+                        remaining.append(jobs[index])
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            remaining = jobs
+
+        if remaining:
+            close_img = img is None
+            if close_img:
+                img = open_image_for_resize(filename)
+
+            try:
+                for job in remaining:
+                    _resize_image_versions(img, job)
+                    i += len(job)
+                    Progress.set_sub_progress(request, i, total)
+            finally:
+                if close_img:
+                    img.destroy()
 
 
     def generate_svg_images_for_shape(self, filename, size, shape):
@@ -1177,36 +1407,18 @@ class Media(DateTimeBase):
         """
         Generate different image versions for a bitmap-based image (non-vector).
         """
-        from cubane.backend.views import Progress
-
-        # open image for resize
-        with open_image_for_resize(self.original_path) as img:
-            # generate versions for all shapes
-            sizes = self.get_available_image_sizes().keys()
-            shapes = Media.get_shape_names()
-            total = len(sizes) * len(shapes)
-            i = 0
-            for size in sizes:
-                # original shape
-                if shape is None:
-                    self.generate_images_for_shape(
-                        img,
-                        size,
-                        settings.DEFAULT_IMAGE_SHAPE
-                    )
+        if settings.IMAGE_ON_DEMAND:
+            # image versions are generated on demand when requested, so we
+            # only remove outdated image versions
+            for size, _shape, _, _ in self.get_image_versions(shape):
+                self.delete_generated_image(size, _shape)
+            return
 
-                # all configured shapes
-                for _shape in shapes:
-                    if shape is None or shape == _shape:
-                        auto_fit = (
-                            self.auto_fit and
-                            settings.IMAGE_FITTING_ENABLED and
-                            _shape in settings.IMAGE_FITTING_SHAPES
-                        )
-                        self.generate_images_for_shape(img, size, _shape, auto_fit=auto_fit)
-
-                    i += 1
-                    Progress.set_sub_progress(request, i, total)
+        self.generate_image_versions(
+            request,
+            self.original_path,
+            self.get_image_versions(shape)
+        )
 
 
     def generate_svg_images(self, request, shape=None):
@@ -1248,8 +1460,6 @@ class Media(DateTimeBase):
         Return preview images representing an image representation of a
         document.
         """
-        from cubane.backend.views import Progress
-
         # generate original image (tmp)
         _, tmp_path = tempfile.mkstemp(suffix='.jpg')
         if generate_preview_image(self.original_path, tmp_path):
@@ -1261,27 +1471,12 @@ class Media(DateTimeBase):
 
             try:
                 # generate thumbnail images
-                sizes = self.get_available_image_sizes().keys()
-                shapes = Media.get_shape_names()
-                total = len(sizes) * len(shapes)
-                i = 0
-                for size in sizes:
-                    # original shape
-                    if shape is None:
-                        self.generate_images_for_shape(
-                            img,
-                            size,
-                            settings.DEFAULT_IMAGE_SHAPE,
-                            valign='top'
-                        )
-
-                    # all configured shapes
-                    for _shape in shapes:
-                        if shape is None or shape == _shape:
-                            self.generate_images_for_shape(img, size, _shape, valign='top')
-
-                        i += 1
-                        Progress.set_sub_progress(request, i, total)
+                self.generate_image_versions(
+                    request,
+                    tmp_path,
+                    self.get_image_versions(shape, valign='top', auto_fit=False),
+                    img
+                )
             finally:
                 try:
                     os.remove(tmp_path)
@@ -1289,6 +1484,71 @@ class Media(DateTimeBase):
                     pass
 
 
+    def generate_image_on_demand(self, size, shape):
+        """
+        Generate the image version for the given size and shape if it does not
+        exist yet and return the full path to the image version. Concurrent
+        requests for the same image version are serialised, so that the image
+        version is only generated once. Return None if the given size or shape
+        is not available for this media asset.
+        """
+        if not self.has_preview or self.is_blank:
+            return None
+
+        if size not in self.get_available_image_sizes():
+            return None
+
+        if shape != settings.DEFAULT_IMAGE_SHAPE and shape not in Media.get_shape_names():
+            return None
+
+        if not os.path.isfile(self.original_path):
+            return None
+
+        path = self.get_image_path(size, shape)
+        lock = get_image_on_demand_lock(path)
+        lock.acquire()
+        try:
+            # another process may have generated the image version while we
+            # were waiting for the lock
+            if not os.path.isfile(path):
+                ensure_dir(path)
+                if self.is_image:
+                    temp_path = get_temp_path(path)
+                    try:
+                        if self.is_svg:
+                            resize_svg_image(
+                                self.original_path,
+                                temp_path,
+                                self.get_width(size, shape),
+                                self.get_height(size, shape),
+                                self.focal_point
+                            )
+                        else:
+                            for _size, _shape, valign, auto_fit in self.get_image_versions():
+                                if _size == size and _shape == shape:
+                                    kwargs = self.get_image_resize_args(size, shape, valign, auto_fit)
+                                    kwargs['dst_filename'] = temp_path
+                                    resize_image(self.original_path, **kwargs)
+                                    break
+
+                        os.rename(temp_path, path)
+                    finally:
+                        if os.path.isfile(temp_path):
+                            os.remove(temp_path)
+                else:
+                    # document preview images are generated for all image
+                    # sizes of the given shape at once, each of which is
+                    # written atomically
+                    self.generate_document_preview_images(None, shape)
+
+                if os.path.isfile(path):
+                    MediaCache().add(path)
+        finally:
+            lock.release()
+
+        return path if os.path.isfile(path) else None
+
+
     def generate_images(self, request=None, shape=None):
         """
         Generate multiple versions of the original media assets depending on
@@ -1473,6 +1733,31 @@ class Media(DateTimeBase):
         executing the given data writer, which copies the data to the file
         system of the server.
         """
+        self._prepare_upload(filename)
+
+        # copy image data to disk by using the given writer
+        dest = open(self.original_path, 'wb+')
+        writer(dest)
+        dest.close()
+
+        self._process_upload(generate_images, request)
+
+
+    def upload_from_file(self, path, filename=None, generate_images=True, request=None):
+        """
+        Upload given media assets and generate different image sizes based
+        on the given file, which is moved into place.
+        """
+        self._prepare_upload(filename)
+        file_move(path, self.original_path)
+        self._process_upload(generate_images, request)
+
+
+    def _prepare_upload(self, filename):
+        """
+        Prepare uploading a new original file with the given filename by
+        removing the previous original file and all image versions.
+        """
         # remove previous file (if exists)
         if self.id:
             self.delete_generated_images()
@@ -1480,14 +1765,13 @@ class Media(DateTimeBase):
 
         # setup filename based on caption and original filename
         self.set_filename(filename)
+        ensure_dir(self.original_path)
 
-        # copy image data to disk by using the given writer
-        path = self.original_path
-        ensure_dir(path)
-        dest = open(path, 'wb+')
-        writer(dest)
-        dest.close()
 
+    def _process_upload(self, generate_images, request):
+        """
+        Process the original file that has just been uploaded.
+        """
         self.is_image = is_image(self.original_path, self.get_document_ext())
 
         if self.is_image and settings.IMAGE_CONVERT_PNG_TO_JPG:
@@ -1586,6 +1870,11 @@ class Media(DateTimeBase):
         # update properties
         self.save()
 
+        # enqueue work for the task runner, even if the media asset failed
+        # to process before
+        if self.is_blank:
+            TaskRunner.enqueue('media', {'pk': self.pk}, key='%d' % self.pk)
+
         # generate image versions (unless this is a blank image, in which case
         # the task runner will take of generating image versions).
         if not self.is_blank and generate_images:
@@ -1607,20 +1896,97 @@ class Media(DateTimeBase):
         self.save()
 
 
-    def download_from_external_source(self):
+    def download_from_external_source(self, session=None):
         """
         Download the original image version for an external source if available.
+        The content is streamed to disk next to the original file, which is
+        replaced once the download completed.
         """
         if not self.external_url:
             return False
 
         # download content from url
-        content = requests.get(self.external_url, timeout=1000)
-        if content == None: return False
-        if content.status_code != 200: return False
+        path = self.get_download_path()
+        if not download_file(self.external_url, path, session):
+            return False
 
         # save changes and put original file in place
-        self.upload_from_content(content.content, self.filename)
+        self.upload_from_file(path, self.filename)
+        return True
+
+
+    @classmethod
+    def download_many_from_external_source(cls, media, workers=None, session=None):
+        """
+        Download the original image versions for the given list of media
+        assets from their external source concurrently, where each external
+        url is only downloaded once. Return the list of media assets that have
+        been downloaded successfully. A media asset that cannot be processed
+        after downloading is skipped and remains blank, so that it can be
+        downloaded and processed individually later.
+        """
+        media_by_url = OrderedDict()
+        for m in media:
+            if m.external_url:
+                media_by_url.setdefault(m.external_url, []).append(m)
+
+        if not media_by_url:
+            return []
+
+        paths = download_files(
+            [(url, items[0].get_download_path()) for url, items in media_by_url.items()],
+            workers,
+            session
+        )
+
+        downloaded = []
+        for url, items in media_by_url.items():
+            path = paths.get(url)
+            if path is None:
+                continue
+
+            # media assets sharing the same url receive a copy
+            for m in items[1:]:
+                copy_path = m.get_download_path()
+                try:
+                    shutil.copyfile(path, copy_path)
+                except (IOError, OSError):
+                    continue
+
+                if m._upload_downloaded_file(copy_path):
+                    downloaded.append(m)
+
+            if items[0]._upload_downloaded_file(path):
+                downloaded.append(items[0])
+
+        return downloaded
+
+
+    def _upload_downloaded_file(self, path):
+        """
+        Put the given downloaded file in place as the original file of this
+        media asset. Return False, if the file could not be processed, in
+        which case the downloaded file is removed.
+        """
+        try:
+            self.upload_from_file(path, self.filename)
+            return True
+        except Exception:
+            if os.path.isfile(path):
+                os.remove(path)
+            return False
+
+
+    def get_download_path(self):
+        """
+        Return the full path to a file within the same folder as the original
+        file, to which the original file can be downloaded.
+        """
+        ensure_dir(self.original_path)
+        return os.path.join(
+            os.path.dirname(self.original_path),
+            '.download-%s' % self.filename_with_version
+        )
 
 
     def to_dict(self):
@@ -1726,9 +2092,8 @@ class MediaGallery(models.Model):
 @receiver(post_delete)
 def update_entity_deleted_on(sender, **kwargs):
     if 'cubane.cms' in settings.INSTALLED_APPS:
-        from cubane.cms.views import get_cms
-        cms = get_cms()
-        cms.notify_content_changed(sender, Media, delete=True)
+        from cubane.cms.batch import notify_content_changed
+        notify_content_changed(sender, Media, delete=True, instance=kwargs.get('instance'))
 
 
 #
@@ -1737,6 +2102,5 @@ def update_entity_deleted_on(sender, **kwargs):
 @receiver(post_save)
 def invalidate_cache_on_content_changed(sender, **kwargs):
     if 'cubane.cms' in settings.INSTALLED_APPS:
-        from cubane.cms.views import get_cms
-        cms = get_cms()
-        cms.notify_content_changed(sender, Media)
+        from cubane.cms.batch import notify_content_changed
+        notify_content_changed(sender, Media, instance=kwargs.get('instance'))
@@ -1,41 +1,76 @@
 # coding=UTF-8
 from __future__ import unicode_literals
-from cubane.tasks import Task
+from cubane.tasks import QueueTask
+from cubane.tasks.models import Job
 from cubane.media.models import Media
-from cubane.lib.mail import send_exception_email
+from cubane.cms.batch import content_change_batch
 
 
-class MediaTask(Task):
-    def run(self):
+class MediaTask(QueueTask):
+    """
+    Processes blank media assets by generating all image versions. Each blank
+    media asset is processed by a separate job, so that media assets that
+    failed to process are retried and are eventually kept as dead jobs.
+    """
+    name = 'media'
+
+
+    def prepare(self):
         """
-        Process blank media assets.
+        Enqueue a job for each blank media asset that has no job yet (newest
+        first), for example media assets that have been created by importing
+        data.
         """
-        i = 1
-        blank_media = self.get_blank_media()
-        self.report_start(len(blank_media))
-        for i, media in enumerate(blank_media, start=1):
-            # report status
-            filename = media.filename
-            if not filename:
-                filename = media.external_url
-            self.report_status(i, 'Processing media file: <em>%s</em>' % filename)
+        pks = self.get_blank_media().values_list('pk', flat=True)
+        Job.enqueue_many(self.name, [('%d' % pk, {'pk': pk}) for pk in pks])
 
-            # download from external source if we do not have the
-            # original image yet
-            if not media.original_exists:
-                media.download_from_external_source()
 
-            # generate multiple versions
-            try:
-                media.generate_images()
-                media.is_blank = False
-                media.save()
-            except:
-                send_exception_email()
+    def get_blank_media(self):
+        """
+        Return a queryset of all blank media assets.
+        """
+        return Media.objects.filter(is_blank=True).order_by('-created_on')
 
 
-    def get_blank_media(self):
+    @content_change_batch()
+    def process_batch(self, jobs):
         """
-        Return the next blank media asset.
+        Fetch all media assets for the given batch of jobs at once and
+        download missing originals from their external source concurrently.
         """
-        return list(Media.objects.filter(is_blank=True).order_by('-created_on'))
\ No newline at end of file
+        self._media = Media.objects.in_bulk([job.payload.get('pk') for job in jobs])
+        Media.download_many_from_external_source([
+            media for media in self._media.values()
+            if media.is_blank and media.external_url and not media.original_exists
+        ])
+        super(MediaTask, self).process_batch(jobs)
+
+
+    def get_job_message(self, job):
+        media = self._media.get(job.payload.get('pk'))
+        if media is None:
+            return None
+
+        filename = media.filename
+        if not filename:
+            filename = media.external_url
+        return 'Processing media file: <em>%s</em>' % filename
+
+
+    def process_job(self, job):
+        """
+        Generate all image versions for the media asset of the given job.
+        """
+        media = self._media.get(job.payload.get('pk'))
+        if media is None or not media.is_blank:
+            return
+
+        # download from external source if we do not have the
+        # original image yet
+        if not media.original_exists:
+            media.download_from_external_source()
+
+        # generate multiple versions
+        media.generate_images()
+        media.is_blank = False
+        media.save()
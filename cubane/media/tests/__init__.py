@@ -1,3 +1,6 @@
+from cubane.media.tests.cache import *
 from cubane.media.tests.forms import *
 from cubane.media.tests.models import *
+from cubane.media.tests.tasks import *
 from cubane.media.tests.templatetags import *
+from cubane.media.tests.views import *
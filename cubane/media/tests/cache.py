@@ -0,0 +1,180 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from cubane.tests.base import CubaneTestCase
+from cubane.media.cache import MediaCache, SvgCache, get_temp_path
+import os
+import mock
+import stat
+import shutil
+import tempfile
+
+
+class MediaCacheTestCase(CubaneTestCase):
+    """
+    cubane.media.cache.MediaCache
+    """
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'shapes')
+        os.makedirs(self.path)
+        self.cache = MediaCache(self.path, max_size=1000)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+    def test_touch_should_update_access_time_but_not_modification_time(self):
+        path = self._create_file('a.jpg', 100, atime=1000, mtime=2000)
+        self.cache.touch(path)
+        st = os.stat(path)
+        self.assertTrue(st.st_atime > 1000)
+        self.assertEqual(2000, st.st_mtime)
+
+
+    def test_add_should_keep_track_of_usage(self):
+        self.cache.add(self._create_file('a.jpg', 100))
+        self.cache.add(self._create_file('b.jpg', 200))
+        self.assertEqual(300, self.cache.get_usage())
+
+
+    def test_add_should_ignore_usage_without_max_size(self):
+        cache = MediaCache(self.path, max_size=None)
+        cache.add(self._create_file('a.jpg', 100))
+        self.assertEqual(0, cache.get_usage())
+
+
+    def test_add_should_evict_least_recently_used_files_if_max_size_exceeded(self):
+        a = self._create_file('1/a.jpg', 400, atime=3000)
+        b = self._create_file('2/b.jpg', 400, atime=1000)
+        c = self._create_file('3/c.jpg', 400, atime=2000)
+        self.cache.set_usage(800)
+        self.cache.add(c)
+
+        self.assertTrue(os.path.isfile(a))
+        self.assertFalse(os.path.isfile(b))
+        self.assertFalse(os.path.isdir(os.path.dirname(b)))
+        self.assertTrue(os.path.isfile(c))
+        self.assertEqual(800, self.cache.get_usage())
+
+
+    def test_add_should_never_evict_given_file(self):
+        a = self._create_file('a.jpg', 400, atime=3000)
+        b = self._create_file('b.jpg', 800, atime=1000)
+        self.cache.set_usage(400)
+        self.cache.add(b)
+
+        self.assertFalse(os.path.isfile(a))
+        self.assertTrue(os.path.isfile(b))
+        self.assertEqual(800, self.cache.get_usage())
+
+
+    def test_evict_should_correct_estimated_usage(self):
+        self._create_file('a.jpg', 100)
+        self.cache.set_usage(5000)
+        self.assertEqual(100, self.cache.evict())
+
+
+    def test_get_files_should_ignore_temporary_files(self):
+        self._create_file('a.jpg', 100)
+        self._create_file('.a.tmp.jpg', 100)
+        self.assertEqual(
+            [os.path.join(self.path, 'a.jpg')],
+            [path for _, _, path in self.cache.get_files()]
+        )
+
+
+    def test_get_temp_path_should_create_readable_file_with_same_extension(self):
+        path = os.path.join(self.path, 'a.jpg')
+        temp_path = get_temp_path(path)
+        self.assertTrue(os.path.isfile(temp_path))
+        self.assertEqual(self.path, os.path.dirname(temp_path))
+        self.assertTrue(temp_path.endswith('.jpg'))
+        self.assertTrue(os.path.basename(temp_path).startswith('.'))
+        self.assertTrue(os.stat(temp_path).st_mode & stat.S_IRGRP)
+
+
+    def _create_file(self, filename, size, atime=None, mtime=None):
+        path = os.path.join(self.path, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        if atime is not None or mtime is not None:
+            st = os.stat(path)
+            os.utime(path, (
+                atime if atime is not None else st.st_atime,
+                mtime if mtime is not None else st.st_mtime
+            ))
+        return path
+
+
+class MediaSvgCacheTestCase(CubaneTestCase):
+    """
+    cubane.media.cache.SvgCache
+    """
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'test.svg')
+        shutil.copyfile(self.get_test_image_path('test_layers.svg'), self.filename)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+    def test_get_key_should_ignore_order_and_form_of_instructions(self):
+        cache = SvgCache(path=None)
+        self.assertEqual(
+            cache.get_key(self.filename, {'polygon': ['fill:efefef', 'stroke:red'], 'path': 'black'}),
+            cache.get_key(self.filename, {'path': 'fill:black', 'polygon': ['stroke:red', '#efefef']})
+        )
+
+
+    def test_get_key_should_change_if_instructions_change(self):
+        cache = SvgCache(path=None)
+        self.assertNotEqual(
+            cache.get_key(self.filename, {'polygon': 'red'}),
+            cache.get_key(self.filename, {'polygon': 'blue'})
+        )
+
+
+    def test_get_key_should_change_if_file_changes(self):
+        cache = SvgCache(path=None)
+        key = cache.get_key(self.filename, {'polygon': 'red'})
+        with open(self.filename, 'a') as f:
+            f.write('\n')
+        self.assertNotEqual(key, cache.get_key(self.filename, {'polygon': 'red'}))
+
+
+    def test_should_colorise_svg_image_only_once(self):
+        cache = SvgCache(path=None)
+        with mock.patch('cubane.media.cache.get_colorized_svg_image', return_value='<svg/>') as colorise:
+            self.assertEqual('<svg/>', cache.get_colorized_svg_image(self.filename, {'polygon': 'red'}))
+            self.assertEqual('<svg/>', cache.get_colorized_svg_image(self.filename, {'polygon': 'fill:red'}))
+        self.assertEqual(1, colorise.call_count)
+
+
+    def test_should_evict_least_recently_used_entries(self):
+        cache = SvgCache(max_entries=2, path=None)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.get('a')
+        cache.set('c', 'C')
+        self.assertEqual('A', cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('C', cache.get('c'))
+
+
+    def test_should_share_entries_on_disk(self):
+        path = os.path.join(self.root, 'svg')
+        SvgCache(path=path).set('abc', '<svg>\u00e9</svg>')
+        self.assertEqual('<svg>\u00e9</svg>', SvgCache(path=path).get('abc'))
+        self.assertTrue(os.path.isfile(os.path.join(path, 'ab', 'abc.svg')))
+
+
+    def test_should_not_keep_entries_in_memory_without_max_entries(self):
+        cache = SvgCache(max_entries=0, path=None)
+        cache.set('a', 'A')
+        self.assertIsNone(cache.get('a'))
@@ -14,6 +14,34 @@ from cubane.lib.image import (
     is_png_image_object
 )
 import os.path
+import mock
+
+
+class FakeImageResizePool(object):
+    """
+    Generates image versions within the current process rather than
+    distributing them over a pool of worker processes.
+    """
+    def __init__(self, processes, initializer=None, initargs=()):
+        self.processes = processes
+        if initializer:
+            initializer(*initargs)
+
+
+    def imap_unordered(self, func, iterable):
+        return [func(args) for args in iterable]
+
+
+    def close(self):
+        pass
+
+
+    def terminate(self):
+        pass
+
+
+    def join(self):
+        pass
 
 
 class CMSMediaModelsGetArtDirectionForShapeTestCase(CubaneTestCase):
@@ -570,4 +598,115 @@ class CMSMediaModelsMediaTestCase(CubaneTestCase):
         self.assertEqual(
             'http://www.testapp.cubane.innershed.com/media/shapes/original/%s/0/1/' % url_size,
             getattr(self.m, '%s_url' % size)
-        )
\ No newline at end of file
+        )
+
+
+class CMSMediaModelsGenerateImageVersionsTestCase(CubaneTestCase):
+    """
+    cubane.media.models.Media.generate_image_versions()
+    """
+    def setUp(self):
+        self.m = Media(id=1, filename='test.jpg', is_image=True, width=2400, height=2400)
+
+
+    def test_get_image_versions_should_include_original_shape_for_each_size(self):
+        versions = self.m.get_image_versions()
+        sizes = self.m.get_available_image_sizes().keys()
+        shapes = Media.get_shape_names()
+        self.assertEqual(len(sizes) * (len(shapes) + 1), len(versions))
+        for size in sizes:
+            self.assertIn((size, settings.DEFAULT_IMAGE_SHAPE, 'center', False), versions)
+
+
+    def test_get_image_versions_for_shape_should_only_include_given_shape(self):
+        shape = Media.get_shape_names()[0]
+        versions = self.m.get_image_versions(shape, valign='top', auto_fit=False)
+        self.assertEqual(len(self.m.get_available_image_sizes()), len(versions))
+        for _, _shape, valign, auto_fit in versions:
+            self.assertEqual(shape, _shape)
+            self.assertEqual('top', valign)
+            self.assertFalse(auto_fit)
+
+
+    @override_settings(IMAGE_RESIZE_WORKERS=3)
+    def test_get_image_resize_workers_should_return_configured_workers(self):
+        self.assertEqual(3, Media.get_image_resize_workers())
+
+
+    @override_settings(IMAGE_RESIZE_WORKERS=0)
+    def test_get_image_resize_workers_should_return_at_least_one_worker(self):
+        self.assertEqual(1, Media.get_image_resize_workers())
+
+
+    @override_settings(IMAGE_RESIZE_WORKERS=4)
+    def test_should_generate_versions_in_pool_and_report_progress_per_version(self):
+        filename = self.get_test_image_path('test.jpg')
+        versions = self.m.get_image_versions()
+        with mock.patch('cubane.media.models.multiprocessing.Pool', FakeImageResizePool):
+            with mock.patch('cubane.media.models.resize_image_object') as resize:
+                with mock.patch('cubane.backend.views.Progress.set_sub_progress') as progress:
+                    self.m.generate_image_versions(None, filename, versions)
+
+        self.assertEqual(len(versions), resize.call_count)
+        self.assertEqual(
+            [mock.call(None, i + 1, len(versions)) for i in range(len(versions))],
+            progress.call_args_list
+        )
+
+
+    @override_settings(IMAGE_RESIZE_WORKERS=4)
+    def test_should_generate_versions_sequentially_if_worker_cannot_open_image(self):
+        filename = self.get_test_image_path('test.jpg')
+        versions = self.m.get_image_versions()
+        img = mock.Mock()
+        with mock.patch('cubane.media.models.multiprocessing.Pool', FakeImageResizePool):
+            with mock.patch('cubane.media.models.open_image_for_resize', side_effect=[IOError(), img]):
+                with mock.patch('cubane.media.models.resize_image_object') as resize:
+                    self.m.generate_image_versions(None, filename, versions)
+
+        self.assertEqual(len(versions), resize.call_count)
+        self.assertTrue(img.destroy.called)
+
+
+    @override_settings(IMAGE_RESIZE_WORKERS=1)
+    def test_should_generate_versions_sequentially_without_pool_for_single_worker(self):
+        filename = self.get_test_image_path('test.jpg')
+        versions = self.m.get_image_versions()
+        with mock.patch('cubane.media.models.multiprocessing.Pool') as pool:
+            with mock.patch('cubane.media.models.resize_image_object') as resize:
+                self.m.generate_image_versions(None, filename, versions)
+
+        self.assertFalse(pool.called)
+        self.assertEqual(len(versions), resize.call_count)
+
+
+    @override_settings(IMAGE_RESIZE_PYRAMID=False)
+    def test_get_image_resize_jobs_should_generate_each_version_separately(self):
+        versions = self.m.get_image_versions()
+        jobs = self.m.get_image_resize_jobs(versions)
+        self.assertEqual(len(versions), len(jobs))
+        self.assertEqual([1] * len(versions), [len(job) for job in jobs])
+
+
+    @override_settings(IMAGE_RESIZE_PYRAMID=True)
+    def test_get_image_resize_jobs_should_group_versions_by_shape_for_pyramid(self):
+        versions = self.m.get_image_versions()
+        jobs = self.m.get_image_resize_jobs(versions)
+        self.assertEqual(len(Media.get_shape_names()) + 1, len(jobs))
+        self.assertEqual(len(versions), sum([len(job) for job in jobs]))
+
+
+    @override_settings(IMAGE_RESIZE_WORKERS=1, IMAGE_RESIZE_PYRAMID=True)
+    def test_should_report_progress_per_version_for_pyramid(self):
+        filename = self.get_test_image_path('test.jpg')
+        versions = self.m.get_image_versions()
+        with mock.patch('cubane.media.models.resize_image_object_pyramid') as resize:
+            with mock.patch('cubane.backend.views.Progress.set_sub_progress') as progress:
+                self.m.generate_image_versions(None, filename, versions)
+
+        n = len(self.m.get_available_image_sizes())
+        self.assertEqual(len(Media.get_shape_names()) + 1, resize.call_count)
+        self.assertEqual(
+            [mock.call(None, (i + 1) * n, len(versions)) for i in range(resize.call_count)],
+            progress.call_args_list
+        )
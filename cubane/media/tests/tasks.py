@@ -0,0 +1,128 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.test.utils import override_settings
+from cubane.tasks.models import Job
+from cubane.tasks.tests.jobs import JobTestCaseBase
+from cubane.media.models import Media
+from cubane.media.tasks import MediaTask
+import mock
+
+
+@override_settings(TASK_QUEUE_MAX_ATTEMPTS=2)
+class MediaTaskTestCase(JobTestCaseBase):
+    """
+    cubane.media.tasks.MediaTask
+    """
+    def setUp(self):
+        super(MediaTaskTestCase, self).setUp()
+        self.a = self._create_media('a.jpg', is_blank=True)
+        self.b = self._create_media('b.jpg', is_blank=True)
+        self.c = self._create_media('c.jpg', is_blank=False)
+
+
+    def test_prepare_should_enqueue_job_for_each_blank_media_newest_first(self):
+        MediaTask().prepare()
+        self.assertEqual(
+            [self.b.pk, self.a.pk],
+            [job.payload.get('pk') for job in Job.objects.filter(task='media').order_by('id')]
+        )
+
+
+    def test_prepare_should_not_enqueue_media_with_existing_or_dead_job(self):
+        MediaTask().prepare()
+        Job.objects.filter(key='%d' % self.a.pk).update(status=Job.STATUS_DEAD)
+        MediaTask().prepare()
+        self.assertEqual(2, Job.objects.filter(task='media').count())
+
+
+    def test_run_should_process_all_blank_media(self):
+        task = MediaTask()
+        task.prepare()
+        with mock.patch.object(Media, 'download_from_external_source'):
+            with mock.patch.object(Media, 'generate_images') as generate_images:
+                task.run()
+
+        self.assertEqual(2, generate_images.call_count)
+        self.assertEqual(0, Media.objects.filter(is_blank=True).count())
+        self.assertEqual(0, Job.objects.count())
+
+
+    def test_run_should_keep_failed_media_blank_and_retry_later(self):
+        def generate_images(media):
+            if media.filename == 'a.jpg':
+                raise ValueError('failed')
+
+        task = MediaTask()
+        task.prepare()
+        with mock.patch.object(Media, 'download_from_external_source'):
+            with mock.patch.object(Media, 'generate_images', autospec=True, side_effect=generate_images) as m:
+                task.run()
+
+        self.assertEqual(2, m.call_count)
+        self.assertEqual([self.a.pk], [media.pk for media in Media.objects.filter(is_blank=True)])
+
+        job = Job.objects.get(task='media')
+        self.assertEqual({'pk': self.a.pk}, job.payload)
+        self.assertEqual(Job.STATUS_PENDING, job.status)
+        self.assertEqual(1, job.attempts)
+
+
+    def test_run_should_ignore_deleted_media(self):
+        task = MediaTask()
+        task.prepare()
+        Media.objects.filter(pk=self.a.pk).delete()
+        with mock.patch.object(Media, 'download_from_external_source'):
+            with mock.patch.object(Media, 'generate_images') as generate_images:
+                task.run()
+
+        self.assertEqual(1, generate_images.call_count)
+        self.assertEqual(0, Job.objects.count())
+
+
+    def test_run_should_download_external_media_of_batch_at_once(self):
+        Media.objects.filter(pk=self.a.pk).update(external_url='http://example.com/a.jpg')
+        task = MediaTask()
+        task.prepare()
+        with mock.patch.object(Media, 'download_many_from_external_source', return_value=[]) as download:
+            with mock.patch.object(Media, 'generate_images'):
+                task.run()
+
+        self.assertEqual(1, download.call_count)
+        self.assertEqual([self.a.pk], [media.pk for media in download.call_args[0][0]])
+
+
+    def test_run_should_record_error_for_media_that_cannot_be_processed_after_download(self):
+        def download_files(files, workers=None, session=None):
+            for url, path in files:
+                open(path, 'wb').close()
+            return dict(files)
+
+        def upload_from_file(media, path, filename):
+            if media.filename == 'a.jpg':
+                raise IOError('corrupt')
+
+        def download_from_external_source(media):
+            if media.filename == 'a.jpg':
+                raise IOError('corrupt')
+
+        Media.objects.filter(pk=self.a.pk).update(external_url='http://example.com/a.jpg')
+        Media.objects.filter(pk=self.b.pk).update(external_url='http://example.com/b.jpg')
+        task = MediaTask()
+        task.prepare()
+        with mock.patch('cubane.media.models.download_files', side_effect=download_files):
+            with mock.patch.object(Media, 'upload_from_file', autospec=True, side_effect=upload_from_file):
+                with mock.patch.object(Media, 'download_from_external_source', autospec=True, side_effect=download_from_external_source):
+                    with mock.patch.object(Media, 'generate_images'):
+                        task.run()
+
+        self.assertEqual([self.a.pk], [media.pk for media in Media.objects.filter(is_blank=True)])
+        job = Job.objects.get(task='media')
+        self.assertEqual({'pk': self.a.pk}, job.payload)
+        self.assertEqual(Job.STATUS_PENDING, job.status)
+        self.assertIn('corrupt', job.last_error)
+
+
+    def _create_media(self, filename, is_blank):
+        media = Media.objects.create(caption=filename, filename=filename, is_image=True, width=512, height=512)
+        Media.objects.filter(pk=media.pk).update(is_blank=is_blank)
+        return Media.objects.get(pk=media.pk)
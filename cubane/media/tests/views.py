@@ -0,0 +1,221 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from django.test.utils import override_settings
+from django.test.client import RequestFactory
+from django.http import Http404
+from cubane.tests.base import CubaneTestCase
+from cubane.media.views import serve_media_api
+from cubane.media.cache import get_svg_cache
+from cubane.lib.filelock import FileLock
+from cubane.cms.views import get_cms
+import os
+import mock
+
+
+@override_settings(IMAGE_ON_DEMAND=True, IMAGE_ON_DEMAND_MAX_SIZE=None)
+class MediaViewsServeMediaApiOnDemandTestCase(CubaneTestCase):
+    """
+    cubane.media.views.serve_media_api()
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(MediaViewsServeMediaApiOnDemandTestCase, cls).setUpClass()
+        cls.factory = RequestFactory()
+        cls.request = cls.factory.get('/')
+
+
+    def setUp(self):
+        self.media = get_cms().create_media_from_file(self.get_test_image_path('test.jpg'), 'Test')
+
+
+    def tearDown(self):
+        self.media.delete()
+
+
+    def test_should_not_generate_image_versions_when_uploading_image(self):
+        self.assertTrue(os.path.isfile(self.media.original_path))
+        self.assertFalse(os.path.isfile(self.media.get_image_path('small', settings.DEFAULT_IMAGE_SHAPE)))
+
+
+    def test_should_generate_image_version_on_first_request(self):
+        path = self.media.get_image_path('small', settings.DEFAULT_IMAGE_SHAPE)
+        response = serve_media_api(self.request, self.media, settings.DEFAULT_IMAGE_SHAPE, 'small')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(os.path.getsize(path), int(response['Content-Length']))
+
+
+    def test_should_serve_existing_image_version_without_generating_it_again(self):
+        serve_media_api(self.request, self.media, settings.DEFAULT_IMAGE_SHAPE, 'small')
+        with mock.patch('cubane.media.models.resize_image') as resize:
+            response = serve_media_api(self.request, self.media, settings.DEFAULT_IMAGE_SHAPE, 'small')
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(resize.called)
+
+
+    def test_should_not_generate_image_version_generated_while_waiting_for_lock(self):
+        path = self.media.get_image_path('small', settings.DEFAULT_IMAGE_SHAPE)
+
+        def acquire(lock, wait=True):
+            # another process generated the image version in the meantime
+            open(path, 'wb').close()
+            return True
+
+        with mock.patch.object(FileLock, 'acquire', acquire):
+            with mock.patch('cubane.media.models.resize_image') as resize:
+                self.assertEqual(path, self.media.generate_image_on_demand('small', settings.DEFAULT_IMAGE_SHAPE))
+        self.assertFalse(resize.called)
+
+
+    def test_should_raise_404_for_unknown_shape(self):
+        with self.assertRaisesRegexp(Http404, 'is not available'):
+            serve_media_api(self.request, self.media, 'does-not-exist', 'small')
+
+
+    def test_should_raise_404_for_unknown_size(self):
+        with self.assertRaisesRegexp(Http404, 'is not available'):
+            serve_media_api(self.request, self.media, settings.DEFAULT_IMAGE_SHAPE, 'does-not-exist')
+
+
+    @override_settings(IMAGE_ON_DEMAND=False)
+    def test_should_raise_404_for_missing_image_version_if_not_on_demand(self):
+        with self.assertRaisesRegexp(Http404, 'does not exist'):
+            serve_media_api(self.request, self.media, settings.DEFAULT_IMAGE_SHAPE, 'small')
+
+
+    @override_settings(IMAGE_ON_DEMAND_MAX_SIZE=1)
+    def test_should_keep_requested_image_version_if_max_size_exceeded(self):
+        small = self.media.get_image_path('small', settings.DEFAULT_IMAGE_SHAPE)
+        medium = self.media.get_image_path('medium', settings.DEFAULT_IMAGE_SHAPE)
+        serve_media_api(self.request, self.media, settings.DEFAULT_IMAGE_SHAPE, 'small')
+        serve_media_api(self.request, self.media, settings.DEFAULT_IMAGE_SHAPE, 'medium')
+        self.assertFalse(os.path.isfile(small))
+        self.assertTrue(os.path.isfile(medium))
+
+
+class MediaViewsServeMediaApiSvgTestCase(CubaneTestCase):
+    """
+    cubane.media.views.serve_media_api()
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(MediaViewsServeMediaApiSvgTestCase, cls).setUpClass()
+        cls.factory = RequestFactory()
+
+
+    def setUp(self):
+        self.media = get_cms().create_media_from_file(self.get_test_image_path('test_layers.svg'), 'Test')
+        get_svg_cache().clear()
+
+
+    def tearDown(self):
+        self.media.delete()
+
+
+    def test_should_return_colorised_svg_image_with_etag(self):
+        response = serve_media_api(self.factory.get('/?polygon=red'), self.media)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('fill:red', response.content)
+        self.assertTrue(response['ETag'].startswith('"'))
+
+
+    def test_should_return_same_etag_for_equivalent_instructions(self):
+        a = serve_media_api(self.factory.get('/?polygon=fill:ff0000'), self.media)
+        b = serve_media_api(self.factory.get('/?polygon=%23ff0000'), self.media)
+        self.assertEqual(a['ETag'], b['ETag'])
+
+
+    def test_should_return_not_modified_for_matching_etag_without_colorising(self):
+        etag = serve_media_api(self.factory.get('/?polygon=red'), self.media)['ETag']
+        request = self.factory.get('/?polygon=red', HTTP_IF_NONE_MATCH=etag)
+        with mock.patch('cubane.media.cache.get_colorized_svg_image') as colorise:
+            response = serve_media_api(request, self.media)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        self.assertFalse(colorise.called)
+
+
+    def test_should_colorise_svg_image_again_for_different_etag(self):
+        etag = serve_media_api(self.factory.get('/?polygon=red'), self.media)['ETag']
+        request = self.factory.get('/?polygon=blue', HTTP_IF_NONE_MATCH=etag)
+        response = serve_media_api(request, self.media)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('fill:blue', response.content)
+
+
+    def test_should_serve_repeated_requests_from_cache(self):
+        serve_media_api(self.factory.get('/?polygon=red'), self.media)
+        with mock.patch('cubane.media.cache.get_colorized_svg_image') as colorise:
+            response = serve_media_api(self.factory.get('/?polygon=red'), self.media)
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(colorise.called)
+
+
+@override_settings(IMAGE_ON_DEMAND=True, IMAGE_ON_DEMAND_MAX_SIZE=None)
+class MediaViewsMediaApiOnDemandTestCase(CubaneTestCase):
+    """
+    cubane.media.views.media_api_on_demand()
+    """
+    def setUp(self):
+        self.media = get_cms().create_media_from_file(self.get_test_image_path('test.jpg'), 'Test')
+
+
+    def tearDown(self):
+        self.media.delete()
+
+
+    def _get(self, url_component, size='small'):
+        return self.client.get('/%son-demand/shapes/%s/%s%s' % (
+            settings.MEDIA_API_URL,
+            settings.DEFAULT_IMAGE_SHAPE,
+            size,
+            url_component
+        ))
+
+
+    def test_should_generate_image_version_for_image_url(self):
+        response = self._get(self.media.get_image_url_component())
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(os.path.isfile(self.media.get_image_path('small', settings.DEFAULT_IMAGE_SHAPE)))
+
+
+    def test_should_generate_image_version_for_versioned_image_url(self):
+        self.media.increase_version()
+        self.assertEqual(2, self.media.version)
+        self.assertIn('/2-', self.media.get_image_url_component())
+
+        response = self._get(self.media.get_image_url_component())
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(os.path.isfile(self.media.get_image_path('small', settings.DEFAULT_IMAGE_SHAPE)))
+
+
+    def test_should_raise_404_for_outdated_version(self):
+        url_component = self.media.get_image_url_component()
+        self.media.increase_version()
+        self.assertEqual(404, self._get(url_component).status_code)
+
+
+    def test_should_raise_404_for_bucket_mismatch(self):
+        url_component = '/%d/%d/%s' % (self.media.bucket_id + 1, self.media.pk, self.media.filename_with_version)
+        self.assertEqual(404, self._get(url_component).status_code)
+
+
+    def test_should_raise_404_for_unknown_media(self):
+        self.assertEqual(404, self._get('/0/999999/test.jpg').status_code)
+
+
+@override_settings(CUBANE_HASHED_MEDIA_URLS=True)
+class MediaViewsMediaApiOnDemandHashedTestCase(MediaViewsMediaApiOnDemandTestCase):
+    """
+    cubane.media.views.media_api_on_demand() with hashed media urls.
+    """
+    def test_should_generate_image_version_for_hashed_image_url(self):
+        self.assertIn('/%s/' % self.media.hashid, self.media.get_image_url_component())
+        response = self._get(self.media.get_image_url_component())
+        self.assertEqual(200, response.status_code)
+
+
+    def test_should_raise_404_for_pk_if_hashed_media_urls(self):
+        url_component = '/%d/%d/%s' % (self.media.bucket_id, self.media.pk, self.media.filename_with_version)
+        self.assertEqual(404, self._get(url_component).status_code)
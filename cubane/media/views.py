@@ -4,7 +4,7 @@ from django.conf import settings
 from django.http import (
     HttpResponse,
     Http404,
-    FileResponse,
+    StreamingHttpResponse,
     HttpResponseNotModified
 )
 from django.views.static import was_modified_since
@@ -12,12 +12,13 @@ from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.contrib.contenttypes.models import ContentType
-from django.utils.http import http_date
-from django.core.files.temp import NamedTemporaryFile
+from django.utils.http import http_date, quote_etag
+from django.utils.cache import get_conditional_response
 from django.template.defaultfilters import slugify
 from django.contrib import messages
 from django.core.cache import cache
 from cubane.media.models import Media, MediaFolder
+from cubane.media.cache import MediaCache, get_svg_cache
 from cubane.media.forms import MediaForm, MediaFolderForm, MultiMediaForm
 from cubane.media.forms import MediaShareForm
 from cubane.media.templatetags.media_tags import render_image
@@ -25,16 +26,15 @@ from cubane.cms.models import MediaGallery
 from cubane.views import ModelView, view_url
 from cubane.backend.views import BackendSection, Progress
 from cubane.lib.request import request_int
-from cubane.lib.image import get_colorized_svg_image
 from cubane.lib.url import make_absolute_url
+from cubane.lib.sendfile import sendfile
+from cubane.lib.zipstream import zip_stream
 from cubane.lib.libjson import to_json_response
 from cubane.lib.args import get_pks
 from cubane.tasks import TaskRunner
 import os
 import re
 import mimetypes
-import stat
-import zipfile
 import datetime
 import copy
 
@@ -403,15 +403,10 @@ class MediaView(ModelView):
         # single media item?
         if n_media == 1:
             item = media.first()
-            response = FileResponse(open(item.original_path, 'rb'))
-            response['Content-Disposition'] = 'attachment; filename="%s"' % item.filename
-            return response
+            return sendfile(request, item.original_path, attachment_filename=item.filename)
 
-        # multiple assets -> create zip file
-        f = NamedTemporaryFile()
-        zf = zipfile.ZipFile(f, 'w')
-
-        # attach original files to zip, handle duplicated filenames
+        # multiple assets -> stream zip file, handle duplicated filenames
+        files = []
         filenames = {}
         for item in media:
             # determine unique filename
@@ -427,10 +422,7 @@ class MediaView(ModelView):
                 filename = fn
                 filenames[filename] = 1
 
-            # attach file to zip...
-            zf.write(item.original_path, filename)
-        zf.close()
-        f.seek(0)
+            files.append((item.original_path, filename))
 
         # determine site name from settings (CMS)
         if 'cubane.cms' in settings.INSTALLED_APPS:
@@ -451,8 +443,8 @@ class MediaView(ModelView):
             today.year
         )
 
-        # serve file
-        response = FileResponse(f)
+        # serve zip file, which is generated while it is sent
+        response = StreamingHttpResponse(zip_stream(files), content_type='application/zip')
         response['Content-Disposition'] = 'attachment; filename="%s"' % filename
         return response
 
@@ -632,10 +624,25 @@ def serve_media_api(request, media, shape=None, size=None):
     else:
         filepath = media.get_image_path(size, shape)
 
+    # generate image version on demand if it does not exist yet
+    on_demand = settings.IMAGE_ON_DEMAND and shape is not None and size is not None
+    if on_demand and not os.path.isfile(filepath):
+        filepath = media.generate_image_on_demand(size, shape)
+        if filepath is None:
+            raise Http404('Media file for shape \'%s\' and size \'%s\' is not available.' % (shape, size))
+
     # 404 if file does not exist
     if not os.path.isfile(filepath):
         raise Http404('Media file \'%s\' does not exist.' % filepath)
 
+    # keep track of recently used image versions
+    if on_demand:
+        MediaCache().touch(filepath)
+
+    # regular file response (may be offloaded to the web server)
+    if not media.is_svg:
+        return sendfile(request, filepath)
+
     # respect the If-Modified-Since header.
     statobj = os.stat(filepath)
     if not was_modified_since(
@@ -646,23 +653,23 @@ def serve_media_api(request, media, shape=None, size=None):
         # not modified
         return HttpResponseNotModified()
 
-    # determine content type
-    content_type, encoding = mimetypes.guess_type(filepath)
-    content_type = content_type or 'application/octet-stream'
-
-    if media.is_svg:
-        # determine colorise information and colorise image, if SVG
-        layers = dict(request.GET.iterlists())
-        svg = get_colorized_svg_image(filepath, layers)
-        response = HttpResponse(svg, content_type=content_type)
-    else:
-        # regular file response
-        response = FileResponse(open(filepath, 'rb'), content_type=content_type)
-        if stat.S_ISREG(statobj.st_mode):
-            response['Content-Length'] = statobj.st_size
+    # determine colorise information. The resulting image is identified
+    # by the svg file and the colorise information, so that we can skip
+    # colorising the image altogether if the client already has it.
+    layers = dict(request.GET.iterlists())
+    svg_cache = get_svg_cache()
+    key = svg_cache.get_key(filepath, layers, statobj)
+    etag = quote_etag(key)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+        return response
 
-        if encoding:
-            response['Content-Encoding'] = encoding
+    # colorise image (cached)
+    content_type, encoding = mimetypes.guess_type(filepath)
+    svg = svg_cache.get_colorized_svg_image(filepath, layers, key)
+    response = HttpResponse(svg, content_type=content_type or 'application/octet-stream')
+    response['ETag'] = etag
 
     # last mod. timestamp
     response['Last-Modified'] = http_date(statobj.st_mtime)
@@ -689,6 +696,36 @@ def media_api(request, shape, size, bucket, pk, filename):
     return serve_media_api(request, media, shape, size)
 
 
+def media_api_on_demand(request, shape, size, bucket, unique_id, filename):
+    """
+    Serve an image version for the given shape and size, which is generated on
+    demand if it does not exist yet. The url corresponds to the url of the
+    image version as returned by Media.get_image_url(), which identifies the
+    media asset by its unique id and includes the version number of the asset.
+    """
+    # load media based on its unique id, which might be a hash
+    media = None
+    if settings.CUBANE_HASHED_MEDIA_URLS:
+        media = Media.objects.filter(hashid=unique_id).first()
+    if media is None and unique_id.isdigit():
+        media = Media.objects.filter(pk=unique_id).first()
+    if media is None or unicode(media.unique_id) != unique_id:
+        raise Http404('Unknown media asset \'%s\'.' % unique_id)
+
+    # bucket must match
+    if unicode(media.bucket_id) != bucket:
+        raise Http404('Bucket does not match.')
+
+    # filename must match the current version (and preview extension)
+    expected_filename = media.filename
+    if not media.is_image and media.has_preview:
+        expected_filename = media.get_preview_ext(expected_filename, settings.CUBANE_DEFAULT_MEDIA_PREVIEW_EXT)
+    if media.get_filename_with_version(expected_filename) != filename:
+        raise Http404('Filename does not match.')
+
+    return serve_media_api(request, media, shape, size)
+
+
 def media_api_original(request, bucket, pk, filename):
     """
     Serve a media asset for the original version of the given media asset and
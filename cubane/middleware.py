@@ -7,6 +7,9 @@ from django.utils.encoding import force_unicode
 from cubane.templatetags.resource_tags import get_resources_markup
 from cubane.lib.url import url_without_port, make_absolute_url
 from cubane.lib.serve import serve_static_with_context
+from cubane.cms.batch import begin_content_change_batch
+from cubane.cms.batch import end_content_change_batch
+from cubane.cms.batch import get_content_change_batch
 import re
 
 
@@ -118,6 +121,37 @@ class SettingsMiddleware(object):
             request.context = IShopClientContext(request)
 
 
+class ContentChangeBatchMiddleware(object):
+    """
+    Collects all content change notifications for the duration of a request,
+    so that the cache is invalidated once at the end of the request rather
+    than for every model instance that is saved or deleted.
+    """
+    def process_request(self, request):
+        # a batch left over by a previous request on this thread (for example
+        # due to an unhandled exception) is processed first
+        while get_content_change_batch() is not None:
+            end_content_change_batch()
+
+        begin_content_change_batch()
+        request._content_change_batch = True
+
+
+    def process_exception(self, request, exception):
+        self._end_batch(request)
+
+
+    def process_response(self, request, response):
+        self._end_batch(request)
+        return response
+
+
+    def _end_batch(self, request):
+        if getattr(request, '_content_change_batch', False):
+            request._content_change_batch = False
+            end_content_change_batch()
+
+
 class FrontendEditingMiddleware(object):
     """
     Provides frontend editing capabilities.
@@ -313,6 +313,10 @@ def default_env(
         ('footer', 'Footer'),
     )
     m.CMS_NAVIGATION_INCLUDE_CHILD_PAGES = False
+    m.CMS_NAVIGATION_CACHE = True
+    m.CMS_NAVIGATION_CACHE_ALIAS = 'default'
+    m.CMS_SETTINGS_CACHE_ALIAS = 'default'
+    m.CMS_SETTINGS_CACHE_CHECK_INTERVAL = 1
     m.CMS_EXCERPT_LENGTH = 60
     m.CMS_NO_AUTO_EXCERPT = False
     m.CMS_SLOTNAMES = ['content']
@@ -324,6 +328,8 @@ def default_env(
     m.CMS_BACKEND_SITEMAP = False
     m.CMS_META_TITLE_SEPARATOR = ' | '
     m.CMS_CLEAN_HTML = True
+    m.CMS_CONTENT_ENCODING = 'pickle'
+    m.CMS_SLOT_CACHE_SIZE = 1000
 
 
     #
@@ -490,6 +496,15 @@ def default_env(
             m.DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
 
 
+    #
+    # Benchmarks are part of the test suite but only run if the env.
+    # specifies to do so.
+    #
+    m.TEST_BENCHMARK = False
+    if m.TEST: # pragma: no cover
+        m.TEST_BENCHMARK = os.environ.get('DEV_TEST_BENCHMARK', '0') == '1'
+
+
     #
     # Turn off django migrations if we are running under test.
     # See: http://stackoverflow.com/questions/25161425/disable-migrations-when-running-unit-tests-in-django-1-7
@@ -503,6 +518,9 @@ def default_env(
     #
     m.CACHE_ENABLED = True
     m.CACHE_PUBLISH_ENABLED = True
+    m.CACHE_PUBLISH_WORKERS = 1
+    m.CACHE_PARTIAL_INVALIDATION = True
+    m.CACHE_COMPRESSION = ['gzip']
     m.STATIC_URL = '/static/'
     m.PUBLIC_HTML_ROOT = os.path.abspath(os.path.join(m.BASE_PATH, '..', '..', 'public_html'))
     m.CACHE_ROOT = os.path.join(m.PUBLIC_HTML_ROOT, 'cache')
@@ -529,6 +547,17 @@ def default_env(
     m.MEDIA_DOWNLOAD_URL = 'download/'
 
 
+    #
+    # Sendfile: Offload sending media files to the web server, for example
+    # 'cubane.lib.sendfile.NginxSendfileBackend' (X-Accel-Redirect) or
+    # 'cubane.lib.sendfile.XSendfileBackend' (X-Sendfile). By default, files
+    # are streamed by the WSGI server.
+    #
+    m.CUBANE_SENDFILE_BACKEND = None
+    m.CUBANE_SENDFILE_ROOT = m.MEDIA_ROOT
+    m.CUBANE_SENDFILE_URL = '/protected-media/'
+
+
     m.CACHES = {
         'default': {
             'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
@@ -598,6 +627,68 @@ def default_env(
     m.IMAGE_PNG_OPT_COMMAND = 'optipng -o 0 -quiet -out %(dest)s %(source)s'
 
 
+    #
+    # Number of worker processes that are used to generate image versions
+    # in parallel (opt-in).
+    #
+    m.IMAGE_RESIZE_WORKERS = 1
+
+
+    #
+    # Generate smaller image versions of the same shape by resampling the
+    # next larger image version rather than the original image.
+    #
+    m.IMAGE_RESIZE_PYRAMID = False
+
+
+    #
+    # Generate image versions on demand when requested for the first time
+    # rather than generating all image versions when uploading an image. The
+    # total size of all image versions on disk may be limited (in bytes), in
+    # which case the least recently used image versions are removed.
+    #
+    m.IMAGE_ON_DEMAND = False
+    m.IMAGE_ON_DEMAND_MAX_SIZE = None
+
+
+    #
+    # Cache colourised SVG images served by the media api. The number of
+    # cache entries held in memory (per process) and an optional folder for
+    # sharing cache entries between processes on disk with an optional
+    # maximum total size (in bytes).
+    #
+    m.IMAGE_SVG_CACHE_ENTRIES = 256
+    m.IMAGE_SVG_CACHE_ROOT = None
+    m.IMAGE_SVG_CACHE_MAX_SIZE = None
+
+
+    #
+    # Number of threads that are used to download media assets from external
+    # sources concurrently and the timeout for each download (in seconds).
+    #
+    m.MEDIA_DOWNLOAD_WORKERS = 8
+    m.MEDIA_DOWNLOAD_TIMEOUT = 1000
+
+
+    #
+    # Number of worker processes executing background tasks in parallel.
+    #
+    m.TASK_RUNNER_WORKERS = 1
+
+
+    #
+    # Job queue: number of jobs claimed at once, maximum number of attempts
+    # per job, initial delay before retrying a failed job (doubled with every
+    # attempt) and its maximum (in seconds) and the time after which a claimed
+    # job becomes available again if it has not been completed (in seconds).
+    #
+    m.TASK_QUEUE_BATCH_SIZE = 50
+    m.TASK_QUEUE_MAX_ATTEMPTS = 5
+    m.TASK_QUEUE_RETRY_DELAY = 60
+    m.TASK_QUEUE_MAX_RETRY_DELAY = 60 * 60
+    m.TASK_QUEUE_VISIBILITY_TIMEOUT = 10 * 60
+
+
     #
     # Image PDF preview generation
     #
@@ -782,6 +873,7 @@ def default_env(
     m.EMAIL_SUBJECT_PREFIX = '[%s] ' % domain_name
     m.EMAIL_CUSTOM_ENQUIRY_SUBJECT_CUSTOMER = None
     m.EMAIL_CUSTOM_ENQUIRY_SUBJECT_CLIENT = None
+    m.CUBANE_MAIL_ASYNC = False
     if m.DEBUG:
         if email_file_log:
             m.EMAIL_BACKEND = 'cubane.backends.EmailEmlFileBackend'
@@ -1,24 +1,129 @@
 # coding=UTF-8
 from __future__ import unicode_literals
 from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Min, F
+from django.utils import timezone
 from django.utils.module_loading import import_module
 from cubane.lib.file import file_get_contents, file_put_contents
+from cubane.lib.filelock import FileLock
 from cubane.lib.mail import send_exception_email
 from cubane.lib.libjson import to_json, decode_json
+from collections import OrderedDict
+import multiprocessing
+import select
+import errno
+import traceback
+import stat
 import os
 import signal
 
 
+_WORKER_RUNNER = None
+
+
+def _init_task_worker():
+    """
+    Initialise a task worker process by creating a task runner that is used
+    by the worker process for the lifetime of the process.
+    """
+    global _WORKER_RUNNER
+    _WORKER_RUNNER = TaskRunner()
+
+
+def _task_worker(worker):
+    """
+    Run all background tasks as the worker with the given index within a
+    worker process.
+    """
+    _WORKER_RUNNER.run_worker(worker)
+    return worker
+
+
+def get_task_status_percent(taskinfo):
+    """
+    Return the progress in percent for the given task status information.
+    """
+    if taskinfo.get('stopped', False):
+        return 0
+
+    counter = taskinfo.get('recordCounter', 0)
+    total = taskinfo.get('totalRecords', 0)
+    if counter > total:
+        total = counter
+    if total == 0:
+        total = 1
+    return int(round(float(counter) / float(total) * 100.0))
+
+
+def get_aggregated_task_status(workers):
+    """
+    Return the overall task status for the given list of status information
+    for each individual worker. Workers that are processing the same task are
+    sharing the same work items, therefore the progress of all workers
+    contributes towards the total number of records of such task.
+    """
+    tasks = OrderedDict()
+    message = None
+    for worker in workers:
+        if worker.get('stopped', False):
+            continue
+
+        task = worker.get('task')
+        total, counter = tasks.get(task, (0, 0))
+        tasks[task] = (
+            max(total, worker.get('totalRecords', 0)),
+            counter + worker.get('recordCounter', 0)
+        )
+
+        if message is None:
+            message = worker.get('message')
+
+    return {
+        'totalRecords': sum([total for total, _ in tasks.values()]),
+        'recordCounter': sum([counter for _, counter in tasks.values()]),
+        'message': message,
+        'stopped': len(tasks) == 0,
+        'workers': workers
+    }
+
+
+def install_tasks(runner):
+    from cubane.tasks.mail import MailTask
+    runner.register(MailTask())
+
+
 class Task(object):
     STATUS_FILENAME = '.taskrunner.status'
 
 
+    # True, if this task can be executed by multiple workers at the same time,
+    # in which case each worker must claim individual work items atomically.
+    concurrent = False
+
+
+    # index of the worker that is executing this task
+    worker = 0
+
+
+    # tasks with a higher priority are executed first
+    priority = 0
+
+
     def __init__(self):
         """
         Create a new task.
         """
 
 
+    def prepare(self):
+        """
+        Prepare task before the task is executed by any worker, for example
+        in order to enqueue work.
+        """
+        pass
+
+
     def run(self):
         """
         Run task.
@@ -59,22 +164,122 @@ class Task(object):
 
     def _report_status(self):
         """
-        Write status to status file.
+        Write status to status file. The status file contains the status of
+        each worker as well as the overall status of all workers, therefore
+        the status file is updated under lock, since multiple workers may
+        report their status at the same time.
         """
-        file_put_contents(
-            os.path.join(settings.PUBLIC_HTML_ROOT, self.STATUS_FILENAME),
-            to_json({
-                'totalRecords': self._total_records,
-                'recordCounter': self._record_counter,
-                'message': self._message,
-                'stopped': self._stopped
+        filename = os.path.join(settings.PUBLIC_HTML_ROOT, self.STATUS_FILENAME)
+        lock = FileLock.temp(settings.DOMAIN_NAME, 'taskrunner-status')
+        lock.acquire()
+        try:
+            try:
+                workers = decode_json(file_get_contents(filename)).get('workers', [])
+            except (IOError, ValueError, AttributeError):
+                workers = []
+
+            workers = [w for w in workers if w.get('worker') != self.worker]
+            workers.append({
+                'worker': self.worker,
+                'task': self.__class__.__name__,
+                'totalRecords': getattr(self, '_total_records', 0),
+                'recordCounter': getattr(self, '_record_counter', 0),
+                'message': getattr(self, '_message', None),
+                'stopped': getattr(self, '_stopped', False)
             })
-        )
+            workers = sorted(workers, key=lambda w: w.get('worker'))
+
+            # replace status file atomically, so that we never read
+            # partially written status information
+            temp_filename = '%s.%d' % (filename, os.getpid())
+            file_put_contents(
+                temp_filename,
+                to_json(get_aggregated_task_status(workers))
+            )
+            os.rename(temp_filename, filename)
+        finally:
+            lock.release()
+
+
+class QueueTask(Task):
+    """
+    Base class for tasks that process jobs from the job queue. Jobs for the
+    task with the given name are claimed in batches, therefore multiple
+    workers can process jobs for the same task at the same time. Failed jobs
+    are retried with exponential backoff until they are eventually moved to
+    the dead letter state.
+    """
+    concurrent = True
+
+
+    # name of the task, which identifies the jobs processed by this task
+    name = None
+
+
+    def run(self):
+        """
+        Process all available jobs for this task in batches.
+        """
+        from cubane.tasks.models import Job
+
+        self.report_start(Job.get_available(self.name).count())
+        while True:
+            jobs = Job.claim(self.name)
+            if not jobs:
+                break
+
+            self.process_batch(jobs)
+
+
+    def process_batch(self, jobs):
+        """
+        Process the given batch of claimed jobs. Override to share resources
+        or to fetch data for all jobs within the same batch at once.
+        """
+        for job in jobs:
+            self.process(job)
+
+
+    def process(self, job):
+        """
+        Process the given claimed job. The job is removed once completed. If
+        processing the job fails, the job is retried later unless we reached
+        the maximum number of attempts, in which case an exception email is
+        sent. The job is skipped if another worker reclaimed it while we were
+        processing other jobs of the same batch.
+        """
+        self.report_status(self._record_counter + 1, self.get_job_message(job))
+        if not job.extend_lock():
+            return
+
+        try:
+            with transaction.atomic():
+                self.process_job(job)
+                job.complete()
+        except:
+            if job.fail(traceback.format_exc()) and job.is_dead:
+                send_exception_email()
+
+
+    def get_job_message(self, job):
+        """
+        Return the status message that is reported while processing the
+        given job.
+        """
+        return None
+
+
+    def process_job(self, job):
+        """
+        Process the given job. Raise an exception if the job failed.
+        """
+        raise NotImplementedError('Override process_job() method to implement the processing of jobs.')
 
 
 class TaskRunner(object):
     PID_FILENAME = '.taskrunner.pid'
     SIGNAL_FILENAME = '.taskrunner.signal'
+    WAKEUP_FILENAME = '.taskrunner.wakeup'
 
 
     @classmethod
@@ -101,6 +306,15 @@ class TaskRunner(object):
         return os.path.join(settings.PUBLIC_HTML_ROOT, cls.SIGNAL_FILENAME)
 
 
+    @classmethod
+    def get_wakeup_filename(cls):
+        """
+        Return the full path to the named pipe that is used to wake up the
+        task runner while it is waiting for work.
+        """
+        return os.path.join(settings.PUBLIC_HTML_ROOT, cls.WAKEUP_FILENAME)
+
+
     @classmethod
     def get_status_filename(cls):
         """
@@ -123,6 +337,138 @@ class TaskRunner(object):
         Notify the task runner to be executed shortly.
         """
         file_put_contents(cls.get_signal_filename(), '1')
+        cls.wakeup()
+
+
+    @classmethod
+    def wakeup(cls):
+        """
+        Wake up the task runner if it is currently waiting for work by writing
+        to the named pipe it is listening on. Nothing happens if the task
+        runner is not listening.
+        """
+        filename = cls.get_wakeup_filename()
+        try:
+            if not stat.S_ISFIFO(os.stat(filename).st_mode):
+                return
+
+            fd = os.open(filename, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            # no named pipe or nobody is listening
+            return
+
+        try:
+            os.write(fd, b'1')
+        except OSError:
+            # pipe is full, the task runner will wake up anyway
+            pass
+        finally:
+            os.close(fd)
+
+
+    @classmethod
+    def open_wakeup(cls):
+        """
+        Create the named pipe that is used to wake up the task runner and open
+        it for listening. Returns the file descriptor of the named pipe or None
+        if named pipes are not supported. The pipe is opened for reading and
+        writing, so that the pipe never reports end-of-file while there is no
+        other process writing to it.
+        """
+        filename = cls.get_wakeup_filename()
+        try:
+            if os.path.exists(filename) and not stat.S_ISFIFO(os.stat(filename).st_mode):
+                os.remove(filename)
+            if not os.path.exists(filename):
+                os.mkfifo(filename)
+            return os.open(filename, os.O_RDWR | os.O_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+
+
+    @classmethod
+    def wait_for_wakeup(cls, fd, timeout):
+        """
+        Wait until the task runner is woken up via the named pipe with the
+        given file descriptor or the given timeout in seconds ellapsed.
+        Return True, if the task runner was woken up.
+        """
+        try:
+            readable, _, _ = select.select([fd], [], [], max(0, timeout))
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return False
+            raise
+
+        if not readable:
+            return False
+
+        # consume all pending wakeup calls
+        try:
+            while os.read(fd, 1024):
+                pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        return True
+
+
+    @classmethod
+    def close_wakeup(cls, fd):
+        """
+        Close the given file descriptor of the named pipe that is used to wake
+        up the task runner and remove the named pipe.
+        """
+        if fd is not None:
+            os.close(fd)
+
+        filename = cls.get_wakeup_filename()
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+    @classmethod
+    def enqueue(cls, task, payload=None, key=None, priority=0, delay=None, max_attempts=None):
+        """
+        Enqueue a new job for the task with the given name and notify the
+        task runner. See cubane.tasks.models.Job.enqueue() for details.
+        """
+        from cubane.tasks.models import Job
+
+        job = Job.enqueue(task, payload, key, priority, delay, max_attempts)
+        if job is not None:
+            cls.notify()
+        return job
+
+
+    @classmethod
+    def get_next_job_delay(cls, tasks):
+        """
+        Return the number of seconds until the next job for any of the given
+        task names becomes available, either because a failed job is retried
+        or the visibility timeout of a claimed job expires, which still has
+        attempts left. Returns None if there are no such jobs.
+        """
+        from cubane.tasks.models import Job
+
+        tasks = list(tasks)
+        if not tasks:
+            return None
+
+        jobs = Job.objects.filter(task__in=tasks)
+        timestamps = [
+            jobs.filter(status=Job.STATUS_PENDING).aggregate(t=Min('available_on')).get('t'),
+            jobs.filter(
+                status=Job.STATUS_RUNNING,
+                attempts__lt=F('max_attempts')
+            ).aggregate(t=Min('locked_until')).get('t')
+        ]
+        timestamps = [t for t in timestamps if t is not None]
+        if not timestamps:
+            return None
+
+        delay = min(timestamps) - timezone.now()
+        return max(0, delay.total_seconds())
 
 
     @classmethod
@@ -133,21 +479,13 @@ class TaskRunner(object):
         try:
             taskinfo = decode_json(file_get_contents(cls.get_status_filename()))
 
-            # calc. percentage
-            if taskinfo.get('stopped', False):
-                percent = 0
-            else:
-                counter = taskinfo.get('recordCounter', 0)
-                total = taskinfo.get('totalRecords', 0)
-                if counter > total:
-                    total = counter
-                if total == 0:
-                    total = 1
-                percent = int(round(float(counter) / float(total) * 100.0))
-            taskinfo['percent'] = percent
+            # calc. percentage (overall and for each worker)
+            taskinfo['percent'] = get_task_status_percent(taskinfo)
+            for worker in taskinfo.get('workers', []):
+                worker['percent'] = get_task_status_percent(worker)
 
             return taskinfo
-        except IOError:
+        except (IOError, ValueError):
             return {}
 
 
@@ -262,18 +600,87 @@ class TaskRunner(object):
 
     def register(self, task):
         """
-        Register the given task runner.
+        Register the given task runner. Tasks are kept in order of priority.
         """
         self._tasks.append(task)
+        self._tasks.sort(key=lambda task: -task.priority)
 
 
-    def run(self):
+    def get_queue_task_names(self):
+        """
+        Return the names of all registered tasks that process jobs from the
+        job queue.
+        """
+        return [task.name for task in self._tasks if isinstance(task, QueueTask)]
+
+
+    @classmethod
+    def get_workers(cls):
         """
-        Run background tasks.
+        Return the number of worker processes that are used to run background
+        tasks.
         """
+        try:
+            workers = int(settings.TASK_RUNNER_WORKERS)
+        except (TypeError, ValueError):
+            workers = 1
+
+        return max(1, workers)
+
+
+    def run(self, workers=None):
+        """
+        Run background tasks. If more than one worker is used, all workers
+        run in parallel, where concurrent tasks are executed by all workers
+        and all other tasks are executed by the first worker only.
+        """
+        if workers is None:
+            workers = self.get_workers()
+
         for task in self._tasks:
+            try:
+                task.prepare()
+            except:
+                send_exception_email()
+
+        if workers > 1 and any([task.concurrent for task in self._tasks]):
+            self._run_parallel(workers)
+        else:
+            self.run_worker(0)
+
+
+    def run_worker(self, worker):
+        """
+        Run background tasks as the worker with the given index.
+        """
+        for task in self._tasks:
+            if worker > 0 and not task.concurrent:
+                continue
+
+            task.worker = worker
             try:
                 task.run()
                 task.report_stop()
             except:
-                send_exception_email()
\ No newline at end of file
+                send_exception_email()
+
+
+    def _run_parallel(self, workers):
+        """
+        Run background tasks by the given number of worker processes in
+        parallel.
+        """
+        # worker processes must not share the database connection of this
+        # process, each worker will establish its own connection on demand
+        connections.close_all()
+
+        pool = multiprocessing.Pool(workers, _init_task_worker)
+        try:
+            for _ in pool.imap_unordered(_task_worker, range(workers)):
+                pass
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
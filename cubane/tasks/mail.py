@@ -0,0 +1,49 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.core.mail import get_connection
+from cubane.tasks import QueueTask
+from cubane.lib.mail import get_email_message_from_payload
+
+
+class MailTask(QueueTask):
+    """
+    Delivers email messages that have been enqueued by
+    cubane.lib.mail.cubane_send_message(). All messages of the same batch are
+    sent over the same mail connection.
+    """
+    name = 'mail'
+
+
+    # deliver mail before any other work is processed
+    priority = 10
+
+
+    def process_batch(self, jobs):
+        """
+        Open one mail connection for sending all messages of the given batch.
+        """
+        self._connection = get_connection()
+        try:
+            self._connection.open()
+        except Exception:
+            # the connection is opened again for each message, which will
+            # fail the individual job, so that the message is retried later
+            pass
+
+        try:
+            super(MailTask, self).process_batch(jobs)
+        finally:
+            self._connection.close()
+            self._connection = None
+
+
+    def get_job_message(self, job):
+        return 'Sending email: <em>%s</em>' % job.payload.get('subject')
+
+
+    def process_job(self, job):
+        """
+        Send the email message of the given job.
+        """
+        msg = get_email_message_from_payload(job.payload, self._connection)
+        msg.send()
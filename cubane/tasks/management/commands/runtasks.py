@@ -22,6 +22,13 @@ class Command(BaseCommand):
     help = 'Executes background tasks.'
 
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, dest='workers', default=None,
+            help='Number of worker processes used to execute background tasks in parallel.'
+        )
+
+
     def handle(self, *args, **options):
         """
         Run command.
@@ -41,6 +48,9 @@ class Command(BaseCommand):
         # setup cleanup handler that is executed whenever we terminate
         signal.signal(signal.SIGTERM, self.kill_handler)
 
+        # listen for wakeup calls, so that we do not need to poll for work
+        self.wakeup_fd = TaskRunner.open_wakeup()
+
         # whenever we have a fresh re-start, notify yourself, so that we might
         # pick up any work that is left to do for us, we might have missed
         # a previous notification...
@@ -55,7 +65,7 @@ class Command(BaseCommand):
 
                 # execute background tasks
                 runner = self.create_task_runner()
-                runner.run()
+                runner.run(options.get('workers'))
 
             # wait for further work to appear...
             if not self.wait_for_work():
@@ -67,14 +77,32 @@ class Command(BaseCommand):
 
     def wait_for_work(self):
         """
-        Periodically check if there is more work. After having waited for more
-        work to appear for a while, stop waiting.
+        Wait for more work to appear. We are woken up via the wakeup pipe as
+        soon as new work is available; if named pipes are not available, we
+        periodically check for more work instead. We also stop waiting once
+        a job that failed before is due to be retried. After having waited for
+        more work to appear for a while, stop waiting.
         """
         start_time = time.time()
+        job_delay = TaskRunner.get_next_job_delay(
+            self.create_task_runner().get_queue_task_names()
+        )
         while not TaskRunner.has_work():
-            # sleep and stop waiting if we get interrupted by user
+            # a job became available in the meantime
+            time_ellapsed_sec = time.time() - start_time
+            if job_delay is not None and time_ellapsed_sec >= job_delay:
+                TaskRunner.notify()
+                break
+
+            # wait and stop waiting if we get interrupted by user
             try:
-                time.sleep(self.WAIT_FOR_WORK_SLEEP_SEC)
+                if self.wakeup_fd is not None:
+                    timeout = self.MAX_WAIT_FOR_WORK_SEC - time_ellapsed_sec
+                    if job_delay is not None:
+                        timeout = min(timeout, job_delay - time_ellapsed_sec)
+                    TaskRunner.wait_for_wakeup(self.wakeup_fd, timeout)
+                else:
+                    time.sleep(self.WAIT_FOR_WORK_SLEEP_SEC)
             except KeyboardInterrupt:
                 return False
 
@@ -99,6 +127,8 @@ class Command(BaseCommand):
         remove pid file.
         """
         TaskRunner.remove_status()
+        TaskRunner.close_wakeup(getattr(self, 'wakeup_fd', None))
+        self.wakeup_fd = None
         TaskRunner.signal_terminated()
 
 
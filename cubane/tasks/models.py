@@ -0,0 +1,350 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.conf import settings
+from django.db import models, connection, transaction
+from django.db.models import Q, F
+from django.utils import timezone
+from cubane.lib.libjson import to_json, decode_json
+import datetime
+
+
+class Job(models.Model):
+    """
+    A single unit of background work that is processed by the task with the
+    given name. Jobs are claimed by workers in batches in order of priority.
+    A claimed job is invisible to other workers until its visibility timeout
+    expires, in which case the job is claimed again (for example if the
+    worker processing the job died). Failed jobs are retried with exponential
+    backoff until the maximum number of attempts has been reached, in which
+    case the job is kept as a dead job for inspection.
+    """
+    STATUS_PENDING = 0
+    STATUS_RUNNING = 1
+    STATUS_DEAD    = 2
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DEAD,    'Dead')
+    )
+
+
+    class Meta:
+        app_label           = 'tasks'
+        db_table            = 'cubane_task_job'
+        ordering            = ['-priority', 'available_on', 'id']
+        verbose_name        = 'Job'
+        verbose_name_plural = 'Jobs'
+
+
+    task = models.CharField(
+        max_length=255,
+        db_index=True
+    )
+
+    key = models.CharField(
+        max_length=255,
+        db_index=True,
+        null=True,
+        blank=True
+    )
+
+    payload_json = models.TextField(
+        null=True,
+        blank=True
+    )
+
+    priority = models.IntegerField(
+        db_index=True,
+        default=0
+    )
+
+    status = models.IntegerField(
+        choices=STATUS_CHOICES,
+        db_index=True,
+        default=STATUS_PENDING
+    )
+
+    attempts = models.IntegerField(
+        default=0
+    )
+
+    max_attempts = models.IntegerField(
+        default=1
+    )
+
+    available_on = models.DateTimeField(
+        db_index=True
+    )
+
+    locked_until = models.DateTimeField(
+        db_index=True,
+        null=True,
+        blank=True
+    )
+
+    last_error = models.TextField(
+        null=True,
+        blank=True
+    )
+
+    created_on = models.DateTimeField(
+        db_index=True
+    )
+
+
+    @classmethod
+    def enqueue(cls, task, payload=None, key=None, priority=0, delay=None, max_attempts=None):
+        """
+        Create a new job for the task with the given name and the given
+        payload, which must be serialisable as json. If a key is given, the
+        job is not created if there is already a pending or running job for
+        the same task with the same key. The job becomes available after the
+        given delay in seconds. Returns the new job or None.
+        """
+        if key is not None and cls.objects.filter(
+            task=task,
+            key=key,
+            status__in=[cls.STATUS_PENDING, cls.STATUS_RUNNING]
+        ).exists():
+            return None
+
+        job = cls.create(task, payload, key, priority, delay, max_attempts)
+        job.save()
+        return job
+
+
+    @classmethod
+    def enqueue_many(cls, task, items, priority=0, max_attempts=None):
+        """
+        Create new jobs for the task with the given name for each of the given
+        list of tuples of key and payload at once. Jobs are not created for
+        keys for which there is already a job for the same task, including
+        dead jobs, therefore work that failed repeatedly is not enqueued
+        again. Returns the number of jobs created.
+        """
+        keys = [key for key, _ in items if key is not None]
+        existing = set()
+        if keys:
+            existing = set(cls.objects.filter(
+                task=task,
+                key__in=keys
+            ).values_list('key', flat=True))
+
+        jobs = []
+        for key, payload in items:
+            if key is not None:
+                if key in existing:
+                    continue
+                existing.add(key)
+
+            jobs.append(cls.create(task, payload, key, priority, None, max_attempts))
+
+        cls.objects.bulk_create(jobs, batch_size=500)
+        return len(jobs)
+
+
+    @classmethod
+    def create(cls, task, payload=None, key=None, priority=0, delay=None, max_attempts=None):
+        """
+        Return a new (unsaved) job for the task with the given name.
+        """
+        if max_attempts is None:
+            max_attempts = settings.TASK_QUEUE_MAX_ATTEMPTS
+
+        now = timezone.now()
+        job = cls()
+        job.task = task
+        job.key = key
+        job.payload = payload
+        job.priority = priority
+        job.max_attempts = max(1, max_attempts)
+        job.created_on = now
+        job.available_on = now + datetime.timedelta(seconds=delay) if delay else now
+        return job
+
+
+    @classmethod
+    def get_available(cls, task, now=None):
+        """
+        Return a queryset of all jobs for the task with the given name that
+        can be claimed, which are pending jobs that became available and
+        running jobs for which the visibility timeout expired.
+        """
+        if now is None:
+            now = timezone.now()
+
+        return cls.objects.filter(task=task).filter(
+            Q(status=cls.STATUS_PENDING, available_on__lte=now) |
+            Q(status=cls.STATUS_RUNNING, locked_until__lte=now)
+        )
+
+
+    @classmethod
+    def claim(cls, task, batch_size=None, visibility_timeout=None):
+        """
+        Claim the next batch of available jobs for the task with the given
+        name in order of priority. Claimed jobs are invisible to other workers
+        for the given visibility timeout in seconds, which is extended for
+        each job right before it is processed (see extend_lock()). Jobs for
+        which the visibility timeout expired too many times are moved to the
+        dead letter state. Returns the list of claimed jobs.
+        """
+        if batch_size is None:
+            batch_size = settings.TASK_QUEUE_BATCH_SIZE
+
+        if visibility_timeout is None:
+            visibility_timeout = settings.TASK_QUEUE_VISIBILITY_TIMEOUT
+
+        now = timezone.now()
+        locked_until = now + datetime.timedelta(seconds=visibility_timeout)
+        with transaction.atomic():
+            jobs = list(cls.get_available(task, now).select_for_update(
+                skip_locked=connection.features.has_select_for_update_skip_locked
+            ).order_by('-priority', 'available_on', 'id')[:max(1, batch_size)])
+
+            # jobs that timed out too many times are dead
+            dead = [
+                job for job in jobs
+                if job.status == cls.STATUS_RUNNING and job.attempts >= job.max_attempts
+            ]
+            if dead:
+                cls.objects.filter(pk__in=[job.pk for job in dead]).update(
+                    status=cls.STATUS_DEAD,
+                    locked_until=None,
+                    last_error='Visibility timeout expired.'
+                )
+
+            jobs = [job for job in jobs if job not in dead]
+            if jobs:
+                cls.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                    status=cls.STATUS_RUNNING,
+                    attempts=F('attempts') + 1,
+                    locked_until=locked_until
+                )
+
+        for job in jobs:
+            job.status = cls.STATUS_RUNNING
+            job.attempts += 1
+            job.locked_until = locked_until
+
+        return jobs
+
+
+    @classmethod
+    def get_retry_delay(cls, attempts):
+        """
+        Return the delay in seconds before a job that failed for the given
+        number of times is attempted again, which doubles with each attempt.
+        """
+        delay = settings.TASK_QUEUE_RETRY_DELAY * (2 ** max(0, attempts - 1))
+        return min(delay, settings.TASK_QUEUE_MAX_RETRY_DELAY)
+
+
+    def get_payload(self):
+        """
+        Return the payload of this job.
+        """
+        if self.payload_json:
+            return decode_json(self.payload_json)
+        else:
+            return None
+
+
+    def set_payload(self, v):
+        """
+        Set the payload of this job.
+        """
+        if v is not None:
+            self.payload_json = to_json(v)
+        else:
+            self.payload_json = None
+
+
+    payload = property(get_payload, set_payload)
+
+
+    @property
+    def is_dead(self):
+        """
+        Return True, if this job has been moved to the dead letter state.
+        """
+        return self.status == self.STATUS_DEAD
+
+
+    def _get_claimed(self):
+        """
+        Return a queryset that matches this job only if it is still claimed
+        by us, which is not the case if another worker reclaimed the job
+        after the visibility timeout expired.
+        """
+        return Job.objects.filter(
+            pk=self.pk,
+            status=self.STATUS_RUNNING,
+            attempts=self.attempts
+        )
+
+
+    def extend_lock(self, visibility_timeout=None):
+        """
+        Extend the visibility timeout of this claimed job, so that no other
+        worker reclaims the job while we are processing it. Return False, if
+        the job is no longer claimed by us.
+        """
+        if visibility_timeout is None:
+            visibility_timeout = settings.TASK_QUEUE_VISIBILITY_TIMEOUT
+
+        locked_until = timezone.now() + datetime.timedelta(seconds=visibility_timeout)
+        if self._get_claimed().update(locked_until=locked_until) == 0:
+            return False
+
+        self.locked_until = locked_until
+        return True
+
+
+    def complete(self):
+        """
+        Mark this job as successfully completed by removing it.
+        """
+        Job.objects.filter(pk=self.pk).delete()
+
+
+    def fail(self, error=None):
+        """
+        Mark this job as failed with the given error message. The job is
+        retried after a delay unless we reached the maximum number of
+        attempts, in which case the job is moved to the dead letter state.
+        Return False, if the job is no longer claimed by us, in which case
+        the job is left untouched.
+        """
+        self.last_error = error
+        self.locked_until = None
+        if self.attempts >= self.max_attempts:
+            self.status = self.STATUS_DEAD
+        else:
+            self.status = self.STATUS_PENDING
+            self.available_on = timezone.now() + datetime.timedelta(
+                seconds=self.get_retry_delay(self.attempts)
+            )
+
+        return self._get_claimed().update(
+            status=self.status,
+            last_error=self.last_error,
+            locked_until=None,
+            available_on=self.available_on
+        ) > 0
+
+
+    def retry(self):
+        """
+        Retry this (dead) job as soon as possible with the full number of
+        attempts available.
+        """
+        self.status = self.STATUS_PENDING
+        self.attempts = 0
+        self.available_on = timezone.now()
+        self.locked_until = None
+        self.save()
+
+
+    def __unicode__(self):
+        return '%s #%s' % (self.task, self.pk)
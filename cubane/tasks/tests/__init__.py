@@ -0,0 +1,3 @@
+from cubane.tasks.tests.jobs import *
+from cubane.tasks.tests.mail import *
+from cubane.tasks.tests.tasks import *
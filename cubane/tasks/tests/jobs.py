@@ -0,0 +1,365 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from cubane.tests.base import CubaneTestCase
+from cubane.tasks import Task, QueueTask, TaskRunner
+from cubane.tasks.models import Job
+import datetime
+import mock
+import shutil
+import tempfile
+
+
+class JobTestCaseBase(CubaneTestCase):
+    """
+    Base class for test cases that require the job queue. The job table is
+    created if required, since cubane.tasks may not be installed.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls._create_job_table = Job._meta.db_table not in connection.introspection.table_names()
+        if cls._create_job_table:
+            with connection.schema_editor() as editor:
+                editor.create_model(Job)
+        super(JobTestCaseBase, cls).setUpClass()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        super(JobTestCaseBase, cls).tearDownClass()
+        if cls._create_job_table:
+            with connection.schema_editor() as editor:
+                editor.delete_model(Job)
+
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings_override = override_settings(PUBLIC_HTML_ROOT=self.root)
+        self.settings_override.enable()
+
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root)
+
+
+class EchoQueueTask(QueueTask):
+    """
+    Queue task that records the payload of each job and fails for jobs with
+    a payload that says so.
+    """
+    name = 'echo'
+
+
+    def __init__(self):
+        self.payloads = []
+
+
+    def process_job(self, job):
+        self.payloads.append(job.payload)
+        if job.payload.get('fail'):
+            raise ValueError('failed')
+
+
+@override_settings(
+    TASK_QUEUE_BATCH_SIZE=2,
+    TASK_QUEUE_MAX_ATTEMPTS=3,
+    TASK_QUEUE_RETRY_DELAY=10,
+    TASK_QUEUE_MAX_RETRY_DELAY=25,
+    TASK_QUEUE_VISIBILITY_TIMEOUT=60
+)
+class JobTestCase(JobTestCaseBase):
+    """
+    cubane.tasks.models.Job
+    """
+    def test_enqueue_should_create_pending_job(self):
+        job = Job.enqueue('foo', {'a': 1}, priority=5)
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual('foo', job.task)
+        self.assertEqual({'a': 1}, job.payload)
+        self.assertEqual(5, job.priority)
+        self.assertEqual(Job.STATUS_PENDING, job.status)
+        self.assertEqual(0, job.attempts)
+        self.assertEqual(3, job.max_attempts)
+
+
+    def test_enqueue_should_delay_job(self):
+        Job.enqueue('foo', delay=60)
+        self.assertEqual([], Job.claim('foo'))
+
+
+    def test_enqueue_should_ignore_pending_job_with_same_key(self):
+        self.assertIsNotNone(Job.enqueue('foo', key='a'))
+        self.assertIsNone(Job.enqueue('foo', key='a'))
+        self.assertIsNotNone(Job.enqueue('bar', key='a'))
+
+
+    def test_enqueue_should_create_job_with_same_key_as_dead_job(self):
+        Job.enqueue('foo', key='a')
+        Job.objects.update(status=Job.STATUS_DEAD)
+        self.assertIsNotNone(Job.enqueue('foo', key='a'))
+
+
+    def test_enqueue_many_should_ignore_existing_and_dead_jobs(self):
+        Job.enqueue('foo', key='a')
+        Job.enqueue('foo', key='b')
+        Job.objects.filter(key='b').update(status=Job.STATUS_DEAD)
+
+        n = Job.enqueue_many('foo', [('a', 1), ('b', 2), ('c', 3), ('c', 4), (None, 5)])
+        self.assertEqual(2, n)
+        self.assertEqual(
+            [('a', None), ('b', None), ('c', 3), (None, 5)],
+            [(job.key, job.payload) for job in Job.objects.order_by('id')]
+        )
+
+
+    def test_claim_should_claim_batch_in_order_of_priority(self):
+        a = Job.enqueue('foo', priority=0)
+        b = Job.enqueue('foo', priority=1)
+        c = Job.enqueue('foo', priority=0)
+        Job.enqueue('bar', priority=2)
+
+        self.assertEqual([b.pk, a.pk], [job.pk for job in Job.claim('foo')])
+        self.assertEqual([c.pk], [job.pk for job in Job.claim('foo')])
+        self.assertEqual([], Job.claim('foo'))
+
+
+    def test_claim_should_mark_jobs_as_running(self):
+        Job.enqueue('foo')
+        job = Job.claim('foo')[0]
+        self.assertEqual(Job.STATUS_RUNNING, job.status)
+        self.assertEqual(1, job.attempts)
+
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(Job.STATUS_RUNNING, job.status)
+        self.assertEqual(1, job.attempts)
+        self.assertTrue(job.locked_until > timezone.now())
+
+
+    def test_claim_should_reclaim_jobs_after_visibility_timeout(self):
+        Job.enqueue('foo')
+        job = Job.claim('foo')[0]
+        self._expire(job)
+
+        job = Job.claim('foo')[0]
+        self.assertEqual(2, job.attempts)
+
+
+    def test_claim_should_move_timed_out_jobs_to_dead_letter_state(self):
+        Job.enqueue('foo', max_attempts=1)
+        job = Job.claim('foo')[0]
+        self._expire(job)
+
+        self.assertEqual([], Job.claim('foo'))
+        job = Job.objects.get(pk=job.pk)
+        self.assertTrue(job.is_dead)
+        self.assertEqual('Visibility timeout expired.', job.last_error)
+
+
+    def test_complete_should_remove_job(self):
+        Job.enqueue('foo')
+        Job.claim('foo')[0].complete()
+        self.assertEqual(0, Job.objects.count())
+
+
+    def test_fail_should_retry_job_with_exponential_backoff(self):
+        Job.enqueue('foo')
+        for attempt, delay in [(1, 10), (2, 20)]:
+            job = Job.claim('foo')[0]
+            job.fail('error')
+            job = Job.objects.get(pk=job.pk)
+            self.assertEqual(Job.STATUS_PENDING, job.status)
+            self.assertEqual(attempt, job.attempts)
+            self.assertEqual('error', job.last_error)
+            self.assertAlmostEqual(delay, (job.available_on - timezone.now()).total_seconds(), delta=2)
+            self._make_available(job)
+
+
+    def test_fail_should_move_job_to_dead_letter_state_after_max_attempts(self):
+        Job.enqueue('foo', max_attempts=2)
+        for _ in range(2):
+            job = Job.claim('foo')[0]
+            job.fail('error')
+            self._make_available(job)
+
+        self.assertTrue(Job.objects.get(pk=job.pk).is_dead)
+        self.assertEqual([], Job.claim('foo'))
+
+
+    def test_fail_should_not_change_job_reclaimed_by_another_worker(self):
+        Job.enqueue('foo')
+        job = Job.claim('foo')[0]
+        self._expire(job)
+        Job.claim('foo')
+
+        self.assertFalse(job.fail('error'))
+        reclaimed = Job.objects.get(pk=job.pk)
+        self.assertEqual(Job.STATUS_RUNNING, reclaimed.status)
+        self.assertEqual(2, reclaimed.attempts)
+        self.assertIsNone(reclaimed.last_error)
+
+
+    def test_fail_should_not_recreate_job_completed_by_another_worker(self):
+        Job.enqueue('foo')
+        job = Job.claim('foo')[0]
+        self._expire(job)
+        Job.claim('foo')[0].complete()
+
+        self.assertFalse(job.fail('error'))
+        self.assertEqual(0, Job.objects.count())
+
+
+    def test_extend_lock_should_extend_visibility_timeout(self):
+        Job.enqueue('foo')
+        job = Job.claim('foo')[0]
+        self._expire(job)
+
+        self.assertTrue(job.extend_lock())
+        self.assertEqual([], Job.claim('foo'))
+        self.assertAlmostEqual(60, (Job.objects.get(pk=job.pk).locked_until - timezone.now()).total_seconds(), delta=2)
+
+
+    def test_extend_lock_should_fail_for_job_reclaimed_by_another_worker(self):
+        Job.enqueue('foo')
+        job = Job.claim('foo')[0]
+        self._expire(job)
+        Job.claim('foo')
+
+        self.assertFalse(job.extend_lock())
+
+
+    def test_retry_should_make_dead_job_available_again(self):
+        Job.enqueue('foo', max_attempts=1)
+        job = Job.claim('foo')[0]
+        job.fail('error')
+        job.retry()
+        self.assertEqual([job.pk], [job.pk for job in Job.claim('foo')])
+
+
+    def test_get_retry_delay_should_double_delay_up_to_max_delay(self):
+        self.assertEqual(
+            [10, 20, 25, 25],
+            [Job.get_retry_delay(attempts) for attempts in range(1, 5)]
+        )
+
+
+    def _expire(self, job):
+        Job.objects.filter(pk=job.pk).update(
+            locked_until=timezone.now() - datetime.timedelta(seconds=1)
+        )
+
+
+    def _make_available(self, job):
+        Job.objects.filter(pk=job.pk).update(
+            available_on=timezone.now() - datetime.timedelta(seconds=1)
+        )
+
+
+@override_settings(TASK_QUEUE_BATCH_SIZE=2, TASK_QUEUE_MAX_ATTEMPTS=2)
+class QueueTaskTestCase(JobTestCaseBase):
+    """
+    cubane.tasks.QueueTask
+    """
+    def test_run_should_process_all_jobs_in_batches(self):
+        for i in range(5):
+            Job.enqueue('echo', {'i': i})
+        Job.enqueue('other')
+
+        task = EchoQueueTask()
+        with mock.patch.object(Job, 'claim', wraps=Job.claim) as claim:
+            task.run()
+
+        self.assertEqual([{'i': i} for i in range(5)], task.payloads)
+        self.assertEqual(4, claim.call_count)
+        self.assertEqual(['other'], [job.task for job in Job.objects.all()])
+        self.assertEqual(5, TaskRunner.get_status().get('recordCounter'))
+
+
+    def test_run_should_retry_failed_job(self):
+        Job.enqueue('echo', {'fail': True})
+        with mock.patch('cubane.tasks.send_exception_email') as send_exception_email:
+            EchoQueueTask().run()
+
+        job = Job.objects.get()
+        self.assertEqual(Job.STATUS_PENDING, job.status)
+        self.assertIn('ValueError: failed', job.last_error)
+        self.assertFalse(send_exception_email.called)
+
+
+    def test_run_should_skip_job_reclaimed_by_another_worker(self):
+        Job.enqueue('echo', {'i': 1})
+        jobs = Job.claim('echo')
+        Job.objects.update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        Job.claim('echo')
+
+        task = EchoQueueTask()
+        task.report_start(1)
+        task.process_batch(jobs)
+
+        self.assertEqual([], task.payloads)
+        self.assertEqual(Job.STATUS_RUNNING, Job.objects.get().status)
+
+
+    def test_run_should_send_exception_email_for_dead_job(self):
+        Job.enqueue('echo', {'fail': True}, max_attempts=1)
+        with mock.patch('cubane.tasks.send_exception_email') as send_exception_email:
+            EchoQueueTask().run()
+
+        self.assertTrue(Job.objects.get().is_dead)
+        self.assertEqual(1, send_exception_email.call_count)
+
+
+class TaskRunnerEnqueueTestCase(JobTestCaseBase):
+    """
+    cubane.tasks.TaskRunner.enqueue()
+    cubane.tasks.TaskRunner.get_next_job_delay()
+    """
+    def test_enqueue_should_notify_task_runner(self):
+        job = TaskRunner.enqueue('foo', {'a': 1})
+        self.assertEqual({'a': 1}, job.payload)
+        self.assertTrue(TaskRunner.has_work())
+
+
+    def test_get_next_job_delay_should_return_none_without_jobs(self):
+        self.assertIsNone(TaskRunner.get_next_job_delay(['foo']))
+
+
+    def test_get_next_job_delay_should_return_delay_of_next_job(self):
+        Job.enqueue('foo', delay=60)
+        Job.enqueue('foo', delay=30)
+        self.assertAlmostEqual(30, TaskRunner.get_next_job_delay(['foo']), delta=2)
+
+
+    def test_get_next_job_delay_should_ignore_dead_jobs(self):
+        Job.enqueue('foo', delay=30)
+        Job.objects.update(status=Job.STATUS_DEAD)
+        self.assertIsNone(TaskRunner.get_next_job_delay(['foo']))
+
+
+    def test_get_next_job_delay_should_ignore_jobs_of_other_tasks(self):
+        Job.enqueue('orphaned')
+        Job.enqueue('foo', delay=30)
+        self.assertAlmostEqual(30, TaskRunner.get_next_job_delay(['foo']), delta=2)
+        self.assertIsNone(TaskRunner.get_next_job_delay([]))
+
+
+    def test_get_next_job_delay_should_return_delay_of_running_job(self):
+        Job.enqueue('foo')
+        Job.claim('foo', visibility_timeout=30)
+        self.assertAlmostEqual(30, TaskRunner.get_next_job_delay(['foo']), delta=2)
+
+
+    def test_get_next_job_delay_should_ignore_running_jobs_without_attempts_left(self):
+        Job.enqueue('foo', max_attempts=1)
+        Job.claim('foo', visibility_timeout=30)
+        self.assertIsNone(TaskRunner.get_next_job_delay(['foo']))
+
+
+    def test_get_queue_task_names_should_return_names_of_registered_queue_tasks(self):
+        runner = TaskRunner()
+        runner._tasks = []
+        runner.register(EchoQueueTask())
+        runner.register(Task())
+        self.assertEqual(['echo'], runner.get_queue_task_names())
@@ -0,0 +1,107 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.test.utils import override_settings
+from cubane.tasks import TaskRunner
+from cubane.tasks.mail import MailTask
+from cubane.tasks.models import Job
+from cubane.tasks.tests.jobs import JobTestCaseBase
+from cubane.lib.mail import cubane_send_message
+import os
+import mock
+import shutil
+import tempfile
+
+
+class MailTaskTestCaseBase(JobTestCaseBase):
+    def _create_message(self, subject):
+        msg = EmailMultiAlternatives(subject, 'Text', 'shop@innershed.com', ['a@innershed.com'])
+        msg.attach_alternative('<h1>%s</h1>' % subject, 'text/html')
+        return msg
+
+
+class CubaneSendMessageTestCase(MailTaskTestCaseBase):
+    """
+    cubane.lib.mail.cubane_send_message()
+    """
+    @override_settings(CUBANE_MAIL_ASYNC=False)
+    def test_should_send_message_right_away(self):
+        cubane_send_message(self._create_message('Test'))
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(0, Job.objects.count())
+
+
+    @override_settings(CUBANE_MAIL_ASYNC=True)
+    def test_should_send_message_right_away_without_task_runner(self):
+        with mock.patch.object(TaskRunner, 'is_available', return_value=False):
+            cubane_send_message(self._create_message('Test'))
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(0, Job.objects.count())
+
+
+    @override_settings(CUBANE_MAIL_ASYNC=True)
+    def test_should_enqueue_message(self):
+        with mock.patch.object(TaskRunner, 'is_available', return_value=True):
+            cubane_send_message(self._create_message('Test'))
+        self.assertEqual(0, len(mail.outbox))
+
+        job = Job.objects.get()
+        self.assertEqual('mail', job.task)
+        self.assertEqual('Test', job.payload.get('subject'))
+        self.assertTrue(TaskRunner.has_work())
+
+
+@override_settings(CUBANE_MAIL_ASYNC=True, TASK_QUEUE_BATCH_SIZE=50)
+class MailTaskTestCase(MailTaskTestCaseBase):
+    """
+    cubane.tasks.mail.MailTask
+    """
+    def setUp(self):
+        super(MailTaskTestCase, self).setUp()
+        with mock.patch.object(TaskRunner, 'is_available', return_value=True):
+            for i in range(3):
+                cubane_send_message(self._create_message('Message %d' % i))
+
+
+    def test_should_deliver_enqueued_messages(self):
+        MailTask().run()
+        self.assertEqual(
+            ['Message 0', 'Message 1', 'Message 2'],
+            [m.subject for m in mail.outbox]
+        )
+        self.assertEqual(['<h1>Message 0</h1>'], [c for c, _ in mail.outbox[0].alternatives])
+        self.assertEqual(0, Job.objects.count())
+
+
+    def test_should_deliver_batch_over_one_connection(self):
+        path = tempfile.mkdtemp()
+        try:
+            with override_settings(EMAIL_BACKEND='cubane.backends.EmailEmlFileBackend', EMAIL_FILE_PATH=path):
+                MailTask().run()
+
+            # the file backend writes all messages sent over the same
+            # connection into the same file
+            filenames = os.listdir(path)
+            self.assertEqual(1, len(filenames))
+            with open(os.path.join(path, filenames[0])) as f:
+                content = f.read()
+            for i in range(3):
+                self.assertIn('Subject: Message %d' % i, content)
+        finally:
+            shutil.rmtree(path)
+
+
+    def test_should_retry_messages_that_failed_to_send(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = IOError('Connection refused')
+        with mock.patch('cubane.tasks.mail.get_connection', return_value=connection):
+            MailTask().run()
+
+        self.assertEqual(1, connection.open.call_count)
+        self.assertEqual(1, connection.close.call_count)
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(
+            [(Job.STATUS_PENDING, 1)] * 3,
+            [(job.status, job.attempts) for job in Job.objects.all()]
+        )
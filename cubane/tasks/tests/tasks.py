@@ -0,0 +1,224 @@
+# coding=UTF-8
+from __future__ import unicode_literals
+from django.test.utils import override_settings
+from cubane.tests.base import CubaneTestCase
+from cubane.tasks import Task, TaskRunner
+import cubane.tasks
+import os
+import mock
+import shutil
+import tempfile
+
+
+class FakeTaskPool(object):
+    """
+    Runs all workers one after another within the current process rather than
+    distributing them over a pool of worker processes.
+    """
+    def __init__(self, processes, initializer=None, initargs=()):
+        self.processes = processes
+
+
+    def imap_unordered(self, func, iterable):
+        return [func(args) for args in iterable]
+
+
+    def close(self):
+        pass
+
+
+    def terminate(self):
+        pass
+
+
+    def join(self):
+        pass
+
+
+class RecordingTask(Task):
+    """
+    Task that records the index of each worker that executed it.
+    """
+    def __init__(self, concurrent=False):
+        self.concurrent = concurrent
+        self.workers = []
+
+
+    def run(self):
+        self.workers.append(self.worker)
+        self.report_start(1)
+        self.report_status(1)
+
+
+class RecordingTaskRunner(TaskRunner):
+    """
+    Task runner for the given list of tasks only.
+    """
+    def __init__(self, tasks):
+        self._tasks = tasks
+
+
+class TaskTestCaseBase(CubaneTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings_override = override_settings(PUBLIC_HTML_ROOT=self.root)
+        self.settings_override.enable()
+
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root)
+
+
+class TaskRunnerRunTestCase(TaskTestCaseBase):
+    """
+    cubane.tasks.TaskRunner.run()
+    """
+    def test_should_run_all_tasks_by_single_worker(self):
+        a = RecordingTask()
+        b = RecordingTask(concurrent=True)
+        self._run([a, b], workers=1)
+        self.assertEqual([0], a.workers)
+        self.assertEqual([0], b.workers)
+
+
+    def test_should_run_concurrent_tasks_by_all_workers(self):
+        a = RecordingTask()
+        b = RecordingTask(concurrent=True)
+        self._run([a, b], workers=3)
+        self.assertEqual([0], a.workers)
+        self.assertEqual([0, 1, 2], b.workers)
+
+
+    def test_should_not_start_workers_without_concurrent_tasks(self):
+        a = RecordingTask()
+        pool = mock.Mock()
+        with mock.patch('cubane.tasks.multiprocessing.Pool', pool):
+            RecordingTaskRunner([a]).run(workers=3)
+        self.assertFalse(pool.called)
+        self.assertEqual([0], a.workers)
+
+
+    @override_settings(TASK_RUNNER_WORKERS=2)
+    def test_should_use_workers_from_settings_by_default(self):
+        a = RecordingTask(concurrent=True)
+        self._run([a])
+        self.assertEqual([0, 1], a.workers)
+
+
+    @override_settings(TASK_RUNNER_WORKERS='foo')
+    def test_get_workers_should_default_to_one_worker_for_invalid_settings(self):
+        self.assertEqual(1, TaskRunner.get_workers())
+
+
+    @override_settings(TASK_RUNNER_WORKERS=0)
+    def test_get_workers_should_use_at_least_one_worker(self):
+        self.assertEqual(1, TaskRunner.get_workers())
+
+
+    def _run(self, tasks, workers=None):
+        runner = RecordingTaskRunner(tasks)
+        with mock.patch('cubane.tasks.multiprocessing.Pool', FakeTaskPool):
+            with mock.patch('cubane.tasks._WORKER_RUNNER', runner):
+                runner.run(workers)
+
+
+class TaskRunnerStatusTestCase(TaskTestCaseBase):
+    """
+    cubane.tasks.TaskRunner.get_status()
+    """
+    def test_should_return_empty_status_if_no_status_exists(self):
+        self.assertEqual({}, TaskRunner.get_status())
+
+
+    def test_should_report_status_of_single_worker(self):
+        task = Task()
+        task.report_start(4)
+        task.report_status(1, 'Foo')
+
+        status = TaskRunner.get_status()
+        self.assertEqual(4, status.get('totalRecords'))
+        self.assertEqual(1, status.get('recordCounter'))
+        self.assertEqual('Foo', status.get('message'))
+        self.assertEqual(25, status.get('percent'))
+        self.assertFalse(status.get('stopped'))
+        self.assertEqual(1, len(status.get('workers')))
+
+
+    def test_should_report_progress_of_each_worker(self):
+        a = self._create_task(0)
+        b = self._create_task(1)
+        a.report_start(10)
+        b.report_start(10)
+        a.report_status(2, 'A')
+        b.report_status(3, 'B')
+
+        status = TaskRunner.get_status()
+        self.assertEqual(
+            [(0, 2, 'A', 20), (1, 3, 'B', 30)],
+            [(w.get('worker'), w.get('recordCounter'), w.get('message'), w.get('percent')) for w in status.get('workers')]
+        )
+
+        # workers are sharing the same work items of the same task
+        self.assertEqual(10, status.get('totalRecords'))
+        self.assertEqual(5, status.get('recordCounter'))
+        self.assertEqual('A', status.get('message'))
+        self.assertEqual(50, status.get('percent'))
+
+
+    def test_should_report_stopped_once_all_workers_stopped(self):
+        a = self._create_task(0)
+        b = self._create_task(1)
+        a.report_start(10)
+        b.report_start(10)
+        b.report_status(3)
+
+        a.report_stop()
+        status = TaskRunner.get_status()
+        self.assertFalse(status.get('stopped'))
+        self.assertEqual(3, status.get('recordCounter'))
+
+        b.report_stop()
+        status = TaskRunner.get_status()
+        self.assertTrue(status.get('stopped'))
+        self.assertEqual(0, status.get('percent'))
+
+
+    def _create_task(self, worker):
+        task = Task()
+        task.worker = worker
+        return task
+
+
+class TaskRunnerWakeupTestCase(TaskTestCaseBase):
+    """
+    cubane.tasks.TaskRunner.open_wakeup()
+    cubane.tasks.TaskRunner.wait_for_wakeup()
+    """
+    def test_notify_should_wake_up_task_runner(self):
+        fd = TaskRunner.open_wakeup()
+        try:
+            TaskRunner.notify()
+            TaskRunner.notify()
+            self.assertTrue(TaskRunner.has_work())
+            self.assertTrue(TaskRunner.wait_for_wakeup(fd, 1))
+
+            # pending wakeup calls have been consumed
+            self.assertFalse(TaskRunner.wait_for_wakeup(fd, 0))
+        finally:
+            TaskRunner.close_wakeup(fd)
+        self.assertFalse(os.path.exists(TaskRunner.get_wakeup_filename()))
+
+
+    def test_wait_for_wakeup_should_time_out_without_notification(self):
+        fd = TaskRunner.open_wakeup()
+        try:
+            self.assertFalse(TaskRunner.wait_for_wakeup(fd, 0.01))
+        finally:
+            TaskRunner.close_wakeup(fd)
+
+
+    def test_notify_should_signal_work_if_task_runner_is_not_listening(self):
+        TaskRunner.notify()
+        self.assertTrue(TaskRunner.has_work())
+        self.assertFalse(os.path.exists(TaskRunner.get_wakeup_filename()))
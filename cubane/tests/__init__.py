@@ -24,4 +24,5 @@ from cubane.management.tests import *
 from cubane.media.tests import *
 from cubane.models.tests import *
 from cubane.svgicons.tests import *
+from cubane.tasks.tests import *
 from cubane.ishop.tests import *
\ No newline at end of file
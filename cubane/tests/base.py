@@ -29,6 +29,26 @@ class CubaneTestCase(TestCase):
         self.maxDiff = None
 
 
+    def _pre_setup(self):
+        super(CubaneTestCase, self)._pre_setup()
+        self._clear_process_caches()
+
+
+    def _post_teardown(self):
+        self._clear_process_caches()
+        super(CubaneTestCase, self)._post_teardown()
+
+
+    def _clear_process_caches(self):
+        """
+        Clear data that is cached by the current process, since database
+        changes are rolled back after each test without invalidating such data.
+        """
+        if 'cubane.cms' in settings.INSTALLED_APPS:
+            from cubane.cms.nav import clear_navigation_cache
+            clear_navigation_cache()
+
+
     @classmethod
     def complex(reason='Full Test Suite Required'):
         """
@@ -39,6 +59,26 @@ class CubaneTestCase(TestCase):
         return unittest.skipIf(not settings.TEST_FULL, reason)
 
 
+    @classmethod
+    def benchmark(cls, reason='Benchmark Required'):
+        """
+        Decorator for marking a test case or test method as a benchmark, which
+        only runs if benchmarks are enabled via DEV_TEST_BENCHMARK=1.
+        """
+        return unittest.skipIf(not settings.TEST_BENCHMARK, reason)
+
+
+    def report_benchmark(self, title, results):
+        """
+        Print the given list of benchmark results, where each result is a
+        tuple of a label and a value.
+        """
+        print
+        print title
+        for label, value in results:
+            print '  %-50s %s' % (label, value)
+
+
     def assertEqual(self, a, b, msg=None):
         """
         unittest.TestCase.assertEqual does not show diff when comparing
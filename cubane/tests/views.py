@@ -3,12 +3,14 @@ from __future__ import unicode_literals
 from django.http import HttpResponse, QueryDict
 from django import forms
 from django.db import models
+from django.db import connection
 from django.template import engines
 from django.contrib.sessions.backends.cache import SessionStore
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User
 from django.db.models.fields import FieldDoesNotExist
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from cubane.tests.base import CubaneTestCase
 from cubane.decorators import identity
 from cubane.views import *
@@ -3080,6 +3082,73 @@ class LibModelViewSeqTestCase(CubaneTestCase):
             self.p1.save()
             self.p2.save()
 
+
+    def test_should_only_update_items_with_changed_seq(self):
+        view = PageContentView(Page)
+        pages = [Page.objects.create(title='Page %d' % i, seq=i + 3) for i in range(3)]
+        try:
+            updated_on = dict(Page.objects.values_list('pk', 'updated_on'))
+
+            # swap the last two pages, all other pages keep their seq.
+            request, c = self._seq(view, {'item[]': [self.p1.pk, self.p2.pk, pages[0].pk, pages[2].pk, pages[1].pk]})
+            self.assertEqual({'success': True, 'updated': True}, decode_json(c.content))
+            self.assertEqual(
+                ['Foo', 'Bar', 'Page 0', 'Page 2', 'Page 1'],
+                [p.title for p in Page.objects.all().order_by('seq')]
+            )
+            self.assertEqual(
+                [pages[1].pk, pages[2].pk],
+                sorted([p.pk for p in Page.objects.all() if p.updated_on != updated_on[p.pk]])
+            )
+        finally:
+            for page in pages:
+                page.delete()
+
+
+    def test_should_update_seq_with_constant_number_of_queries(self):
+        view = PageContentView(Page)
+
+        def count_queries(n):
+            pages = [Page.objects.create(title='Page %d' % i, seq=i + 3) for i in range(n)]
+            try:
+                ids = [self.p1.pk, self.p2.pk] + [p.pk for p in reversed(pages)]
+                with CaptureQueriesContext(connection) as ctx:
+                    request, c = self._seq(view, {'item[]': ids})
+                self.assertEqual({'success': True, 'updated': True}, decode_json(c.content))
+                self.assertEqual(
+                    ids,
+                    list(Page.objects.order_by('seq').values_list('pk', flat=True))
+                )
+                return len(ctx.captured_queries)
+            finally:
+                for page in pages:
+                    page.delete()
+
+        self.assertEqual(count_queries(2), count_queries(40))
+
+
+    def test_should_update_seq_from_given_order_with_constant_number_of_queries(self):
+        view = PageContentView(Page)
+
+        def count_queries(n):
+            pages = [Page.objects.create(title='Page %03d' % i, seq=n - i + 3) for i in range(n)]
+            try:
+                ids = list(Page.objects.order_by('title').values_list('pk', flat=True))
+                with CaptureQueriesContext(connection) as ctx:
+                    request, c = self._seq(view, {'item[]': ids[:PAGINATION_MAX_RECORDS], 'o': 'title'})
+                self.assertEqual({'success': True, 'updated': True}, decode_json(c.content))
+                self.assertEqual(
+                    ['Bar', 'Foo'] + [p.title for p in pages],
+                    [p.title for p in Page.objects.all().order_by('seq')]
+                )
+                return len(ctx.captured_queries)
+            finally:
+                for page in pages:
+                    page.delete()
+
+        self.assertEqual(count_queries(2), count_queries(80))
+
+
     def _seq(self, view, data={}):
         return self.run_view_handler_request(view, self.user, 'seq', 'post', '/', data, ajax=True)
 
@@ -4510,6 +4579,16 @@ class LibModelViewMoveToTreeNodeTestCase(CubaneTestCase):
             d.delete()
 
 
+    def test_should_notify_content_changed(self):
+        m1 = Media.objects.create(caption='Foo')
+        try:
+            with patch('cubane.views.notify_content_changed') as notify_content_changed:
+                self._move_to_tree_node(self.view, {'src[]': [m1.pk], 'dst': self.folder.pk})
+            notify_content_changed.assert_called_once_with(self.view.model, self.view.model)
+        finally:
+            m1.delete()
+
+
     def test_should_ignore_invalid_pks(self):
         c, ids = self._move_to_tree_node(self.view, {'src[]': [-1], 'dst': self.folder.pk})
         self.assertEqual('text/javascript', c['Content-Type'])
@@ -56,6 +56,16 @@ def setup_default_urls(module_name):
 
     # serve media assets through django dev server (DEBUG only)
     if settings.DEBUG: # pragma: no cover
+        # image versions that are generated on demand
+        if settings.IMAGE_ON_DEMAND and 'cubane.media' in settings.INSTALLED_APPS:
+            from cubane.media import views as media_views
+            urls.urlpatterns += [
+                url(
+                    r'^%sshapes/(?P<shape>[-_\w]+)/(?P<size>[-_\w]+)/(?P<bucket>\d+)/(?P<unique_id>\w+)/(?P<filename>.*?)$' % settings.MEDIA_URL,
+                    media_views.media_api_on_demand
+                )
+            ]
+
         # uploaded media files
         urls.urlpatterns += [
             url(
@@ -80,6 +90,15 @@ def setup_default_urls(module_name):
             )
         ]
 
+        # shapes generated on demand (web server fallback for missing files)
+        urls.urlpatterns += [
+            url(
+                r'^%son-demand/shapes/(?P<shape>[-_\w]+)/(?P<size>[-_\w]+)/(?P<bucket>\d+)/(?P<unique_id>\w+)/(?P<filename>.*?)$' % settings.MEDIA_API_URL,
+                media_views.media_api_on_demand,
+                name='cubane.media_api.on_demand'
+            )
+        ]
+
         # originals
         urls.urlpatterns += [
             url(
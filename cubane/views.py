@@ -21,10 +21,11 @@ from django.db import models
 from django.db import router
 from django.db import transaction
 from django.db import IntegrityError
+from django.db import connection
 from django.db.models import Q, Max
 from django.db.models import CharField, TextField, EmailField, BooleanField, DateField, DecimalField
 from django.db.models import ManyToManyField, IntegerField, AutoField
-from django.db.models import Case, When
+from django.db.models import Case, When, Value
 from django.db.models.functions import Lower
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models.fields.related import ForeignKey
@@ -58,7 +59,9 @@ from cubane.lib.url import make_absolute_url
 from cubane.lib.text import get_words, pluralize
 from cubane.lib.acl import Acl
 from cubane.lib.template import get_template
+from cubane.cms.batch import content_change_batch, notify_content_changed
 from cubane.signals import before_cms_save, after_cms_save
+from collections import OrderedDict
 import re
 import os
 import copy
@@ -2872,6 +2875,7 @@ class ModelView(TemplateView):
 
     @view(require_POST)
     @view(permission_required('edit'))
+    @view(content_change_batch())
     def seq(self, request):
         """
         Update element sequence (sortable).
@@ -2936,48 +2940,65 @@ class ModelView(TemplateView):
             self._set_session_index_args(request, session_prefix, 'o', 'seq')
             start_index = page_index
 
-        # get all items (seq and last-mod timestamp)
+        # get current seq. of all items in one query. For multiple folders,
+        # the seq. is stored on the folder assignment instead.
         if self.has_multiple_folders():
             attr = self._get_folder_assignment_name()
             field = self.model._meta.get_field(attr)
             through_model = field.rel.through
+            source_field_name = field.m2m_field_name()
             target_field_name = field.m2m_reverse_field_name()
             items = {}
-            for obj in objects:
-                folders = getattr(obj, attr, None)
-                if folders:
-                    for assignment in folders.all():
-                        folder = getattr(assignment, target_field_name, None)
-                        if folder.pk in folder_pks:
-                            items[obj.pk] = assignment
+
+            # the seq. is only defined in the context of a folder, therefore
+            # we cannot change anything unless a folder is selected
+            if folder_pks:
+                assignments = through_model.objects.filter(**{
+                    '%s__in' % source_field_name: objects.order_by().values('pk'),
+                    '%s__in' % target_field_name: folder_pks
+                })
+                id_set = set(ids)
+                for pk, _id, seq in assignments.values_list('pk', source_field_name, 'seq'):
+                    if _id in id_set:
+                        items[_id] = (pk, seq)
         else:
-            items = objects.select_related().only('seq', 'updated_on').in_bulk(ids)
+            if order_by != 'seq':
+                # all objects are affected anyway
+                rows = objects.values_list('id', 'seq')
+            else:
+                rows = objects.filter(pk__in=ids).values_list('id', 'seq')
+            items = dict((_id, (_id, seq)) for _id, seq in rows)
 
-        # apply new seq.
-        updated_on = datetime.datetime.now()
-        updated = False
+        # determine minimal set of items for which the seq. actually changed
+        seqs = OrderedDict()
+        changed_ids = []
         for i, _id in enumerate(ids, start=start_index + 1):
-            # only update if seq changed...
             item = items.get(_id)
-            if item and item.seq != i:
-                updated = True
-                if self.has_multiple_folders():
-                    item.seq = i
-                    item.save()
-                    self._get_objects_for_seq(request).filter(pk=_id).update(
-                        updated_on=updated_on
-                    )
-                else:
-                    self._get_objects_for_seq(request).filter(pk=_id).update(
-                        seq=i,
-                        updated_on=updated_on
-                    )
+            if item and item[1] != i:
+                seqs[item[0]] = i
+                changed_ids.append(_id)
+
+        # apply new seq. to all changed items at once
+        updated_on = datetime.datetime.now()
+        updated = len(seqs) > 0
+        if updated:
+            if self.has_multiple_folders():
+                self._update_seq(through_model.objects.all(), seqs)
+                self._update_in_batches(
+                    self._get_objects_for_seq(request),
+                    changed_ids,
+                    updated_on=updated_on
+                )
+            else:
+                self._update_seq(
+                    self._get_objects_for_seq(request),
+                    seqs,
+                    updated_on=updated_on
+                )
 
         # clear cache if we had to update at least one item
         if updated and 'cubane.cms' in settings.INSTALLED_APPS:
-            from cubane.cms.views import get_cms
-            cms = get_cms()
-            cms.invalidate(verbose=False)
+            notify_content_changed(self.model, self.model)
 
         # json response
         return to_json_response({
@@ -2986,6 +3007,37 @@ class ModelView(TemplateView):
         })
 
 
+    def _update_seq(self, queryset, seqs, **kwargs):
+        """
+        Update the seq. of all objects within the given queryset according
+        to the given mapping of primary keys to seq. by executing one
+        UPDATE statement per batch of objects. Additional field values
+        (e.g. updated_on) are applied to all updated objects.
+        """
+        pks = list(seqs.keys())
+        fieldnames = ['pk', 'pk', 'seq'] + list(kwargs.keys())
+        batch_size = max(1, connection.ops.bulk_batch_size(fieldnames, pks))
+        for i in range(0, len(pks), batch_size):
+            batch = pks[i:i + batch_size]
+            queryset.filter(pk__in=batch).update(
+                seq=Case(
+                    *[When(pk=pk, then=Value(seqs[pk])) for pk in batch],
+                    output_field=IntegerField()
+                ),
+                **kwargs
+            )
+
+
+    def _update_in_batches(self, queryset, pks, **kwargs):
+        """
+        Update the given field values for all objects within the given
+        queryset with the given primary keys in batches.
+        """
+        batch_size = max(1, connection.ops.bulk_batch_size(['pk'] + list(kwargs.keys()), pks))
+        for i in range(0, len(pks), batch_size):
+            queryset.filter(pk__in=pks[i:i + batch_size]).update(**kwargs)
+
+
     def form_initial(self, request, initial, instance, edit):
         """
         Called before a form is created with initial data.
@@ -3782,6 +3834,7 @@ class ModelView(TemplateView):
 
     @view(require_POST)
     @view(permission_required('edit'))
+    @view(content_change_batch())
     def save_changes(self, request):
         """
         Save all changes made in edit mode at once and return some information
@@ -3880,6 +3933,7 @@ class ModelView(TemplateView):
 
 
     @view(permission_required('merge'))
+    @view(content_change_batch())
     def merge(self, request):
         """
         Merge multiple instances together into one instance.
@@ -4423,9 +4477,7 @@ class ModelView(TemplateView):
 
         # clear cache if we had to update at least one item
         if updated and 'cubane.cms' in settings.INSTALLED_APPS:
-            from cubane.cms.views import get_cms
-            cms = get_cms()
-            cms.invalidate(verbose=False)
+            notify_content_changed(self.model, self.model)
 
         return to_json_response({
             'success': True